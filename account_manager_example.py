@@ -5,20 +5,66 @@
 """
 
 import asyncio
+import heapq
 import json
 import logging
-from typing import Dict, List, Optional
+import random
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass, asdict
 
+from instrumentation import Instrumentation
+from metric_aggregator import WriteBehindMetrics
+from mock_pipeline import MockPipeline
+from pool_statistics import PoolStatistics
+from score_index import BucketedScoreIndex
+from selection_strategies import BestScore, Candidate, SelectionStrategy
+from shared_lease_table import SharedLeaseTable
+
 # 模拟Redis（实际使用时替换为真实的Redis客户端）
 class MockRedis:
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
         self.data = {}
         self.sets = {}
+        
+        # 过期时间：访问时惰性检查，另按截止时间堆定期主动清理（与Redis一致）
+        self.clock = clock
+        self.expires: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._last_active_expire = clock()
+        self.active_expire_interval = 0.1
+    
+    def _check_expiry(self, key: str):
+        deadline = self.expires.get(key)
+        now = self.clock()
+        if deadline is not None and deadline <= now:
+            self._remove(key)
+        
+        if now - self._last_active_expire >= self.active_expire_interval:
+            self.evict_expired()
+    
+    def _remove(self, key: str):
+        self.data.pop(key, None)
+        self.sets.pop(key, None)
+        self.expires.pop(key, None)
+    
+    def evict_expired(self, max_keys: int = 1000) -> int:
+        """主动清理已过期的键，每次最多max_keys个，返回清理数量"""
+        now = self._last_active_expire = self.clock()
+        evicted = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now and evicted < max_keys:
+            deadline, key = heapq.heappop(self._expiry_heap)
+            # 堆中可能残留已被覆盖或取消的过期时间
+            if self.expires.get(key) == deadline:
+                self._remove(key)
+                evicted += 1
+        return evicted
     
     async def hset(self, key: str, field: str = None, value: str = None, mapping: Dict = None, **kwargs):
+        self._check_expiry(key)
         if key not in self.data:
             self.data[key] = {}
         if mapping:
@@ -28,30 +74,100 @@ class MockRedis:
         self.data[key].update(kwargs)
     
     async def hget(self, key: str, field: str):
+        self._check_expiry(key)
         return self.data.get(key, {}).get(field)
     
     async def hgetall(self, key: str):
-        return self.data.get(key, {})
+        self._check_expiry(key)
+        return dict(self.data.get(key, {}))
     
     async def hincrby(self, key: str, field: str, amount: int = 1):
+        self._check_expiry(key)
         if key not in self.data:
             self.data[key] = {}
         current = int(self.data[key].get(field, 0))
         self.data[key][field] = str(current + amount)
+        return current + amount
+    
+    async def hdel(self, key: str, *fields) -> int:
+        self._check_expiry(key)
+        removed = 0
+        for field in fields:
+            removed += self.data.get(key, {}).pop(field, None) is not None
+        return removed
     
     async def sadd(self, key: str, *values):
+        self._check_expiry(key)
         if key not in self.sets:
             self.sets[key] = set()
         for value in values:
             self.sets[key].add(value)
     
     async def smembers(self, key: str):
+        self._check_expiry(key)
         return [v.encode() if isinstance(v, str) else v for v in self.sets.get(key, set())]
     
     async def srem(self, key: str, *values):
+        self._check_expiry(key)
         if key in self.sets:
             for value in values:
                 self.sets[key].discard(value)
+    
+    async def smove(self, src: str, dst: str, member: str) -> bool:
+        """与Redis SMOVE一致：成员从src原子移动到dst，不在src中时返回False"""
+        self._check_expiry(src)
+        self._check_expiry(dst)
+        if member not in self.sets.get(src, ()):
+            return False
+        self.sets[src].discard(member)
+        self.sets.setdefault(dst, set()).add(member)
+        return True
+    
+    def pipeline(self, transaction: bool = True) -> MockPipeline:
+        return MockPipeline(self, transaction)
+    
+    def multi(self) -> MockPipeline:
+        return self.pipeline(transaction=True).multi()
+    
+    async def get(self, key: str):
+        self._check_expiry(key)
+        value = self.data.get(key)
+        return value if isinstance(value, str) else None
+    
+    async def set(self, key: str, value: str, ex: Optional[int] = None):
+        self._check_expiry(key)
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex:
+            await self.expire(key, ex)
+    
+    async def incr(self, key: str):
+        self._check_expiry(key)
+        current = int(self.data.get(key, 0))
+        self.data[key] = str(current + 1)
+        return current + 1
+    
+    async def expire(self, key: str, seconds: int) -> bool:
+        self._check_expiry(key)
+        if key not in self.data and key not in self.sets:
+            return False
+        
+        deadline = self.clock() + seconds
+        self.expires[key] = deadline
+        heapq.heappush(self._expiry_heap, (deadline, key))
+        return True
+    
+    async def ttl(self, key: str) -> int:
+        """与Redis一致：键不存在返回-2，未设置过期返回-1"""
+        self._check_expiry(key)
+        if key not in self.data and key not in self.sets:
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, int(round(self.expires[key] - self.clock())))
+    
+    async def delete(self, key: str):
+        self._remove(key)
 
 class AccountStatus(Enum):
     ACTIVE = "active"
@@ -64,6 +180,21 @@ class AccountPriority(Enum):
     NORMAL = "normal"
     LOW = "low"
 
+# 用量按时间分桶计数，桶键自动过期，跨天/跨窗口无需清零扫描
+USAGE_DAY_SECONDS = 86400
+USAGE_WINDOW_SECONDS = 900
+
+# X各GraphQL操作15分钟窗口的默认配额，实际值以响应头x-rate-limit-*为准
+RATE_LIMIT_DEFAULTS = {
+    'SearchTimeline': 50,
+    'UserTweets': 50,
+    'TweetDetail': 150,
+    'Followers': 50,
+    'Following': 50,
+    'UserByScreenName': 95,
+}
+DEFAULT_OPERATION_LIMIT = 50
+
 @dataclass
 class AccountMetrics:
     total_requests: int = 0
@@ -94,19 +225,181 @@ class AccountConfig:
     email: str
     status: AccountStatus
     priority: AccountPriority
+    region: str = 'global'  # 绑定代理时优先的地区，global表示不限
     daily_limit: int = 1000
     max_consecutive_errors: int = 5
 
+class AccountPriorityIndex(BucketedScoreIndex):
+    """账号优先级索引 - 按优先级分桶
+    
+    不指定优先级时按HIGH → NORMAL → LOW逐级查找，只有高优先级桶为空才会访问下一级。
+    """
+    
+    CASCADE = (AccountPriority.HIGH, AccountPriority.NORMAL, AccountPriority.LOW)
+    
+    def __init__(self):
+        super().__init__(self.CASCADE)
+    
+    def sample(self, k: int, priority: Optional[AccountPriority] = None,
+               rng: random.Random = random) -> List[Tuple[str, float]]:
+        """从指定优先级（或按级联顺序第一个非空桶）均匀随机抽取最多k个账号，O(k)"""
+        for p in ([priority] if priority else self.CASCADE):
+            if self.bucket_size(p):
+                return super().sample(k, p, rng)
+        return []
+    
+    def peek(self, priority: Optional[AccountPriority] = None) -> Optional[Tuple[str, float]]:
+        """返回指定优先级（或按级联顺序第一个非空桶）中评分最高的账号 (account_id, score)"""
+        for p in ([priority] if priority else self.CASCADE):
+            top = super().peek(p)
+            if top:
+                return top
+        return None
+
+class RateLimitWindows:
+    """按账号和操作跟踪限流窗口
+    
+    每个(账号, 操作)是一个令牌桶：窗口内每次请求消耗一个令牌，窗口重置时补满。
+    响应头给出的limit/remaining/reset覆盖本地估计。
+    配额用尽的账号按窗口重置时间停放在该操作的最小堆中，到期后由release_due取出，
+    选择时不必逐个跳过。
+    """
+    
+    def __init__(self, limits: Dict[str, int] = RATE_LIMIT_DEFAULTS, window: float = USAGE_WINDOW_SECONDS):
+        self.limits = limits
+        self.window = window
+        self._buckets: Dict[Tuple[str, str], List] = {}
+        self._operations: Dict[str, Set[str]] = defaultdict(set)
+        self._parked: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._reset_heaps: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+    
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._buckets
+    
+    def limit_for(self, operation: str) -> int:
+        return self.limits.get(operation, DEFAULT_OPERATION_LIMIT)
+    
+    def remaining(self, account_id: str, operation: str, now: float) -> int:
+        bucket = self._buckets.get((account_id, operation))
+        if bucket is None or now >= bucket[2]:
+            return self.limit_for(operation)
+        return bucket[1]
+    
+    def reset_at(self, account_id: str, operation: str) -> Optional[float]:
+        bucket = self._buckets.get((account_id, operation))
+        return bucket[2] if bucket else None
+    
+    def consume(self, account_id: str, operation: str, now: float) -> Optional[List]:
+        """消耗一个令牌，返回 [limit, remaining, reset_at]；无剩余配额时返回None"""
+        bucket = self._buckets.get((account_id, operation))
+        if bucket is None or now >= bucket[2]:
+            # 新窗口从第一次请求开始计时
+            limit = self.limit_for(operation)
+            bucket = self._buckets[(account_id, operation)] = [limit, limit, now + self.window]
+            self._operations[account_id].add(operation)
+        if bucket[1] <= 0:
+            return None
+        bucket[1] -= 1
+        return bucket
+    
+    def update(self, account_id: str, operation: str, limit: int, remaining: int, reset_at: float):
+        self._buckets[(account_id, operation)] = [limit, remaining, reset_at]
+        self._operations[account_id].add(operation)
+    
+    def park(self, account_id: str, operation: str):
+        """按当前窗口的重置时间停放账号；重复停放时以最新的重置时间为准"""
+        reset_at = self.reset_at(account_id, operation)
+        self._parked[operation][account_id] = reset_at
+        heapq.heappush(self._reset_heaps[operation], (reset_at, account_id))
+    
+    def unpark(self, account_id: str, operation: str) -> bool:
+        return self._parked[operation].pop(account_id, None) is not None
+    
+    def is_parked(self, account_id: str, operation: str) -> bool:
+        return account_id in self._parked[operation]
+    
+    def release_due(self, operation: str, now: float) -> List[str]:
+        """取出窗口已重置的停放账号"""
+        heap, parked = self._reset_heaps[operation], self._parked[operation]
+        released = []
+        while heap and heap[0][0] <= now:
+            reset_at, account_id = heapq.heappop(heap)
+            # 重新停放或已取消停放的旧条目跳过
+            if parked.get(account_id) == reset_at:
+                del parked[account_id]
+                released.append(account_id)
+        return released
+    
+    def earliest_reset(self, operation: str) -> Optional[float]:
+        heap, parked = self._reset_heaps[operation], self._parked[operation]
+        while heap and parked.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+    
+    def discard(self, account_id: str):
+        for operation in self._operations.pop(account_id, ()):
+            del self._buckets[(account_id, operation)]
+            self._parked[operation].pop(account_id, None)
+
 class SimpleAccountManager:
     """简化版账号管理器 - 用于演示核心功能"""
     
-    def __init__(self, redis_client=None):
+    def __init__(self, redis_client=None, selection: Optional[SelectionStrategy] = None,
+                 flush_interval: Optional[float] = None, flush_events: int = 1000,
+                 lease_table: Optional[SharedLeaseTable] = None, max_in_flight: int = 1,
+                 instrumentation: Optional[Instrumentation] = None):
         self.redis = redis_client or MockRedis()
         self.logger = logging.getLogger(__name__)
+        
+        # 可选延迟直方图：每个存储命令和公开方法各自计时，以Prometheus格式导出
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            self.redis = instrumentation.instrument_storage(self.redis)
+        
         self.health_threshold = 0.7
         
+        # 多进程共享租用表：同机各进程协调账号在途使用，每个账号最多max_in_flight个在途请求。
+        # 账号由get_available_account占用，update_account_success/mark_account_error/release_account归还
+        self.lease_table = lease_table
+        self.max_in_flight = max_in_flight
+        
+        # 候选选择策略，默认取评分最高者
+        self.selection = selection or BestScore()
+        
+        # 用量分桶使用的时钟（UTC秒）
+        self.clock = time.time
+        self._usage_day = int(self.clock() // USAGE_DAY_SECONDS)
+        
+        # 统计聚合值，首次查询时全量对账构建，之后增量维护
+        self._pool_stats = PoolStatistics(AccountStatus.ACTIVE.value)
+        self._pool_stats_ready = False
+        
+        # 优先级索引，首次选择时全量构建，之后在添加、使用、出错和暂停时增量维护
+        self._priority_index = AccountPriorityIndex()
+        self._priority_index_ready = False
+        
+        # 按操作选择时使用的索引：优先级索引中未因该操作配额用尽而停放的账号，首次按该操作选择时构建
+        self._operation_indexes: Dict[str, AccountPriorityIndex] = {}
+        
+        # 各操作的限流窗口，本进程消耗实时记录，响应头到达时校准
+        self._rate_limits = RateLimitWindows()
+        
+        # 账号被暂停时依次调用 listener(account_id, reason)，如恢复调度器
+        self.suspension_listeners: List[Callable[[str, str], Awaitable[None]]] = []
+        
+        # 设置flush_interval时成功/错误指标写后聚合，每次刷新后批量更新索引和统计；
+        # 连续错误在本地计算，达到阈值立即暂停。默认每次立即写入
+        self.metric_writer = (
+            WriteBehindMetrics(self.redis, 'account:{}:metrics', flush_interval, flush_events,
+                               on_flush=self._refresh_flushed)
+            if flush_interval is not None else None
+        )
+        
+        if instrumentation is not None:
+            instrumentation.instrument_manager(self, 'account')
+        
     async def add_account(self, username: str, email: str, 
-                         priority: AccountPriority = AccountPriority.NORMAL) -> str:
+                         priority: AccountPriority = AccountPriority.NORMAL, region: str = 'global') -> str:
         """添加账号"""
         account_id = f"acc_{username}"
         
@@ -115,123 +408,499 @@ class SimpleAccountManager:
             username=username,
             email=email,
             status=AccountStatus.ACTIVE,
-            priority=priority
+            priority=priority,
+            region=region
         )
         
         await self._save_account_config(config)
         await self._initialize_account_metrics(account_id)
         
+        self._refresh_account(account_id, config, AccountMetrics())
+        
         self.logger.info(f"Account {username} added with ID {account_id}")
         return account_id
     
-    async def get_available_account(self, priority: Optional[AccountPriority] = None) -> Optional[Dict]:
-        """获取可用账号"""
+    async def get_available_account(self, priority: Optional[AccountPriority] = None,
+                                    operation: Optional[str] = None) -> Optional[Dict]:
+        """获取可用账号
+        
+        指定优先级时只查找该优先级的桶；未指定时按HIGH → NORMAL → LOW逐级查找。
+        同一优先级内取评分最高的selection.window个候选（或按selection.samples均匀抽样），
+        由选择策略决定使用哪个。
+        指定operation（如'SearchTimeline'）时只在该操作仍有配额的账号中选择并消耗一个令牌；
+        全部无配额时返回None，rate_limit_reset_at(operation)给出最早的窗口重置时间。
+        设置lease_table时跳过在途已满的账号，选中的账号在共享表中占用一个在途名额。
+        """
+        skipped = []
+        candidates = []
+        chosen = None
+        bucket = priority
         try:
-            # 获取活跃账号
-            active_accounts = await self.redis.smembers('accounts:active')
+            self._check_usage_rollover()
+            await self._ensure_priority_index()
+            now = self.clock()
+            index = self._selection_index(operation, now)
             
-            candidates = []
-            for account_id in active_accounts:
-                account_id = account_id.decode() if isinstance(account_id, bytes) else account_id
-                
-                config = await self._get_account_config(account_id)
-                metrics = await self._get_account_metrics(account_id)
-                
-                if not config or not metrics:
-                    continue
-                
-                # 优先级过滤
-                if priority and config.priority != priority:
-                    continue
-                
-                # 检查使用限制
-                if metrics.daily_usage >= config.daily_limit:
-                    continue
-                
-                candidates.append({
-                    'account_id': account_id,
-                    'config': config,
-                    'metrics': metrics,
-                    'score': self._calculate_score(config, metrics)
-                })
+            if self.selection.samples:
+                candidates = await self._sample_candidates(index, priority, operation, now)
+            
+            # 抽样关闭或抽到的候选都不可用时按评分查找
+            if not candidates:
+                while len(candidates) < self.selection.window:
+                    # 从优先级索引取出最佳候选
+                    top = index.pop(bucket)
+                    if top is None:
+                        break
+                    
+                    account_id, indexed_score = top
+                    config, metrics = await self._load_account(account_id, operation)
+                    
+                    # 校验候选（索引可能落后于其他进程的写入）
+                    if not self._is_selectable(config, metrics):
+                        self._unindex_account(account_id)
+                        continue
+                    
+                    # 窗口在其他进程中用尽（从Redis读入），停放到窗口重置
+                    if operation and self._rate_limits.remaining(account_id, operation, now) <= 0:
+                        self._park_account(account_id, operation)
+                        continue
+                    
+                    # 其他进程（或本进程）的在途请求已占满
+                    if self._account_load(account_id) >= self.max_in_flight:
+                        skipped.append((account_id, config, metrics))
+                        continue
+                    
+                    score = self._calculate_score(config, metrics)
+                    if score < indexed_score:
+                        runner_up = index.peek(config.priority)
+                        if runner_up and runner_up[1] > score:
+                            self._index_account(account_id, config, metrics)
+                            continue
+                    
+                    # 候选限定在第一个候选所在的优先级，保持逐级查找的语义
+                    candidates.append((account_id, config, metrics, score))
+                    bucket = config.priority
             
             if not candidates:
+                if operation and self._rate_limits.earliest_reset(operation) is not None:
+                    self.logger.warning(f"All accounts rate limited for {operation}, "
+                                        f"earliest reset at {self._rate_limits.earliest_reset(operation):.0f}")
                 return None
             
-            # 选择最佳账号
-            best = max(candidates, key=lambda x: x['score'])
+            while candidates:
+                chosen = candidates[self.selection.choose([
+                    Candidate(candidate[0], candidate[3], self._account_load(candidate[0]))
+                    for candidate in candidates
+                ])]
+                if self._claim_account(chosen[0], now):
+                    break
+                # 读取负载之后被其他进程抢先占满，换下一个候选
+                candidates.remove(chosen)
+                skipped.append(chosen[:3])
+                chosen = None
+            if chosen is None:
+                return None
+            account_id, config, metrics, _ = chosen
             
-            # 记录使用
-            await self._record_usage(best['account_id'])
+            # 记录使用（同时将账号以新评分放回索引）
+            await self._record_usage(account_id, operation)
             
-            return {
-                'account_id': best['account_id'],
-                'username': best['config'].username,
-                'health_score': best['metrics'].health_score,
-                'daily_usage': best['metrics'].daily_usage
+            result = {
+                'account_id': account_id,
+                'username': config.username,
+                'region': config.region,
+                'priority': config.priority.value,
+                'health_score': metrics.health_score,
+                'daily_usage': metrics.daily_usage
             }
+            if operation:
+                result['remaining'] = self._rate_limits.remaining(account_id, operation, now)
+            return result
             
         except Exception as e:
             self.logger.error(f"Failed to get available account: {e}")
             return None
+        finally:
+            # 跳过和未被选中的账号放回索引
+            for item in skipped:
+                self._index_account(*item)
+            for candidate in candidates:
+                if candidate is not chosen:
+                    self._index_account(*candidate[:3])
+    
+    async def record_rate_limit(self, account_id: str, operation: str, headers) -> Optional[Dict]:
+        """用响应头x-rate-limit-limit/remaining/reset（Unix秒）校准限流窗口
+        
+        headers可以是任意映射（aiohttp/httpx的响应头或普通dict），缺少字段时不做处理。
+        """
+        fields = {key.lower(): value for key, value in headers.items()}
+        try:
+            limit = int(fields['x-rate-limit-limit'])
+            remaining = int(fields['x-rate-limit-remaining'])
+            reset_at = float(fields['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            return None
+        
+        self._rate_limits.update(account_id, operation, limit, remaining, reset_at)
+        if remaining <= 0:
+            self._park_account(account_id, operation)
+        elif self._rate_limits.unpark(account_id, operation):
+            self._restore_operation_index(account_id, operation)
+        await self._save_rate_limit(account_id, operation, [limit, remaining, reset_at])
+        return {'limit': limit, 'remaining': remaining, 'reset_at': reset_at}
+    
+    async def mark_rate_limited(self, account_id: str, operation: str, reset_at: Optional[float] = None):
+        """收到429但没有限流响应头时，将该操作配额置零直到窗口重置"""
+        now = self.clock()
+        limit = self._rate_limits.limit_for(operation)
+        reset_at = reset_at or self._rate_limits.reset_at(account_id, operation) or now + USAGE_WINDOW_SECONDS
+        if reset_at <= now:
+            reset_at = now + USAGE_WINDOW_SECONDS
+        
+        self._rate_limits.update(account_id, operation, limit, 0, reset_at)
+        self._park_account(account_id, operation)
+        await self._save_rate_limit(account_id, operation, [limit, 0, reset_at])
+    
+    def rate_limit_reset_at(self, operation: str) -> Optional[float]:
+        """该操作最早的窗口重置时间（Unix秒）；没有账号因该操作配额用尽而停放时返回None
+        
+        get_available_account(operation=...)返回None后据此决定等待多久。
+        """
+        return self._rate_limits.earliest_reset(operation)
+    
+    def rate_limit_status(self, account_id: str, operation: str) -> Dict:
+        now = self.clock()
+        return {
+            'limit': self._rate_limits.limit_for(operation),
+            'remaining': self._rate_limits.remaining(account_id, operation, now),
+            'reset_at': self._rate_limits.reset_at(account_id, operation)
+        }
+    
+    async def rebuild_priority_index(self) -> int:
+        """全量扫描活跃账号重建优先级索引，返回索引中的账号数"""
+        self._priority_index.clear()
+        self._operation_indexes.clear()
+        active_accounts = await self.redis.smembers('accounts:active')
+        
+        for account_id in active_accounts:
+            account_id = account_id.decode() if isinstance(account_id, bytes) else account_id
+            
+            config, metrics = await self._load_account(account_id)
+            self._index_account(account_id, config, metrics)
+        
+        self._priority_index_ready = True
+        self.logger.info(f"Priority index rebuilt: {len(self._priority_index)}/{len(active_accounts)} selectable")
+        return len(self._priority_index)
+    
+    def prime_from_snapshot(self, records: List[Tuple[AccountConfig, AccountMetrics]]) -> int:
+        """用快照记录直接构建优先级索引和统计聚合值，跳过启动时的Redis全量扫描，返回可选账号数"""
+        self._priority_index.clear()
+        self._operation_indexes.clear()
+        self._pool_stats = PoolStatistics(AccountStatus.ACTIVE.value)
+        for config, metrics in records:
+            self._index_account(config.account_id, config, metrics)
+            if config.status == AccountStatus.ACTIVE:
+                self._pool_stats.update(config.account_id, status=config.status.value,
+                                        **self._stats_fields(config, metrics))
+            else:
+                self._pool_stats.update(config.account_id, status=config.status.value)
+        
+        self._usage_day = int(self.clock() // USAGE_DAY_SECONDS)
+        self._priority_index_ready = True
+        self._pool_stats_ready = True
+        return len(self._priority_index)
     
     async def update_account_success(self, account_id: str):
         """更新账号成功记录"""
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'total_requests', 1)
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'successful_requests', 1)
-        await self.redis.hset(f'account:{account_id}:metrics', field='consecutive_errors', value='0')
-        await self.redis.hset(f'account:{account_id}:metrics', field='last_success', value=datetime.utcnow().isoformat())
+        self.release_account(account_id)
+        if self.metric_writer:
+            self.metric_writer.record_success(account_id)
+            await self.metric_writer.maybe_flush()
+            return
+        
+        pipe = self.redis.pipeline()
+        pipe.hincrby(f'account:{account_id}:metrics', 'total_requests', 1)
+        pipe.hincrby(f'account:{account_id}:metrics', 'successful_requests', 1)
+        pipe.hset(f'account:{account_id}:metrics', mapping={
+            'consecutive_errors': '0',
+            'last_success': datetime.utcnow().isoformat()
+        })
+        await self._execute_metrics_update(account_id, pipe)
         
         self.logger.debug(f"Account {account_id} success recorded")
     
     async def mark_account_error(self, account_id: str, error: str):
         """标记账号错误"""
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'total_requests', 1)
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'failed_requests', 1)
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'consecutive_errors', 1)
+        self.release_account(account_id)
+        if self.metric_writer:
+            consecutive_errors = self.metric_writer.record_error(account_id)
+            if consecutive_errors is None:
+                # 本进程尚未读过该账号，读一次Redis（叠加刚记录的增量）得到基数
+                consecutive_errors = (await self._get_account_metrics(account_id)).consecutive_errors
+            await self.metric_writer.maybe_flush()
+        else:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(f'account:{account_id}:metrics', 'total_requests', 1)
+            pipe.hincrby(f'account:{account_id}:metrics', 'failed_requests', 1)
+            pipe.hincrby(f'account:{account_id}:metrics', 'consecutive_errors', 1)
+            _, _, consecutive_errors = await self._execute_metrics_update(account_id, pipe)
         
         # 检查是否需要暂停
-        consecutive_errors = await self.redis.hget(f'account:{account_id}:metrics', 'consecutive_errors')
         if consecutive_errors and int(consecutive_errors) >= 5:
             await self._suspend_account(account_id, f"Too many errors: {error}")
         
         self.logger.warning(f"Account {account_id} error: {error}")
     
+    def release_account(self, account_id: str):
+        """归还共享租用表中的在途占用；不记录成功或错误时（如请求被取消）直接调用"""
+        if self.lease_table is not None:
+            self.lease_table.release(f'account:{account_id}')
+    
+    async def close(self):
+        """写入剩余的聚合指标"""
+        if self.metric_writer:
+            await self.metric_writer.close()
+    
+    async def get_account_config(self, account_id: str) -> Optional[AccountConfig]:
+        """获取账号配置，账号不存在时返回None"""
+        return await self._get_account_config(account_id)
+    
     async def get_statistics(self) -> Dict:
-        """获取统计信息"""
-        active_accounts = await self.redis.smembers('accounts:active')
-        suspended_accounts = await self.redis.smembers('accounts:suspended')
+        """获取统计信息（增量聚合，常数时间）"""
+        self._check_usage_rollover()
+        if not self._pool_stats_ready:
+            await self.reconcile_statistics()
         
-        total_health = 0.0
-        total_usage = 0
+        return self._format_statistics(self._pool_stats)
+    
+    async def reconcile_statistics(self) -> Dict:
+        """全量扫描重算统计聚合值，替换运行值并返回两者的偏差"""
+        scanned = PoolStatistics(AccountStatus.ACTIVE.value)
         
-        for account_id in active_accounts:
-            account_id = account_id.decode() if isinstance(account_id, bytes) else account_id
-            metrics = await self._get_account_metrics(account_id)
-            total_health += metrics.health_score
-            total_usage += metrics.daily_usage
+        for status in (AccountStatus.ACTIVE, AccountStatus.SUSPENDED):
+            members = await self.redis.smembers(f'accounts:{status.value}')
+            for account_id in members:
+                account_id = account_id.decode() if isinstance(account_id, bytes) else account_id
+                
+                if status != AccountStatus.ACTIVE:
+                    scanned.update(account_id, status=status.value)
+                    continue
+                
+                config = await self._get_account_config(account_id)
+                metrics = await self._get_account_metrics(account_id)
+                if config:
+                    scanned.update(account_id, status=status.value, **self._stats_fields(config, metrics))
         
-        active_count = len(active_accounts)
+        drift = {}
+        if self._pool_stats_ready:
+            running = self._format_statistics(self._pool_stats)
+            expected = self._format_statistics(scanned)
+            drift = {
+                key: {'running': running[key], 'scanned': expected[key]}
+                for key in expected
+                if (abs(running[key] - expected[key]) > 1e-6
+                    if isinstance(expected[key], float) else running[key] != expected[key])
+            }
+            if drift:
+                self.logger.warning(f"Account statistics drift corrected: {drift}")
+        
+        self._pool_stats = scanned
+        self._pool_stats_ready = True
+        return drift
+    
+    async def run_statistics_reconciliation(self, interval: float = 300.0):
+        """周期对账任务，用asyncio.create_task启动"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_statistics()
+            except Exception as e:
+                self.logger.error(f"Statistics reconciliation failed: {e}")
+    
+    @staticmethod
+    def _format_statistics(stats: PoolStatistics) -> Dict:
+        active_count = stats.count(AccountStatus.ACTIVE.value)
+        suspended_count = stats.count(AccountStatus.SUSPENDED.value)
         
         return {
-            'total_accounts': active_count + len(suspended_accounts),
+            'total_accounts': active_count + suspended_count,
             'active_accounts': active_count,
-            'suspended_accounts': len(suspended_accounts),
-            'average_health_score': total_health / active_count if active_count > 0 else 0.0,
-            'total_daily_usage': total_usage
+            'suspended_accounts': suspended_count,
+            'average_health_score': stats.average('health'),
+            'total_daily_usage': stats.totals['usage'],
+            'priority_distribution': stats.group_distribution()
         }
     
+    @staticmethod
+    def _stats_fields(config: AccountConfig, metrics: AccountMetrics) -> Dict:
+        return {
+            'group': config.priority.value,
+            'health': metrics.health_score,
+            'usage': metrics.daily_usage
+        }
+    
+    async def _execute_metrics_update(self, account_id: str, pipe) -> List:
+        """执行指标写入管道；统计聚合或优先级索引已建立时在同一往返中取回最新配置和指标"""
+        tracked = self._pool_stats_ready or self._priority_index_ready
+        if tracked:
+            pipe.hgetall(f'account:{account_id}:config')
+            pipe.hgetall(f'account:{account_id}:metrics')
+            pipe.get(self._usage_keys(account_id)[0])
+        results = await pipe.execute()
+        
+        if tracked:
+            daily_usage = results.pop()
+            metrics = self._parse_account_metrics(results.pop(), daily_usage, account_id)
+            config = self._parse_account_config(results.pop())
+            self._refresh_account(account_id, config, metrics)
+        return results
+    
+    async def _sample_candidates(self, index: AccountPriorityIndex, priority: Optional[AccountPriority],
+                                 operation: Optional[str], now: float
+                                 ) -> List[Tuple[str, AccountConfig, AccountMetrics, float]]:
+        """从索引均匀抽样可用候选，按评分降序返回"""
+        candidates = []
+        for account_id, _ in index.sample(self.selection.samples, priority, self.selection.rng):
+            config, metrics = await self._load_account(account_id, operation)
+            if not self._is_selectable(config, metrics):
+                self._unindex_account(account_id)
+                continue
+            if operation and self._rate_limits.remaining(account_id, operation, now) <= 0:
+                self._park_account(account_id, operation)
+                continue
+            if self._account_load(account_id) >= self.max_in_flight:
+                continue
+            candidates.append((account_id, config, metrics, self._calculate_score(config, metrics)))
+        
+        candidates.sort(key=lambda candidate: -candidate[3])
+        return candidates
+    
+    def _account_load(self, account_id: str) -> int:
+        if self.lease_table is None:
+            return 0
+        return self.lease_table.in_flight(f'account:{account_id}')
+    
+    def _claim_account(self, account_id: str, now: float) -> bool:
+        if self.lease_table is None:
+            return True
+        return self.lease_table.try_acquire(f'account:{account_id}', self.max_in_flight, now)
+    
+    def _is_selectable(self, config: Optional[AccountConfig], metrics: AccountMetrics) -> bool:
+        if not config or config.status != AccountStatus.ACTIVE:
+            return False
+        return metrics.daily_usage < config.daily_limit
+    
+    def _index_account(self, account_id: str, config: Optional[AccountConfig], metrics: AccountMetrics):
+        if not self._is_selectable(config, metrics):
+            self._unindex_account(account_id)
+            return
+        
+        score = self._calculate_score(config, metrics)
+        self._priority_index.update(account_id, config.priority, score)
+        for operation, index in self._operation_indexes.items():
+            if not self._rate_limits.is_parked(account_id, operation):
+                index.update(account_id, config.priority, score)
+    
+    def _unindex_account(self, account_id: str):
+        self._priority_index.discard(account_id)
+        for index in self._operation_indexes.values():
+            index.discard(account_id)
+    
+    def _selection_index(self, operation: Optional[str], now: float) -> AccountPriorityIndex:
+        """按操作选择时返回该操作的索引，并放回窗口已重置的停放账号"""
+        if operation is None:
+            return self._priority_index
+        
+        index = self._operation_indexes.get(operation)
+        if index is None:
+            index = self._operation_indexes[operation] = AccountPriorityIndex()
+            for account_id, priority, score in self._priority_index.items():
+                if not self._rate_limits.is_parked(account_id, operation):
+                    index.update(account_id, priority, score)
+        
+        for account_id in self._rate_limits.release_due(operation, now):
+            self._restore_operation_index(account_id, operation)
+        return index
+    
+    def _park_account(self, account_id: str, operation: str):
+        """该操作配额用尽：移出该操作的索引直到窗口重置，其他操作不受影响"""
+        self._rate_limits.park(account_id, operation)
+        index = self._operation_indexes.get(operation)
+        if index is not None:
+            index.discard(account_id)
+    
+    def _restore_operation_index(self, account_id: str, operation: str):
+        index = self._operation_indexes.get(operation)
+        entry = self._priority_index.get(account_id)
+        if index is not None and entry is not None:
+            index.update(account_id, *entry)
+    
+    async def _ensure_priority_index(self):
+        if not self._priority_index_ready:
+            await self.rebuild_priority_index()
+    
+    async def _refresh_flushed(self, account_ids: List[str]):
+        """聚合指标刷新后，一次往返取回这批账号并更新索引和统计"""
+        if not (self._pool_stats_ready or self._priority_index_ready):
+            return
+        
+        pipe = self.redis.pipeline(transaction=False)
+        for account_id in account_ids:
+            pipe.hgetall(f'account:{account_id}:config')
+            pipe.hgetall(f'account:{account_id}:metrics')
+            pipe.get(self._usage_keys(account_id)[0])
+        results = await pipe.execute()
+        
+        for i, account_id in enumerate(account_ids):
+            config_data, metrics_data, daily_usage = results[3 * i:3 * i + 3]
+            config = self._parse_account_config(config_data)
+            # 已暂停的账号由状态切换维护
+            if config and config.status == AccountStatus.ACTIVE:
+                self._refresh_account(account_id, config,
+                                      self._parse_account_metrics(metrics_data, daily_usage, account_id))
+    
+    def _refresh_account(self, account_id: str, config: Optional[AccountConfig], metrics: AccountMetrics):
+        """账号配置或指标变化后增量更新优先级索引和统计聚合值"""
+        if self._priority_index_ready:
+            self._index_account(account_id, config, metrics)
+        if self._pool_stats_ready and config:
+            self._pool_stats.update(account_id, status=config.status.value, **self._stats_fields(config, metrics))
+    
     # 辅助方法
     async def _save_account_config(self, config: AccountConfig):
         config_dict = asdict(config)
         config_dict['status'] = config.status.value
         config_dict['priority'] = config.priority.value
         
-        await self.redis.hset(f'account:{config.account_id}:config', mapping=config_dict)
-        await self.redis.sadd('accounts:active', config.account_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(f'account:{config.account_id}:config', mapping=config_dict)
+        pipe.sadd('accounts:active', config.account_id)
+        await pipe.execute()
     
     async def _get_account_config(self, account_id: str) -> Optional[AccountConfig]:
-        config_data = await self.redis.hgetall(f'account:{account_id}:config')
+        return self._parse_account_config(await self.redis.hgetall(f'account:{account_id}:config'))
+    
+    async def _load_account(self, account_id: str, operation: Optional[str] = None
+                            ) -> Tuple[Optional[AccountConfig], AccountMetrics]:
+        """一次往返读取账号配置和指标；本进程尚未跟踪该操作的窗口时一并读取"""
+        load_window = operation is not None and (account_id, operation) not in self._rate_limits
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(f'account:{account_id}:config')
+        pipe.hgetall(f'account:{account_id}:metrics')
+        pipe.get(self._usage_keys(account_id)[0])
+        if load_window:
+            pipe.hgetall(f'account:{account_id}:ratelimit:{operation}')
+        results = await pipe.execute()
+        
+        if load_window and results[-1]:
+            window = results.pop()
+            self._rate_limits.update(account_id, operation, int(window['limit']),
+                                     int(window['remaining']), float(window['reset_at']))
+        config_data, metrics_data, daily_usage = results[:3]
+        return self._parse_account_config(config_data), self._parse_account_metrics(metrics_data, daily_usage, account_id)
+    
+    def _parse_account_config(self, config_data: Dict) -> Optional[AccountConfig]:
         if not config_data:
             return None
         
@@ -250,6 +919,9 @@ class SimpleAccountManager:
         metrics = AccountMetrics()
         metrics_dict = asdict(metrics)
         
+        # 日用量存放在分桶计数器中
+        metrics_dict.pop('daily_usage')
+        
         # 处理datetime字段
         for key, value in metrics_dict.items():
             if isinstance(value, datetime):
@@ -260,10 +932,20 @@ class SimpleAccountManager:
         await self.redis.hset(f'account:{account_id}:metrics', mapping=metrics_dict)
     
     async def _get_account_metrics(self, account_id: str) -> AccountMetrics:
-        metrics_data = await self.redis.hgetall(f'account:{account_id}:metrics')
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(f'account:{account_id}:metrics')
+        pipe.get(self._usage_keys(account_id)[0])
+        metrics_data, daily_usage = await pipe.execute()
+        return self._parse_account_metrics(metrics_data, daily_usage, account_id)
+    
+    def _parse_account_metrics(self, metrics_data: Dict, daily_usage: Optional[str] = None,
+                               account_id: Optional[str] = None) -> AccountMetrics:
+        """解析Redis中的指标；给出account_id时叠加尚未写入的聚合增量"""
         if not metrics_data:
             return AccountMetrics()
         
+        metrics_data['daily_usage'] = daily_usage or 0
+        
         # 转换数据类型
         for key in ['total_requests', 'successful_requests', 'failed_requests', 'consecutive_errors', 'daily_usage']:
             if key in metrics_data:
@@ -273,7 +955,10 @@ class SimpleAccountManager:
             if key in metrics_data and metrics_data[key]:
                 metrics_data[key] = datetime.fromisoformat(metrics_data[key])
         
-        return AccountMetrics(**{k: v for k, v in metrics_data.items() if k in AccountMetrics.__annotations__})
+        metrics = AccountMetrics(**{k: v for k, v in metrics_data.items() if k in AccountMetrics.__annotations__})
+        if account_id and self.metric_writer:
+            self.metric_writer.overlay(account_id, metrics)
+        return metrics
     
     def _calculate_score(self, config: AccountConfig, metrics: AccountMetrics) -> float:
         """计算账号评分"""
@@ -283,19 +968,110 @@ class SimpleAccountManager:
         
         return health_score + usage_score + priority_score
     
-    async def _record_usage(self, account_id: str):
-        await self.redis.hincrby(f'account:{account_id}:metrics', 'daily_usage', 1)
-        await self.redis.hset(f'account:{account_id}:metrics', field='last_used', value=datetime.utcnow().isoformat())
+    async def _record_usage(self, account_id: str, operation: Optional[str] = None):
+        self._check_usage_rollover()
+        day_key, window_key = self._usage_keys(account_id)
+        
+        pipe = self.redis.pipeline()
+        pipe.incr(day_key)
+        pipe.expire(day_key, 2 * USAGE_DAY_SECONDS)
+        pipe.incr(window_key)
+        pipe.expire(window_key, 2 * USAGE_WINDOW_SECONDS)
+        pipe.hset(f'account:{account_id}:metrics', field='last_used', value=datetime.utcnow().isoformat())
+        if operation:
+            bucket = self._rate_limits.consume(account_id, operation, self.clock())
+            if bucket:
+                self._queue_rate_limit(pipe, account_id, operation, bucket)
+                if bucket[1] <= 0:
+                    self._park_account(account_id, operation)
+        await self._execute_metrics_update(account_id, pipe)
+    
+    async def _save_rate_limit(self, account_id: str, operation: str, bucket: List):
+        pipe = self.redis.pipeline()
+        self._queue_rate_limit(pipe, account_id, operation, bucket)
+        await pipe.execute()
+    
+    def _queue_rate_limit(self, pipe, account_id: str, operation: str, bucket: List):
+        """窗口写入Redis供其他进程读取，键在窗口重置时过期"""
+        key = f'account:{account_id}:ratelimit:{operation}'
+        limit, remaining, reset_at = bucket
+        pipe.hset(key, mapping={'limit': str(limit), 'remaining': str(remaining), 'reset_at': str(reset_at)})
+        pipe.expire(key, max(1, int(reset_at - self.clock()) + 1))
+    
+    async def get_usage(self, account_id: str) -> Dict:
+        """当天和当前15分钟窗口的使用次数"""
+        day_key, window_key = self._usage_keys(account_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(day_key)
+        pipe.get(window_key)
+        daily, window = await pipe.execute()
+        return {'daily': int(daily or 0), 'window': int(window or 0)}
+    
+    def _usage_keys(self, account_id: str) -> Tuple[str, str]:
+        now = self.clock()
+        return (
+            f'account:{account_id}:usage:day:{int(now // USAGE_DAY_SECONDS)}',
+            f'account:{account_id}:usage:15m:{int(now // USAGE_WINDOW_SECONDS)}'
+        )
+    
+    def _check_usage_rollover(self):
+        """跨天时统计聚合和优先级索引在下次使用时重建"""
+        day = int(self.clock() // USAGE_DAY_SECONDS)
+        if day != self._usage_day:
+            self._usage_day = day
+            self._pool_stats_ready = False
+            self._priority_index_ready = False
     
     async def _suspend_account(self, account_id: str, reason: str):
-        # 更新状态
-        await self.redis.hset(f'account:{account_id}:config', field='status', value=AccountStatus.SUSPENDED.value)
-        
-        # 更新索引
-        await self.redis.srem('accounts:active', account_id)
-        await self.redis.sadd('accounts:suspended', account_id)
+        # 出错的账号由get_available_account分配，预期处于活跃状态
+        await self._update_account_status(account_id, AccountStatus.SUSPENDED, AccountStatus.ACTIVE)
         
         self.logger.warning(f"Account {account_id} suspended: {reason}")
+        
+        for listener in self.suspension_listeners:
+            await listener(account_id, reason)
+    
+    async def reinstate_account(self, account_id: str):
+        """恢复暂停的账号：清零连续错误并移回活跃集合"""
+        await self.redis.hset(f'account:{account_id}:metrics', field='consecutive_errors', value='0')
+        if self.metric_writer:
+            self.metric_writer.reset_errors(account_id)
+        await self._update_account_status(account_id, AccountStatus.ACTIVE, AccountStatus.SUSPENDED)
+        self.logger.info(f"Account {account_id} reinstated")
+    
+    async def _update_account_status(self, account_id: str, status: AccountStatus,
+                                     previous: Optional[AccountStatus] = None):
+        """状态字段与状态索引在一个事务内切换；previous已知时用SMOVE移动"""
+        pipe = self.redis.pipeline()
+        if previous is not None:
+            pipe.hset(f'account:{account_id}:config', field='status', value=status.value)
+            pipe.smove(f'accounts:{previous.value}', f'accounts:{status.value}', account_id)
+        else:
+            self._queue_status_reset(pipe, account_id, status)
+        results = await pipe.execute()
+        
+        if self.lease_table is not None:
+            self.lease_table.set_status(f'account:{account_id}', status.value)
+        
+        if previous is not None and not results[-1]:
+            # 实际状态与预期不符，按全部状态集合重置
+            pipe = self.redis.pipeline()
+            self._queue_status_reset(pipe, account_id, status)
+            await pipe.execute()
+        
+        if status != AccountStatus.ACTIVE:
+            self._pool_stats.update(account_id, status=status.value)
+            self._unindex_account(account_id)
+        elif self._pool_stats_ready or self._priority_index_ready:
+            self._refresh_account(account_id, *await self._load_account(account_id))
+    
+    def _queue_status_reset(self, pipe, account_id: str, status: AccountStatus):
+        # 同时写入状态字段：较晚执行的重置会覆盖其间其他切换写入的状态字段，与状态集合保持一致
+        pipe.hset(f'account:{account_id}:config', field='status', value=status.value)
+        for s in AccountStatus:
+            if s != status:
+                pipe.srem(f'accounts:{s.value}', account_id)
+        pipe.sadd(f'accounts:{status.value}', account_id)
 
 # 使用示例
 async def example_usage():
@@ -336,6 +1112,20 @@ async def example_usage():
     # 再次获取统计
     stats = await manager.get_statistics()
     print(f"\n更新后平均健康分数: {stats['average_health_score']:.2f}")
+    
+    # 按操作限流窗口选择账号：响应头显示配额用尽后不再分配该账号
+    account = await manager.get_available_account(operation='SearchTimeline')
+    if account:
+        await manager.record_rate_limit(account['account_id'], 'SearchTimeline', {
+            'x-rate-limit-limit': '50',
+            'x-rate-limit-remaining': '0',
+            'x-rate-limit-reset': str(int(time.time()) + 600)
+        })
+        print(f"\n{account['username']} 的SearchTimeline配额已用尽: "
+              f"{manager.rate_limit_status(account['account_id'], 'SearchTimeline')}")
+        
+        account = await manager.get_available_account(operation='SearchTimeline')
+        print(f"SearchTimeline改用账号: {account['username'] if account else None}")
 
 if __name__ == "__main__":
     asyncio.run(example_usage())
@@ -0,0 +1,1164 @@
+#!/usr/bin/env python3
+"""
+代理池/账号池性能基准测试
+用法: python benchmarks.py [基准名称 ...]，不带参数时运行全部基准
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List
+
+from account_manager_example import SimpleAccountManager, AccountPriority
+from fake_twscrape import FakeRateLimitServer, FakeTwitterAPI, synthetic_tweet_data
+from instrumentation import Instrumentation, LatencyHistogram
+from pacing_controller import PacingController
+from pairing_scheduler import PairingScheduler
+from pool_snapshot import dump_snapshot, read_snapshot, warm_start
+from recovery_scheduler import HierarchicalTimingWheel
+from search_engine import SearchEngine
+from selection_strategies import STRATEGIES, create_strategy
+from shared_lease_table import SharedLeaseTable
+from sqlite_store import SQLiteStore
+from tweet_dedup import TweetDeduplicator
+from tweet_columnar import ParquetTweetWriter, read_tweets, scan_tweets
+from tweet_sink import NDJSONSink, read_ndjson
+from socks5_proxy_manager import (
+    SOCKS5ProxyManager, ProxyConfig, ProxyRegion, ProxyStatus, MockRedis
+)
+
+class RoundTripCounter:
+    """包装Redis客户端，统计网络往返次数（单条命令或一次管道执行各计一次）
+
+    latency大于0时每次往返先等待该秒数，模拟网络延迟并让出事件循环。
+    """
+
+    def __init__(self, redis=None, latency: float = 0.0):
+        self._redis = redis or MockRedis()
+        self.latency = latency
+        self.round_trips = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def pipeline(self, transaction: bool = True):
+        pipe = self._redis.pipeline(transaction)
+        execute = pipe.execute
+
+        async def counted_execute(*args, **kwargs):
+            await self._round_trip()
+            return await execute(*args, **kwargs)
+
+        pipe.execute = counted_execute
+        return pipe
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._redis, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def counted(*args, **kwargs):
+            await self._round_trip()
+            return await attr(*args, **kwargs)
+
+        return counted
+
+def percentile(samples: List[float], pct: float) -> float:
+    """计算百分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def populate_proxy_pool(manager: SOCKS5ProxyManager, size: int, seed: int = 42) -> List[str]:
+    """直接写入Redis构造代理池，跳过连接测试，返回代理ID"""
+    rng = random.Random(seed)
+    regions = list(ProxyRegion)
+    proxy_ids = []
+
+    for i in range(size):
+        config = ProxyConfig(
+            proxy_id=f"socks5_10.{i // 65536}.{i // 256 % 256}.{i % 256}_1080",
+            host=f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+            port=1080,
+            username=f"user{i}",
+            password=f"pass{i}",
+            region=rng.choice(regions),
+            provider=f"provider{i % 5}"
+        )
+        await manager._save_proxy_config(config)
+        await manager._initialize_proxy_metrics(config.proxy_id)
+
+        total = rng.randint(0, 200)
+        successful = total - rng.randint(0, total // 10) if total else 0
+        await manager.redis.hset(f'proxy:{config.proxy_id}:metrics', mapping={
+            'total_requests': str(total),
+            'successful_requests': str(successful),
+            'failed_requests': str(total - successful),
+            'average_response_time': str(rng.uniform(0.2, 4.0))
+        })
+        await manager.redis.set(manager._usage_keys(config.proxy_id)[0], str(rng.randint(0, 900)))
+        proxy_ids.append(config.proxy_id)
+
+    # 上面绕过管理器直接写入Redis，丢弃初始化时缓存的默认指标
+    manager.config_cache.clear()
+    manager.metrics_cache.clear()
+    return proxy_ids
+
+async def bench_proxy_selection(sizes=(1_000, 10_000, 100_000), selections: int = 2_000):
+    """代理选择延迟：评分索引 vs 全量扫描"""
+    print("\n📊 代理选择延迟 (get_available_proxy + update_proxy_success)")
+    print(f"{'代理数':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'全量扫描(ms)':>14}")
+
+    for size in sizes:
+        manager = SOCKS5ProxyManager()
+        await populate_proxy_pool(manager, size)
+
+        # 全量扫描耗时即旧实现每次选择的下限
+        start = time.perf_counter()
+        await manager.rebuild_score_index()
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        samples = []
+        for i in range(selections):
+            region = ProxyRegion.US if i % 4 == 0 else None
+            start = time.perf_counter()
+            proxy = await manager.get_available_proxy(region=region)
+            samples.append((time.perf_counter() - start) * 1000)
+            if proxy:
+                await manager.update_proxy_success(proxy['proxy_id'], response_time=random.uniform(0.2, 2.0))
+
+        print(f"{size:>10} {percentile(samples, 50):>10.3f} {percentile(samples, 99):>10.3f} {scan_ms:>14.1f}")
+
+async def legacy_proxy_update(redis, proxy_id: str, ok: bool, response_time: float):
+    """批量化之前逐条await的写入方式，作为对照"""
+    key = f'proxy:{proxy_id}:metrics'
+    await redis.hincrby(key, 'total_requests', 1)
+    if ok:
+        await redis.hincrby(key, 'successful_requests', 1)
+        await redis.hset(key, 'consecutive_errors', '0')
+        await redis.hset(key, 'last_success', 'now')
+        current_avg = await redis.hget(key, 'average_response_time')
+        new_avg = float(current_avg or 0.0) * 0.8 + response_time * 0.2
+        await redis.hset(key, 'average_response_time', str(new_avg))
+    else:
+        await redis.hincrby(key, 'failed_requests', 1)
+        await redis.hincrby(key, 'consecutive_errors', 1)
+        await redis.hget(key, 'consecutive_errors')
+
+async def bench_metric_batching(updates: int = 10_000):
+    """指标写入的往返次数与耗时（每1万次更新）"""
+    print(f"\n📊 指标更新批量化 (每{updates}次更新，90%成功/10%失败)")
+    print(f"{'实现':<28} {'往返次数':>10} {'耗时(ms)':>10}")
+
+    async def run(label, make_update):
+        counter = RoundTripCounter()
+        update = await make_update(counter)
+        ids = getattr(update, 'ids', None) or [f"res{i}" for i in range(1000)]
+        counter.round_trips = 0
+        start = time.perf_counter()
+        for i in range(updates):
+            await update(ids[i % len(ids)], i % 10 != 0)
+        # 写后聚合的剩余增量计入
+        if hasattr(update, 'close'):
+            await update.close()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:<28} {counter.round_trips:>10} {elapsed:>10.1f}")
+
+    async def legacy(redis):
+        return lambda proxy_id, ok: legacy_proxy_update(redis, proxy_id, ok, 1.0)
+
+    async def proxy_manager(redis, **kwargs):
+        manager = SOCKS5ProxyManager(redis, **kwargs)
+        proxy_ids = await populate_proxy_pool(manager, 1000)
+
+        async def update(proxy_id, ok):
+            if ok:
+                await manager.update_proxy_success(proxy_id, response_time=1.0)
+            else:
+                await manager.mark_proxy_error(proxy_id, "bench")
+                # 清零连续错误避免触发暂停，不计入往返
+                await redis._redis.hset(f'proxy:{proxy_id}:metrics', 'consecutive_errors', '0')
+                manager._update_cached_metrics(proxy_id, consecutive_errors=0)
+        update.close = manager.close
+        update.ids = proxy_ids
+        return update
+
+    async def account_manager(redis, **kwargs):
+        manager = SimpleAccountManager(redis, **kwargs)
+
+        async def update(account_id, ok):
+            if ok:
+                await manager.update_account_success(account_id)
+            else:
+                await manager.mark_account_error(account_id, "bench")
+                await redis._redis.hset(f'account:{account_id}:metrics', field='consecutive_errors', value='0')
+                if manager.metric_writer:
+                    manager.metric_writer.reset_errors(account_id)
+        update.close = manager.close
+        return update
+
+    logging.getLogger().setLevel(logging.ERROR)
+    await run("代理 - 逐条await(旧)", legacy)
+    await run("代理 - 管道批量", proxy_manager)
+    await run("账号 - 管道批量", account_manager)
+    write_behind = {'flush_interval': 0.1, 'flush_events': 1000}
+    await run("代理 - 写后聚合(1000事件)", lambda redis: proxy_manager(redis, **write_behind))
+    await run("账号 - 写后聚合(1000事件)", lambda redis: account_manager(redis, **write_behind))
+    print("写后聚合的代理行包含首次访问时加载1000个代理到缓存的往返")
+
+async def bench_record_cache(size: int = 10_000, selections: int = 5_000):
+    """解码缓存：统计调用冷/热耗时与选择负载下的命中率"""
+    print(f"\n📊 配置/指标解码缓存 ({size}个代理)")
+
+    manager = SOCKS5ProxyManager()
+    await populate_proxy_pool(manager, size)
+
+    start = time.perf_counter()
+    await manager.get_statistics()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    await manager.get_statistics()
+    warm_ms = (time.perf_counter() - start) * 1000
+    print(f"get_statistics 冷缓存 {cold_ms:.1f}ms，热缓存 {warm_ms:.1f}ms ({cold_ms / warm_ms:.1f}x)")
+
+    for cache in (manager.config_cache, manager.metrics_cache):
+        cache.hits = cache.misses = 0
+
+    start = time.perf_counter()
+    for _ in range(selections):
+        proxy = await manager.get_available_proxy()
+        if proxy:
+            await manager.update_proxy_success(proxy['proxy_id'], response_time=random.uniform(0.2, 2.0))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    stats = manager.cache_stats()
+    print(f"{selections}次选择+成功回写 {elapsed_ms:.1f}ms，"
+          f"配置命中率 {stats['config']['hit_rate']:.1%}，指标命中率 {stats['metrics']['hit_rate']:.1%}")
+
+def hash_size(fields: Dict) -> int:
+    """估算字符串哈希的内存占用（字典本身加全部键值）"""
+    return sys.getsizeof(fields) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in fields.items())
+
+async def bench_columnar_scoring(size: int = 100_000, rounds: int = 20):
+    """列式存储：整池评分耗时与每代理内存"""
+    print(f"\n📊 列式指标存储 ({size}个代理)")
+
+    manager = SOCKS5ProxyManager(columnar=True)
+    await populate_proxy_pool(manager, size)
+    await manager.rebuild_score_index()
+    columns = manager.metrics_columns
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        health = columns.health_scores()
+        columns.selection_scores(health)
+        columns.selectable_mask(manager.health_threshold, health=health)
+    vector_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    start = time.perf_counter()
+    for proxy_id in columns.slots:
+        manager._calculate_score(manager.config_cache.peek(proxy_id), manager.metrics_cache.peek(proxy_id))
+    python_ms = (time.perf_counter() - start) * 1000
+
+    sample = next(iter(columns.slots))
+    metrics_hash = hash_size(manager.redis.data[f'proxy:{sample}:metrics'])
+    print(f"整池评分+可选筛选: 向量化 {vector_ms:.2f}ms，逐个Python计算 {python_ms:.1f}ms")
+    print(f"每代理内存: 列式 {columns.nbytes / columns.capacity:.0f}B，指标字符串哈希 {metrics_hash}B")
+
+async def bench_pool_statistics(sizes=(1_000, 10_000, 100_000), calls: int = 1_000):
+    """统计查询：首次全量对账 vs 增量聚合后的常数时间查询"""
+    print("\n📊 get_statistics 耗时")
+    print(f"{'代理数':>10} {'全量扫描(ms)':>14} {'增量查询(us)':>14}")
+
+    for size in sizes:
+        manager = SOCKS5ProxyManager()
+        await populate_proxy_pool(manager, size)
+
+        start = time.perf_counter()
+        await manager.get_statistics()
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            await manager.get_statistics()
+        call_us = (time.perf_counter() - start) * 1_000_000 / calls
+
+        print(f"{size:>10} {scan_ms:>14.1f} {call_us:>14.1f}")
+
+async def bench_usage_buckets(sizes=(1_000, 10_000, 100_000), ops: int = 5_000):
+    """用量分桶：每次记录用量与过期回收的开销不随键数量增长"""
+    print("\n📊 用量分桶计数 (_record_usage + 过期回收)")
+    print(f"{'代理数':>10} {'记录(us/次)':>12} {'活跃键':>10} {'跨窗口回收(ms)':>16} {'回收后键':>10}")
+
+    for size in sizes:
+        now = [1_700_000_000.0]
+        manager = SOCKS5ProxyManager(MockRedis(clock=lambda: now[0]))
+        manager.clock = lambda: now[0]
+        proxy_ids = [f"proxy{i}" for i in range(size)]
+        for proxy_id in proxy_ids:
+            await manager._record_usage(proxy_id)
+
+        start = time.perf_counter()
+        for i in range(ops):
+            await manager._record_usage(proxy_ids[i * 7919 % size])
+        record_us = (time.perf_counter() - start) * 1_000_000 / ops
+        live = len(manager.redis.expires)
+
+        # 越过两个15分钟窗口，窗口键全部到期，由主动过期分批回收
+        now[0] += 2 * 900 + 1
+        start = time.perf_counter()
+        while manager.redis.evict_expired():
+            pass
+        evict_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{size:>10} {record_us:>12.1f} {live:>10} {evict_ms:>16.1f} {len(manager.redis.expires):>10}")
+
+async def legacy_status_update(manager: SOCKS5ProxyManager, proxy_id: str, status: ProxyStatus):
+    """原子切换之前逐个SREM再SADD的写法，作为对照"""
+    await manager.redis.hset(f'proxy:{proxy_id}:config', 'status', status.value)
+    config = manager.config_cache.peek(proxy_id)
+    if config:
+        config.status = status
+    for s in ProxyStatus:
+        await manager.redis.srem(f'proxies:{s.value}', proxy_id)
+    await manager.redis.sadd(f'proxies:{status.value}', proxy_id)
+    await manager._refresh_proxy(proxy_id)
+
+def status_anomalies(redis: MockRedis, proxy_ids: List[str]) -> int:
+    """不恰好属于一个状态集合的代理数"""
+    sets = [redis.sets.get(f'proxies:{s.value}', set()) for s in ProxyStatus]
+    return sum(1 for proxy_id in proxy_ids if sum(proxy_id in members for members in sets) != 1)
+
+async def bench_status_transitions(size: int = 1_000, callers=(1, 16, 64),
+                                   transitions: int = 2_000, latency: float = 0.0005):
+    """状态切换：并发调用下的吞吐、往返次数与中间状态"""
+    print(f"\n📊 状态切换 ({size}个代理，{transitions}次切换，模拟往返延迟{latency * 1000:.1f}ms)")
+    print(f"{'实现':<16} {'并发':>6} {'切换/秒':>10} {'往返/次':>8} {'观测到的中间态':>14} {'结束时异常':>10}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    for label, transition in (("逐条SREM(旧)", legacy_status_update),
+                              ("SMOVE事务", SOCKS5ProxyManager._update_proxy_status)):
+        for concurrency in callers:
+            manager = SOCKS5ProxyManager()
+            await populate_proxy_pool(manager, size)
+            await manager.rebuild_score_index()
+            proxy_ids = [member.decode() for member in await manager.redis.smembers('proxies:active')]
+            counter = manager.redis = RoundTripCounter(manager.redis, latency)
+
+            rng = random.Random(7)
+            plan = [(rng.choice(proxy_ids), rng.choice((ProxyStatus.ACTIVE, ProxyStatus.ERROR)))
+                    for _ in range(transitions)]
+            done = False
+            observed = 0
+
+            async def monitor():
+                nonlocal observed
+                while not done:
+                    observed = max(observed, status_anomalies(counter._redis, proxy_ids))
+                    await asyncio.sleep(latency / 2)
+
+            async def caller(worker: int):
+                for proxy_id, status in plan[worker::concurrency]:
+                    await transition(manager, proxy_id, status)
+
+            watcher = asyncio.create_task(monitor())
+            start = time.perf_counter()
+            await asyncio.gather(*(caller(i) for i in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            done = True
+            await watcher
+
+            print(f"{label:<16} {concurrency:>6} {transitions / elapsed:>10.0f} "
+                  f"{counter.round_trips / transitions:>8.1f} {observed:>14} "
+                  f"{status_anomalies(counter._redis, proxy_ids):>10}")
+
+async def bench_pairing(accounts: int = 200, proxies: int = 2_000, requests: int = 5_000):
+    """账号+代理配对：独立选择 vs 粘滞配对的耗时与IP切换"""
+    print(f"\n📊 账号-代理配对 ({accounts}个账号，{proxies}个代理，{requests}次请求)")
+    print(f"{'实现':<16} {'p50(ms)':>10} {'p99(ms)':>10} {'IP切换率':>10} {'每账号IP数':>10}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    regions = ['us', 'eu', 'asia', 'global']
+
+    async def setup():
+        account_manager = SimpleAccountManager()
+        for i in range(accounts):
+            await account_manager.add_account(f"user{i}", f"user{i}@example.com",
+                                              list(AccountPriority)[i % 3], region=regions[i % 4])
+        proxy_manager = SOCKS5ProxyManager()
+        await populate_proxy_pool(proxy_manager, proxies)
+        await proxy_manager.rebuild_score_index()
+        return account_manager, proxy_manager
+
+    async def independent(account_manager, proxy_manager):
+        account = await account_manager.get_available_account()
+        proxy = await proxy_manager.get_available_proxy()
+        await proxy_manager.update_proxy_success(proxy['proxy_id'], response_time=0.5)
+        await account_manager.update_account_success(account['account_id'])
+        return account['account_id'], proxy['proxy_id']
+
+    def paired(scheduler):
+        async def run(account_manager, proxy_manager):
+            async with scheduler.lease() as pair:
+                pair.proxy.response_time = 0.5
+            return pair.account_id, pair.proxy_id
+        return run
+
+    account_manager, proxy_manager = await setup()
+    runs = [("独立选择(旧)", account_manager, proxy_manager, independent)]
+    account_manager, proxy_manager = await setup()
+    runs.append(("粘滞配对", account_manager, proxy_manager,
+                 paired(PairingScheduler(account_manager, proxy_manager))))
+
+    for label, account_manager, proxy_manager, pick in runs:
+        samples = []
+        last_proxy: Dict[str, str] = {}
+        seen: Dict[str, set] = {}
+        switches = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            account_id, proxy_id = await pick(account_manager, proxy_manager)
+            samples.append((time.perf_counter() - start) * 1000)
+            if last_proxy.get(account_id, proxy_id) != proxy_id:
+                switches += 1
+            last_proxy[account_id] = proxy_id
+            seen.setdefault(account_id, set()).add(proxy_id)
+
+        ips_per_account = sum(len(ips) for ips in seen.values()) / len(seen)
+        print(f"{label:<16} {percentile(samples, 50):>10.3f} {percentile(samples, 99):>10.3f} "
+              f"{switches / requests:>10.1%} {ips_per_account:>10.1f}")
+
+async def bench_account_selection(sizes=(1_000, 10_000), selections: int = 2_000):
+    """账号选择延迟：优先级索引 vs 全量扫描"""
+    print("\n📊 账号选择延迟 (get_available_account + update_account_success)")
+    print(f"{'账号数':>10} {'优先级':>8} {'p50(ms)':>10} {'p99(ms)':>10} {'全量扫描(ms)':>14}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    priorities = list(AccountPriority)
+    for size in sizes:
+        manager = SimpleAccountManager()
+        rng = random.Random(42)
+        for i in range(size):
+            await manager.add_account(f"user{i}", f"user{i}@example.com", rng.choice(priorities))
+
+        # 全量扫描耗时即旧实现每次选择的下限
+        start = time.perf_counter()
+        await manager.rebuild_priority_index()
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        for priority in (None, AccountPriority.LOW):
+            samples = []
+            for _ in range(selections):
+                start = time.perf_counter()
+                account = await manager.get_available_account(priority)
+                samples.append((time.perf_counter() - start) * 1000)
+                if account:
+                    await manager.update_account_success(account['account_id'])
+
+            label = priority.value if priority else '级联'
+            print(f"{size:>10} {label:>8} {percentile(samples, 50):>10.3f} "
+                  f"{percentile(samples, 99):>10.3f} {scan_ms:>14.1f}")
+
+async def bench_timing_wheel(sizes=(1_000, 10_000, 100_000)):
+    """冷却计时：分层时间轮每个计时器的插入、取消和到期开销"""
+    print("\n📊 分层时间轮 (冷却5分钟~24小时，tick=1s)")
+    print(f"{'待恢复数':>10} {'插入(us)':>10} {'取消(us)':>10} {'空tick(us)':>12} {'推进24h(ms)':>12}")
+
+    for size in sizes:
+        rng = random.Random(42)
+        deadlines = [rng.uniform(300, 86400) for _ in range(size)]
+        wheel = HierarchicalTimingWheel(tick=1.0)
+
+        start = time.perf_counter()
+        for i, deadline in enumerate(deadlines):
+            wheel.schedule(i, deadline)
+        insert_us = (time.perf_counter() - start) * 1_000_000 / size
+
+        cancelled = range(0, size, 10)
+        start = time.perf_counter()
+        for i in cancelled:
+            wheel.cancel(i)
+        cancel_us = (time.perf_counter() - start) * 1_000_000 / len(cancelled)
+
+        # 前300个tick没有计时器到期，只有格子轮转
+        start = time.perf_counter()
+        wheel.advance(299)
+        idle_us = (time.perf_counter() - start) * 1_000_000 / 299
+
+        # 推进总耗时 = 86400个tick的固定开销 + 每个到期计时器的下放和触发开销
+        start = time.perf_counter()
+        wheel.advance(86400)
+        advance_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{size:>10} {insert_us:>10.2f} {cancel_us:>10.2f} {idle_us:>12.2f} {advance_ms:>12.1f}")
+
+async def bench_rate_limit_windows(accounts: int = 50, requests: int = 4_000,
+                                   operation: str = 'SearchTimeline', quota: int = 50):
+    """按操作限流窗口：一个15分钟窗口内注定429的请求数"""
+    print(f"\n📊 操作限流窗口 ({accounts}个账号，{operation}配额{quota}/15分钟，{requests}次请求)")
+    print(f"{'实现':<16} {'成功':>8} {'429':>8} {'提前拒绝':>10} {'选择p50(ms)':>12}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    for label, track in (("仅日限额(旧)", False), ("按操作令牌桶", True)):
+        manager = SimpleAccountManager()
+        for i in range(accounts):
+            await manager.add_account(f"user{i}", f"user{i}@example.com")
+
+        # 服务端真实计数，超过配额即返回429
+        served = Counter()
+        reset_at = manager.clock() + 900
+        ok = throttled = rejected = 0
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            account = await manager.get_available_account(operation=operation if track else None)
+            samples.append((time.perf_counter() - start) * 1000)
+            if account is None:
+                if track and manager.rate_limit_reset_at(operation) is not None:
+                    rejected += 1
+                continue
+
+            account_id = account['account_id']
+            served[account_id] += 1
+            remaining = max(quota - served[account_id], 0)
+            if served[account_id] > quota:
+                throttled += 1
+                await manager.mark_account_error(account_id, "429 Too Many Requests")
+                # 清零连续错误避免触发暂停，只比较429数量
+                await manager.redis.hset(f'account:{account_id}:metrics', field='consecutive_errors', value='0')
+            else:
+                ok += 1
+                await manager.update_account_success(account_id)
+            if track:
+                await manager.record_rate_limit(account_id, operation, {
+                    'x-rate-limit-limit': str(quota),
+                    'x-rate-limit-remaining': str(remaining),
+                    'x-rate-limit-reset': str(reset_at)
+                })
+
+        print(f"{label:<16} {ok:>8} {throttled:>8} {rejected:>10} {percentile(samples, 50):>12.3f}")
+
+async def bench_selection_strategies(proxies: int = 100, workers: int = 200, requests_per_worker: int = 10,
+                                    base_latency: float = 0.01, comfortable_load: int = 4, failure_load: int = 8):
+    """选择策略模拟：高并发下的负载分布与尾延迟
+
+    模拟代理的响应时间随自身并发数平方增长，并发超过failure_load时请求失败。
+    """
+    print(f"\n📊 选择策略模拟 ({proxies}个代理，{workers}个并发worker，每个{requests_per_worker}次请求)")
+    print(f"{'策略':<12} {'使用代理':>8} {'最大/平均':>10} {'峰值并发':>8} {'p50(ms)':>10} {'p99(ms)':>10} {'失败率':>8}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    for name in STRATEGIES:
+        manager = SOCKS5ProxyManager(selection=create_strategy(name))
+        await populate_proxy_pool(manager, proxies)
+        await manager.rebuild_score_index()
+        for config in manager.config_cache.values():
+            config.max_concurrent = workers
+
+        load = Counter()
+        served = Counter()
+        peak = 0
+        samples = []
+        failures = 0
+
+        async def worker():
+            nonlocal peak, failures
+            for _ in range(requests_per_worker):
+                start = time.perf_counter()
+                async with manager.lease() as lease:
+                    load[lease.proxy_id] += 1
+                    served[lease.proxy_id] += 1
+                    current = load[lease.proxy_id]
+                    peak = max(peak, current)
+                    await asyncio.sleep(base_latency * (1 + (current / comfortable_load) ** 2))
+                    load[lease.proxy_id] -= 1
+                    if current > failure_load:
+                        failures += 1
+                        lease.fail("simulated overload timeout")
+                samples.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        total = workers * requests_per_worker
+        mean = total / proxies
+        print(f"{name:<12} {len(served):>8} {max(served.values()) / mean:>10.1f} {peak:>8} "
+              f"{percentile(samples, 50):>10.1f} {percentile(samples, 99):>10.1f} {failures / total:>8.1%}")
+
+def shared_lease_worker(table, accounts: int, rounds: int, barrier, picks):
+    """工作进程：各自的账号管理器（相同账号数据），每轮与其他进程同时选择并持有账号"""
+    async def run():
+        logging.getLogger().setLevel(logging.ERROR)
+        manager = SimpleAccountManager(lease_table=table)
+        for i in range(accounts):
+            await manager.add_account(f"user{i}", f"user{i}@example.com")
+        for round_no in range(rounds):
+            barrier.wait()
+            account = await manager.get_available_account()
+            picks.put((round_no, account['account_id'] if account else None))
+            barrier.wait()
+            if account:
+                await manager.update_account_success(account['account_id'])
+
+    asyncio.run(run())
+
+async def bench_shared_lease_table(processes: int = 4, accounts: int = 50, rounds: int = 50,
+                                   ops: int = 100_000):
+    """多进程账号选择：无协调时各进程选中同一账号，共享租用表下互不重复；以及协调开销"""
+    print(f"\n📊 多进程共享租用表 ({processes}个进程同时选择，{accounts}个账号，{rounds}轮)")
+    print(f"{'实现':<16} {'重复选中率':>10} {'每轮不同账号':>12}")
+
+    for label, table in (("各进程独立", None), ("共享租用表", SharedLeaseTable(capacity=1024))):
+        barrier = multiprocessing.Barrier(processes)
+        picks = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=shared_lease_worker, args=(table, accounts, rounds, barrier, picks))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        by_round = [[] for _ in range(rounds)]
+        for _ in range(processes * rounds):
+            round_no, account_id = picks.get()
+            by_round[round_no].append(account_id)
+        for worker in workers:
+            worker.join()
+
+        distinct = [len(set(round_picks)) for round_picks in by_round]
+        duplicate_rate = 1 - sum(distinct) / (processes * rounds)
+        print(f"{label:<16} {duplicate_rate:>10.1%} {sum(distinct) / len(distinct):>12.1f}")
+        if table:
+            table.unlink()
+
+    # 协调开销：一次占用+归还
+    table = SharedLeaseTable(capacity=1024)
+    start = time.perf_counter()
+    for i in range(ops):
+        key = f'account:acc_user{i % 50}'
+        table.try_acquire(key, 1)
+        table.release(key)
+    table_us = (time.perf_counter() - start) / ops * 1e6
+    table.unlink()
+
+    redis = MockRedis()
+    start = time.perf_counter()
+    for i in range(ops // 10):
+        key = f'account:acc_user{i % 50}:in_flight'
+        await redis.incr(key)
+        await redis.incr(key)
+    redis_us = (time.perf_counter() - start) / (ops // 10) * 1e6
+    print(f"占用+归还: 共享表 {table_us:.2f}µs，内存MockRedis两条命令 {redis_us:.2f}µs（真实Redis另加两次网络往返）")
+
+async def bench_sqlite_store(ops: int = 5_000, workers: int = 200, pipeline_size: int = 100,
+                             proxies: int = 500):
+    """SQLite（WAL）持久化存储与内存MockRedis的吞吐对比"""
+    print(f"\n📊 SQLite持久化存储 vs 内存 (ops/s)")
+    print(f"{'负载':<28} {'内存':>12} {'SQLite':>12} {'每次提交命令数':>14}")
+
+    async def sequential(redis):
+        for i in range(ops):
+            await redis.hincrby(f'proxy:p{i % 100}:metrics', 'total_requests', 1)
+        return ops
+
+    async def pipelined(redis):
+        for batch in range(ops // pipeline_size):
+            pipe = redis.pipeline()
+            for i in range(pipeline_size):
+                pipe.hincrby(f'proxy:p{i}:metrics', 'total_requests', 1)
+            await pipe.execute()
+        return ops
+
+    async def concurrent(redis):
+        async def worker(n):
+            for i in range(ops // workers):
+                await redis.hincrby(f'proxy:p{n}:metrics', 'total_requests', 1)
+        await asyncio.gather(*(worker(n) for n in range(workers)))
+        return ops // workers * workers
+
+    async def manager_updates(redis):
+        manager = SOCKS5ProxyManager(redis)
+        proxy_ids = await populate_proxy_pool(manager, proxies)
+        start = time.perf_counter()
+        for i in range(ops):
+            await manager.update_proxy_success(proxy_ids[i % proxies], response_time=0.5)
+        # 预置代理池的耗时不计入
+        return ops, time.perf_counter() - start
+
+    workloads = [
+        ("逐条await hincrby", sequential),
+        (f"管道({pipeline_size}条/次)", pipelined),
+        (f"{workers}个协程并发hincrby", concurrent),
+        ("update_proxy_success", manager_updates),
+    ]
+    async def successful_total(redis) -> int:
+        total = 0
+        for member in await redis.smembers('proxies:active'):
+            total += int(await redis.hget(f'proxy:{member.decode()}:metrics', 'successful_requests') or 0)
+        return total
+
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        for label, workload in workloads:
+            memory = MockRedis()
+            store = SQLiteStore(os.path.join(directory, f'{workload.__name__}.db'))
+            rates = []
+            for redis in (memory, store):
+                start = time.perf_counter()
+                result = await workload(redis)
+                count, elapsed = result if isinstance(result, tuple) else (result, time.perf_counter() - start)
+                rates.append(count / elapsed)
+            per_commit = store.stats()['commands_per_commit']
+            await store.close()
+            print(f"{label:<28} {rates[0]:>12,.0f} {rates[1]:>12,.0f} {per_commit:>14.1f}")
+
+        # 重启后数据仍在，与内存版结果一致
+        reopened = SQLiteStore(os.path.join(directory, 'manager_updates.db'))
+        persisted = await successful_total(reopened)
+        await reopened.close()
+        print(f"重新打开数据库后成功请求合计 {persisted}，内存版 {await successful_total(memory)}")
+
+async def bench_warm_start(sizes=(10_000, 50_000), accounts_ratio: float = 0.2,
+                           test_latency: float = 0.02, rtt: float = 0.0002):
+    """启动到可选择的耗时：逐个添加+测试（冷启动） vs 快照热启动"""
+    print(f"\n📊 启动耗时 (连接测试{test_latency * 1000:.0f}ms，Redis往返{rtt * 1000:.1f}ms)")
+    print(f"{'代理数':>8} {'账号数':>8} {'方式':<16} {'首次选择(s)':>12} {'往返次数':>10} {'后台复查(s)':>12}")
+
+    async def simulated_test(config) -> bool:
+        await asyncio.sleep(test_latency)
+        return True
+
+    def new_managers(redis):
+        proxy_manager = SOCKS5ProxyManager(redis)
+        proxy_manager._test_proxy_connection = simulated_test
+        return proxy_manager, SimpleAccountManager(redis)
+
+    def row(size, accounts, label, seconds, redis, recheck=None):
+        recheck_text = f"{recheck:>12.2f}" if recheck is not None else f"{'-':>12}"
+        print(f"{size:>8} {accounts:>8} {label:<16} {seconds:>12.3f} {redis.round_trips:>10} {recheck_text}")
+
+    logging.getLogger().setLevel(logging.ERROR)
+    priorities = list(AccountPriority)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            accounts = int(size * accounts_ratio)
+            path = os.path.join(directory, f'pool_{size}.snap')
+
+            # 冷启动：现有启动流程，逐个测试代理、逐个添加账号
+            redis = RoundTripCounter(latency=rtt)
+            proxy_manager, account_manager = new_managers(redis)
+            start = time.perf_counter()
+            await proxy_manager.add_proxy_batch([
+                {'host': f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", 'port': 1080,
+                 'username': f"user{i}", 'password': f"pass{i}"}
+                for i in range(size)
+            ])
+            for i in range(accounts):
+                await account_manager.add_account(f"user{i}", f"user{i}@example.com", priorities[i % 3])
+            assert await proxy_manager.get_available_proxy() and await account_manager.get_available_account()
+            row(size, accounts, "逐个添加", time.perf_counter() - start, redis)
+
+            start = time.perf_counter()
+            dumped = await dump_snapshot(path, proxy_manager, account_manager)
+            dump_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            read_snapshot(path)
+            read_seconds = time.perf_counter() - start
+
+            # Redis已有数据（持久化实例）：分块管道批量读取
+            persistent = redis._redis
+            redis = RoundTripCounter(persistent, latency=rtt)
+            start = time.perf_counter()
+            result = await warm_start(path, *new_managers(redis), recheck=False)
+            assert not result['restored']
+            row(size, accounts, "批量读取Redis", time.perf_counter() - start, redis)
+
+            # 空Redis：从快照写回
+            redis = RoundTripCounter(latency=rtt)
+            proxy_manager, account_manager = new_managers(redis)
+            start = time.perf_counter()
+            result = await warm_start(path, proxy_manager, account_manager)
+            assert await proxy_manager.get_available_proxy() and await account_manager.get_available_account()
+            first_selection = time.perf_counter() - start
+            round_trips = redis.round_trips
+            await result['recheck']
+            redis.round_trips = round_trips
+            row(size, accounts, "快照写回", first_selection, redis, time.perf_counter() - start)
+
+            print(f"{'':>8} 快照 {dumped['bytes'] / 1024:,.0f}KB "
+                  f"({dumped['bytes'] / (size + accounts):.0f}字节/条)，"
+                  f"生成 {dump_seconds:.3f}s，内存映射解码 {read_seconds:.3f}s")
+
+async def bench_instrumentation(proxies: int = 10_000, accounts: int = 1_000, rounds: int = 4_000,
+                                rtt: float = 0.0002, blocks: int = 20):
+    """延迟直方图的开销：同一负载开启/关闭埋点的每轮耗时对比"""
+    print(f"\n📊 埋点开销 ({proxies}个代理，{accounts}个账号，每轮选择+记账各一次)")
+
+    # 单项成本：直方图记录一次、包装一次空协程调用
+    histogram = LatencyHistogram()
+    samples = [random.randrange(1_000, 10_000_000) for _ in range(100_000)]
+    start = time.perf_counter()
+    for sample in samples:
+        histogram.record(sample)
+    record_ns = (time.perf_counter() - start) / len(samples) * 1e9
+
+    async def noop():
+        return None
+
+    async def call_many(function, n=100_000):
+        start = time.perf_counter()
+        for _ in range(n):
+            await function()
+        return (time.perf_counter() - start) / n * 1e9
+
+    instrumentation = Instrumentation()
+    wrapped = instrumentation.timed(noop, instrumentation.histogram(Instrumentation.OPERATION, operation='noop'))
+    wrapper_ns = await call_many(wrapped) - await call_many(noop)
+    print(f"直方图记录 {record_ns:.0f}ns/次，协程包装（含记录） {wrapper_ns:.0f}ns/次")
+
+    async def build(instrumentation, latency):
+        redis = RoundTripCounter()
+        proxy_manager = SOCKS5ProxyManager(redis, instrumentation=instrumentation)
+        account_manager = SimpleAccountManager(redis, instrumentation=instrumentation)
+        await populate_proxy_pool(proxy_manager, proxies)
+        for i in range(accounts):
+            await account_manager.add_account(f"user{i}", f"user{i}@example.com")
+        # 预置完成后才加入往返延迟
+        redis.latency = latency
+        return proxy_manager, account_manager
+
+    async def block(proxy_manager, account_manager, n):
+        start = time.perf_counter()
+        for _ in range(n):
+            proxy = await proxy_manager.get_available_proxy()
+            await proxy_manager.update_proxy_success(proxy['proxy_id'], response_time=0.5)
+            account = await account_manager.get_available_account()
+            await account_manager.update_account_success(account['account_id'])
+        return (time.perf_counter() - start) / n * 1e6
+
+    def timed_calls(instrumentation) -> int:
+        return sum(h.count for series in instrumentation._series.values() for h in series.values())
+
+    logging.getLogger().setLevel(logging.ERROR)
+    print(f"{'存储':<14} {'关闭(µs/轮)':>12} {'开启(µs/轮)':>12} {'开销':>8} {'每轮计时次数':>12}")
+    for store, latency, store_rounds in (("MockRedis", 0.0, rounds), (f"sleep({rtt * 1000:.1f}ms)往返", rtt, rounds // 10)):
+        instrumentation = Instrumentation()
+        pools = {False: await build(None, latency), True: await build(instrumentation, latency)}
+        for managers in pools.values():
+            await block(*managers, 20)
+
+        # 两组交替执行小批次取中位数，降低机器抖动的影响
+        calls_before = timed_calls(instrumentation)
+        samples = {enabled: [] for enabled in pools}
+        for _ in range(blocks):
+            for enabled, managers in pools.items():
+                samples[enabled].append(await block(*managers, store_rounds // blocks))
+        calls = (timed_calls(instrumentation) - calls_before) / (store_rounds // blocks * blocks)
+
+        off, on = percentile(samples[False], 50), percentile(samples[True], 50)
+        print(f"{store:<14} {off:>12.1f} {on:>12.1f} {(on / off - 1) * 100:>7.1f}% {calls:>12.0f}")
+
+    start = time.perf_counter()
+    text = instrumentation.render()
+    render_ms = (time.perf_counter() - start) * 1000
+    series = sum(1 for line in text.splitlines() if 'le="+Inf"' in line)
+    print(f"Prometheus导出 {series} 个直方图序列，{len(text) / 1024:.0f}KB，耗时 {render_ms:.1f}ms")
+
+async def bench_search_engine(queries: int = 32, results: int = 100, page_latency: float = 0.05,
+                              pool_sizes=(1, 4, 16, 64), tweet_delay: float = 0.5):
+    """多关键词搜索吞吐：逐个查询 vs SearchEngine并发（替身API，每页20条）"""
+    print(f"\n📊 多关键词搜索 ({queries}个查询×{results}条，每页请求{page_latency * 1000:.0f}ms)")
+    print(f"{'账号数':>6} {'方式':<12} {'耗时(s)':>9} {'推文/秒':>10} {'去重后':>8} {'峰值并发':>8}")
+    terms = [f"keyword{i} lang:en" for i in range(queries)]
+
+    api = FakeTwitterAPI(accounts=1, page_latency=page_latency, results_per_query=results, corpus_size=50_000)
+    start = time.perf_counter()
+    seen = set()
+    for term in terms:
+        async for tweet in api.search(term, limit=results):
+            seen.add(tweet.id)
+    seconds = time.perf_counter() - start
+    total = queries * results
+    print(f"{1:>6} {'逐个查询':<12} {seconds:>9.2f} {total / seconds:>10.0f} {len(seen):>8} {api.peak_in_flight:>8}")
+    # 原测试脚本每条推文后等待tweet_delay秒，吞吐上限为1/tweet_delay条/秒
+    print(f"{1:>6} {'逐条等待':<12} {seconds + total * tweet_delay:>9.2f} "
+          f"{total / (seconds + total * tweet_delay):>10.1f} {'(估算)':>8}")
+
+    for size in pool_sizes:
+        api = FakeTwitterAPI(accounts=size, page_latency=page_latency, results_per_query=results,
+                             corpus_size=50_000)
+        engine = SearchEngine(api)
+        start = time.perf_counter()
+        hits = 0
+        async for _ in engine.search_many(terms, limit=results):
+            hits += 1
+        seconds = time.perf_counter() - start
+        print(f"{size:>6} {'SearchEngine':<12} {seconds:>9.2f} {total / seconds:>10.0f} {hits:>8} "
+              f"{api.peak_in_flight:>8}")
+
+async def bench_pacing(accounts: int = 8, duration: float = 15.0, window_limit: int = 30, window: float = 5.0,
+                       burst_rate: float = 8.0, fixed_delays=(1.0, 0.5, 0.1)):
+    """固定sleep vs AIMD节奏控制：限流替身接口上的持续成功请求速率和429次数"""
+    sustainable = min(window_limit / window, burst_rate)
+    print(f"\n📊 请求节奏控制 ({accounts}个账号各自循环{duration:.0f}s，"
+          f"窗口{window_limit}次/{window:.0f}s，突发上限{burst_rate:.0f}次/s，可持续{sustainable:.1f}次/s/账号)")
+    print(f"{'方式':<14} {'成功/秒/账号':>12} {'占可持续比例':>12} {'429次数':>8} {'429比例':>8}")
+
+    def row(label, server):
+        rate = server.ok / duration / accounts
+        total = server.ok + server.throttled
+        print(f"{label:<14} {rate:>12.2f} {rate / sustainable:>12.0%} {server.throttled:>8} "
+              f"{server.throttled / total:>8.1%}")
+
+    async def run(worker):
+        deadline = time.time() + duration
+        await asyncio.gather(*(worker(f"acc_{i}", deadline) for i in range(accounts)))
+
+    for delay in fixed_delays:
+        server = FakeRateLimitServer(window_limit, window, burst_rate)
+
+        async def fixed(account_id, deadline):
+            while time.time() < deadline:
+                await server.request(account_id, 'SearchTimeline')
+                await asyncio.sleep(delay)
+
+        await run(fixed)
+        row(f"sleep({delay})", server)
+
+    # 不看响应头时只靠429和延迟调节
+    for label, use_headers in (("AIMD", True), ("AIMD(无响应头)", False)):
+        server = FakeRateLimitServer(window_limit, window, burst_rate)
+        pacing = PacingController()
+
+        async def paced(account_id, deadline):
+            while time.time() < deadline:
+                async with pacing.request(account_id, 'SearchTimeline') as call:
+                    response = await server.request(account_id, 'SearchTimeline')
+                    call.record(response.status, response.headers if use_headers else None)
+
+        await run(paced)
+        row(label, server)
+        rates = [stats['rate'] for stats in pacing.stats().values()]
+        print(f"{'':<14} 结束时速率 {min(rates):.2f}~{max(rates):.2f} 次/秒")
+
+def current_rss_kb() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+def tweet_output_worker(method: str, count: int, directory: str, results):
+    """子进程：按method写出count条合成推文，返回耗时、文件大小和峰值RSS增量"""
+    start_rss = current_rss_kb()
+    start = time.perf_counter()
+    records = synthetic_tweet_data(count)
+    if method == 'generate':
+        for _ in records:
+            pass
+    elif method == 'json_dump':
+        # 原做法：全部收集到列表，结束时一次性json.dump
+        extracted_data = []
+        for record in records:
+            extracted_data.append(record)
+        with open(os.path.join(directory, 'extracted.json'), 'w', encoding='utf-8') as f:
+            json.dump(extracted_data, f, ensure_ascii=False, indent=2)
+    else:
+        compresslevel = int(method.split(':')[1]) if ':' in method else 6
+        with NDJSONSink(directory, prefix=method.replace(':', ''), compress=method.startswith('gzip'),
+                        compresslevel=compresslevel) as sink:
+            for record in records:
+                sink.write(record)
+    seconds = time.perf_counter() - start
+    size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((seconds, size, peak_rss - start_rss))
+
+async def bench_tweet_sink(count: int = 1_000_000):
+    """提取结果落盘：列表+json.dump vs 流式NDJSON（可选gzip），各自在独立子进程中测峰值内存"""
+    print(f"\n📊 推文落盘 ({count:,}条合成tweet_data，写入耗时已扣除数据生成)")
+    print(f"{'方式':<22} {'写入耗时(s)':>11} {'输入MB/s':>9} {'文件MB':>9} {'峰值RSS增量MB':>14}")
+
+    def run(method):
+        with tempfile.TemporaryDirectory() as directory:
+            results = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=tweet_output_worker, args=(method, count, directory, results))
+            worker.start()
+            result = results.get()
+            worker.join()
+            return result
+
+    generate_seconds, _, _ = run('generate')
+    # 输入数据量按紧凑JSON计算，各方式相同
+    input_mb = None
+    for label, method in (("NDJSON", 'ndjson'), ("NDJSON+gzip(1)", 'gzip:1'), ("NDJSON+gzip(6)", 'gzip:6'),
+                          ("列表+json.dump(indent=2)", 'json_dump')):
+        seconds, size, rss_kb = run(method)
+        if input_mb is None:
+            input_mb = size / 1e6
+        write_seconds = max(seconds - generate_seconds, 1e-9)
+        print(f"{label:<22} {write_seconds:>11.2f} {input_mb / write_seconds:>9.1f} {size / 1e6:>9.1f} "
+              f"{rss_kb / 1024:>14.1f}")
+    print(f"{'':<22} 数据生成 {generate_seconds:.2f}s（{count / generate_seconds:,.0f}条/秒）")
+
+async def bench_columnar_export(count: int = 1_000_000, chunk: int = 100_000, scan_target: int = 50_000_000):
+    """NDJSON vs Parquet：写入速度、文件大小，以及只需两列的分析查询（各语言点赞合计）"""
+    import pyarrow.compute as pc
+
+    print(f"\n📊 列式导出 ({count:,}条合成tweet_data，查询: 按lang汇总likes)")
+    # 预先生成一块记录重复写入，写入计时不含数据生成
+    records = list(synthetic_tweet_data(chunk))
+    repeats = count // chunk
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        with NDJSONSink(os.path.join(directory, 'ndjson')) as sink:
+            for _ in range(repeats):
+                sink.write_many(records)
+        ndjson_write = time.perf_counter() - start
+        ndjson_size = sum(os.path.getsize(path) for path in sink.files)
+
+        parquet_path = os.path.join(directory, 'tweets.parquet')
+        start = time.perf_counter()
+        with ParquetTweetWriter(parquet_path) as writer:
+            for _ in range(repeats):
+                writer.write_many(records)
+        parquet_write = time.perf_counter() - start
+        parquet_size = os.path.getsize(parquet_path)
+
+        print(f"{'格式':<24} {'写入(s)':>8} {'文件MB':>8} {'查询(s)':>8} {'推算5千万条查询(s)':>16}")
+
+        def row(label, write_seconds, size, query_seconds):
+            write_text = f"{write_seconds:>8.2f}" if write_seconds is not None else f"{'-':>8}"
+            size_text = f"{size / 1e6:>8.1f}" if size is not None else f"{'-':>8}"
+            print(f"{label:<24} {write_text} {size_text} {query_seconds:>8.2f} "
+                  f"{query_seconds * scan_target / (repeats * chunk):>16.0f}")
+
+        start = time.perf_counter()
+        likes_by_lang = Counter()
+        for path in sink.files:
+            for record in read_ndjson(path):
+                likes_by_lang[record['basic_info']['lang']] += record['engagement']['likes']
+        row("NDJSON（整行解析）", ndjson_write, ndjson_size, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        read_tweets(parquet_path).group_by('lang').aggregate([('likes', 'sum')])
+        row("Parquet（读取全部列）", parquet_write, parquet_size, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        table = read_tweets(parquet_path, columns=['lang', 'likes']).group_by('lang').aggregate([('likes', 'sum')])
+        row("Parquet（只读2列）", None, None, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        english_likes = sum(pc.sum(batch.column('likes')).as_py() or 0
+                            for batch in scan_tweets(parquet_path, ['likes'], filter=pc.field('lang') == 'en'))
+        row("Parquet（流式扫描+过滤）", None, None, time.perf_counter() - start)
+
+        parquet_totals = dict(zip(table.column('lang').to_pylist(), table.column('likes_sum').to_pylist()))
+        assert parquet_totals == dict(likes_by_lang) and english_likes == likes_by_lang['en']
+
+async def bench_tweet_dedup(unique: int = 1_000_000, queries: int = 4, error_rates=(0.01, 0.001, 0.0001)):
+    """跨查询去重：Bloom+有序ID存储 vs Python set，吞吐、实测误判率和每百万ID内存"""
+    print(f"\n📊 推文去重 ({unique:,}个不同ID，{queries}个重叠查询，每个查询命中约一半)")
+    rng = random.Random(11)
+    base_id = 1_800_000_000_000_000_000
+    corpus = [base_id + i * 4096 + rng.randrange(4096) for i in range(unique)]
+    # 每个查询随机取语料的一半，查询之间大量重叠
+    stream = []
+    for _ in range(queries):
+        stream.extend(tweet_id for tweet_id in corpus if rng.random() < 0.5)
+    distinct = len(set(stream))
+
+    def peak_heap_mb(build) -> float:
+        tracemalloc.start()
+        keep = build()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del keep
+        return peak / 1e6
+
+    def run_set():
+        seen = set()
+        duplicates = 0
+        for tweet_id in stream:
+            if tweet_id in seen:
+                duplicates += 1
+            else:
+                seen.add(tweet_id)
+        return seen
+
+    print(f"{'实现':<26} {'µs/ID':>7} {'重复数':>9} {'实测误判率':>10} {'文件MB/百万':>11}")
+    start = time.perf_counter()
+    run_set()
+    seconds = time.perf_counter() - start
+    print(f"{'Python set':<26} {seconds / len(stream) * 1e6:>7.2f} {len(stream) - distinct:>9} {'-':>10} {'-':>11}")
+
+    def run_dedup(path, error_rate):
+        dedup = TweetDeduplicator(path, capacity=unique, error_rate=error_rate)
+        for tweet_id in stream:
+            dedup.seen(tweet_id)
+        dedup.close()
+        return dedup
+
+    with tempfile.TemporaryDirectory() as directory:
+        for error_rate in error_rates:
+            path = os.path.join(directory, f'dedup_{error_rate}')
+            start = time.perf_counter()
+            dedup = run_dedup(path, error_rate)
+            seconds = time.perf_counter() - start
+            stats = dedup.stats()
+            assert stats['duplicates'] == len(stream) - distinct
+            file_bytes = sum(entry.stat().st_size for entry in os.scandir(path))
+            print(f"{f'Bloom({error_rate:.2%})+有序ID':<26} {seconds / len(stream) * 1e6:>7.2f} "
+                  f"{stats['duplicates']:>9} {stats['false_positive_rate']:>10.3%} {file_bytes / distinct:>11.1f}"
+                  f"  (Bloom {stats['bloom_bytes_per_million'] / 1e6:.2f}MB/百万ID，有序ID 8字节/ID，"
+                  f"归并 {stats['merges']} 次)")
+
+        # 堆内存与误判率无关（Bloom和有序ID都在映射文件中），只在最后测一次；
+        # set随ID数线性增长，去重器只有未归并的增量集合和归并时的临时数组，上限由merge_threshold决定
+        set_heap = peak_heap_mb(run_set)
+        dedup_heap = peak_heap_mb(lambda: run_dedup(os.path.join(directory, 'heap'), error_rates[-1]))
+        print(f"堆内存峰值(tracemalloc)：Python set {set_heap:.1f}MB，去重器 {dedup_heap:.1f}MB")
+
+BENCHMARKS = {
+    'proxy_selection': bench_proxy_selection,
+    'metric_batching': bench_metric_batching,
+    'record_cache': bench_record_cache,
+    'columnar_scoring': bench_columnar_scoring,
+    'pool_statistics': bench_pool_statistics,
+    'usage_buckets': bench_usage_buckets,
+    'status_transitions': bench_status_transitions,
+    'pairing': bench_pairing,
+    'account_selection': bench_account_selection,
+    'timing_wheel': bench_timing_wheel,
+    'rate_limit_windows': bench_rate_limit_windows,
+    'selection_strategies': bench_selection_strategies,
+    'shared_lease_table': bench_shared_lease_table,
+    'sqlite_store': bench_sqlite_store,
+    'warm_start': bench_warm_start,
+    'instrumentation': bench_instrumentation,
+    'search_engine': bench_search_engine,
+    'pacing': bench_pacing,
+    'tweet_sink': bench_tweet_sink,
+    'columnar_export': bench_columnar_export,
+    'tweet_dedup': bench_tweet_dedup,
+}
+
+async def main(names: List[str]):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"❌ 未知基准: {name}，可选: {', '.join(BENCHMARKS)}")
+            continue
+        await BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
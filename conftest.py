@@ -0,0 +1,12 @@
+"""
+pytest配置
+test_twscrape.py、test_playwright*.py和python_version_test.py是需要真实账号、浏览器或网络的
+手动验证脚本（python 脚本名 直接运行），不作为单元测试收集。
+"""
+
+collect_ignore = [
+    "test_twscrape.py",
+    "test_playwright.py",
+    "test_playwright_twitter.py",
+    "python_version_test.py",
+]
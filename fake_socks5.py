@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+SOCKS5代理服务器的本地替身
+按认证用户名模拟正常、缓慢和失败的代理，供测试在没有外部网络的情况下验证代理管理器；
+另有直接登记离线代理的辅助函数，用于不需要真实连接的测试。
+"""
+
+import asyncio
+from collections import defaultdict
+
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyConfig
+
+class FakeSOCKS5Server:
+    """本地SOCKS5替身服务器
+
+    按认证用户名决定行为：good正常应答，slow握手后挂起，fail拒绝认证。
+    CONNECT成功后服务器自身充当目标站点，对任意HTTP请求返回200并保持连接。
+    in_flight统计正在处理中的握手/请求，空闲的长连接不计入。
+    """
+
+    def __init__(self, slow_delay: float = 30.0, response_delay: float = 0.05):
+        self.slow_delay = slow_delay
+        self.response_delay = response_delay
+        self.servers = []
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = defaultdict(int)
+        self.peak_in_flight = defaultdict(int)
+        self.peak_total = 0
+
+    def _enter(self, host: str):
+        self.in_flight[host] += 1
+        self.peak_in_flight[host] = max(self.peak_in_flight[host], self.in_flight[host])
+        self.peak_total = max(self.peak_total, sum(self.in_flight.values()))
+
+    def _leave(self, host: str):
+        self.in_flight[host] -= 1
+
+    async def start(self, host: str) -> int:
+        server = await asyncio.start_server(lambda r, w: self._handle(host, r, w), host, 0)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def _handle(self, host: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        busy = True
+        self._enter(host)
+        try:
+            # 协商认证方式：用户名/密码
+            _, nmethods = await reader.readexactly(2)
+            await reader.readexactly(nmethods)
+            writer.write(b'\x05\x02')
+
+            _, ulen = await reader.readexactly(2)
+            username = (await reader.readexactly(ulen)).decode()
+            plen = (await reader.readexactly(1))[0]
+            await reader.readexactly(plen)
+
+            if username.startswith('fail'):
+                writer.write(b'\x01\x01')
+                await writer.drain()
+                return
+            writer.write(b'\x01\x00')
+
+            # CONNECT请求
+            _, _, _, atyp = await reader.readexactly(4)
+            if atyp == 1:
+                await reader.readexactly(4)
+            elif atyp == 3:
+                await reader.readexactly((await reader.readexactly(1))[0])
+            else:
+                await reader.readexactly(16)
+            await reader.readexactly(2)
+
+            if username.startswith('slow'):
+                # 挂起直到客户端放弃连接
+                try:
+                    await asyncio.wait_for(reader.read(1), self.slow_delay)
+                except asyncio.TimeoutError:
+                    pass
+                return
+            writer.write(b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00')
+
+            # 充当目标HTTP服务，支持keep-alive
+            while True:
+                if busy:
+                    self._leave(host)
+                    busy = False
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                self._enter(host)
+                busy = True
+                self.requests += 1
+
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                await asyncio.sleep(self.response_delay)
+                body = b'{"origin": "127.0.0.1"}'
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if busy:
+                self._leave(host)
+            writer.close()
+
+async def build_proxy_list(server: FakeSOCKS5Server, layout: dict) -> list:
+    """layout: {主机: [行为, ...]}"""
+    proxy_list = []
+    for host, behaviours in layout.items():
+        for i, behaviour in enumerate(behaviours):
+            port = await server.start(host)
+            proxy_list.append({
+                'host': host,
+                'port': port,
+                'username': f'{behaviour}{i}',
+                'password': 'secret',
+                'region': 'us'
+            })
+    return proxy_list
+
+def create_manager() -> SOCKS5ProxyManager:
+    manager = SOCKS5ProxyManager()
+    manager.test_url = 'http://127.0.0.1/ip'
+    manager.test_timeout = 1
+    return manager
+
+async def add_offline_proxies(manager: SOCKS5ProxyManager, count: int, max_concurrent: int):
+    """不经连接测试直接登记活跃代理"""
+    for i in range(count):
+        config = ProxyConfig(
+            proxy_id=f"socks5_10.0.0.{i}_1080", host=f"10.0.0.{i}", port=1080,
+            username='user', password='secret', max_concurrent=max_concurrent
+        )
+        await manager._save_proxy_config(config)
+        await manager._initialize_proxy_metrics(config.proxy_id)
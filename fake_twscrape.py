@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+twscrape API的本地替身
+提供与twscrape.API相同形状的search()、search_raw()和pool.get_all()，用于在没有Twitter账号和网络的
+情况下测试和基准测试搜索并发。账号池按队列独占账号（与twscrape一致：一个查询翻页期间一直持有同一账号），
+每页等待page_latency秒模拟一次GraphQL请求；search_raw每页产出一个FakePage（对应httpx.Response），
+parse_tweets对应twscrape.models.parse_tweets。
+FakeRateLimitServer模拟X接口按(账号, 操作)的限流，用于节奏控制的仿真；
+synthetic_tweet_data按test_data_extraction的记录结构生成合成数据，用于落盘格式的基准测试。
+"""
+
+import asyncio
+import random
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+@dataclass
+class FakeUser:
+    username: str
+    displayname: str = ''
+    verified: bool = False
+    followersCount: int = 0
+
+@dataclass
+class FakeTweet:
+    """twscrape.Tweet中测试脚本用到的字段"""
+    id: int
+    rawContent: str
+    user: FakeUser
+    date: datetime
+    lang: str = 'en'
+    likeCount: int = 0
+    retweetCount: int = 0
+    replyCount: int = 0
+    quoteCount: int = 0
+    retweetedTweet: Optional['FakeTweet'] = None
+    inReplyToTweetId: Optional[int] = None
+    media: List = field(default_factory=list)
+
+    @property
+    def url(self) -> str:
+        return f"https://x.com/{self.user.username}/status/{self.id}"
+
+@dataclass
+class FakeAccount:
+    username: str
+    active: bool = True
+    requests: int = 0
+
+class FakePage(NamedTuple):
+    """search_raw的一页，对应twscrape产出的httpx.Response"""
+    status_code: int
+    headers: Dict[str, str]
+    tweets: List[FakeTweet]
+
+def parse_tweets(page: FakePage, limit: int = -1) -> List[FakeTweet]:
+    """对应twscrape.models.parse_tweets"""
+    return page.tweets if limit < 0 else page.tweets[:limit]
+
+@dataclass
+class FakeAccountsPool:
+    """按队列独占账号的账号池，get_for_queue在没有空闲账号时等待"""
+    accounts: List[FakeAccount]
+    _idle: Dict[str, asyncio.Queue] = field(default_factory=dict)
+
+    async def get_all(self) -> List[FakeAccount]:
+        return list(self.accounts)
+
+    def _queue(self, queue: str) -> asyncio.Queue:
+        idle = self._idle.get(queue)
+        if idle is None:
+            idle = self._idle[queue] = asyncio.Queue()
+            for account in self.accounts:
+                if account.active:
+                    idle.put_nowait(account)
+        return idle
+
+    async def get_for_queue(self, queue: str) -> FakeAccount:
+        return await self._queue(queue).get()
+
+    def unlock(self, queue: str, account: FakeAccount):
+        self._queue(queue).put_nowait(account)
+
+class FakeTwitterAPI:
+    """twscrape.API替身
+
+    每个查询从corpus_size条推文组成的语料中按查询文本确定性地抽取结果，不同查询之间有重叠，
+    可用于验证跨查询去重。每页page_size条，limit<0时返回results_per_query条。
+    给出window_limit时每页带x-rate-limit-*响应头，按账号每window秒window_limit次计算剩余配额（不拒绝请求）。
+    """
+
+    def __init__(self, accounts: int = 4, page_latency: float = 0.05, page_size: int = 20,
+                 results_per_query: int = 100, corpus_size: int = 100_000,
+                 window_limit: Optional[int] = None, window: float = 900.0):
+        self.pool = FakeAccountsPool([FakeAccount(f"user_{i}") for i in range(accounts)])
+        self.page_latency = page_latency
+        self.page_size = page_size
+        self.results_per_query = results_per_query
+        self.corpus_size = corpus_size
+        self.window_limit = window_limit
+        self.window = window
+        self._started = time.time()
+        self._window_used: Dict[Tuple[str, int], int] = {}
+        self.pages = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _tweet(self, tweet_id: int, query: str) -> FakeTweet:
+        return FakeTweet(
+            id=tweet_id,
+            rawContent=f"{query} #{tweet_id % 97} tweet {tweet_id}",
+            user=FakeUser(f"author_{tweet_id % 1000}", f"Author {tweet_id % 1000}", tweet_id % 7 == 0,
+                          tweet_id % 100_000),
+            date=datetime(2025, 1, 1, tzinfo=timezone.utc),
+            likeCount=tweet_id % 500,
+            retweetCount=tweet_id % 50,
+            replyCount=tweet_id % 20
+        )
+
+    def _headers(self, account: FakeAccount) -> Dict[str, str]:
+        """记一次请求并返回该账号当前窗口的限流响应头"""
+        if self.window_limit is None:
+            return {}
+        window = int((time.time() - self._started) // self.window)
+        key = (account.username, window)
+        used = self._window_used[key] = self._window_used.get(key, 0) + 1
+        return {
+            'x-rate-limit-limit': str(self.window_limit),
+            'x-rate-limit-remaining': str(max(self.window_limit - used, 0)),
+            'x-rate-limit-reset': str(self._started + (window + 1) * self.window)
+        }
+
+    async def search(self, q: str, limit: int = -1, kv: Optional[Dict] = None) -> AsyncIterator[FakeTweet]:
+        pages = self.search_raw(q, limit, kv)
+        try:
+            async for page in pages:
+                for tweet in parse_tweets(page, limit):
+                    yield tweet
+        finally:
+            # 与twscrape的aclosing一致，提前退出时立即归还账号
+            await pages.aclose()
+
+    async def search_raw(self, q: str, limit: int = -1, kv: Optional[Dict] = None) -> AsyncIterator[FakePage]:
+        total = self.results_per_query if limit < 0 else min(limit, self.results_per_query)
+        rng = random.Random(zlib.crc32(q.encode()))
+        ids = rng.sample(range(1, self.corpus_size + 1), total)
+        account = await self.pool.get_for_queue('SearchTimeline')
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            for start in range(0, total, self.page_size):
+                await asyncio.sleep(self.page_latency)
+                self.pages += 1
+                account.requests += 1
+                tweets = [self._tweet(tweet_id, q) for tweet_id in ids[start:start + self.page_size]]
+                yield FakePage(200, self._headers(account), tweets)
+        finally:
+            self.in_flight -= 1
+            self.pool.unlock('SearchTimeline', account)
+
+class FakeResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+
+class FakeRateLimitServer:
+    """按(账号, 操作)限流的接口替身
+
+    两层限制：window秒窗口内最多window_limit次（响应头x-rate-limit-*如实给出），
+    以及不公开的短时突发限制（burst_rate次/秒的令牌桶，容量burst）。
+    任一限制超出返回429，被拒绝的请求同样计入窗口。
+    """
+
+    def __init__(self, window_limit: int = 30, window: float = 5.0, burst_rate: float = 8.0,
+                 burst: int = 4, latency: float = 0.02, clock: Callable[[], float] = time.time):
+        self.window_limit = window_limit
+        self.window = window
+        self.burst_rate = burst_rate
+        self.burst = burst
+        self.latency = latency
+        self.clock = clock
+        self._windows: Dict[Tuple[str, str], List] = {}
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}
+        self.ok = 0
+        self.throttled = 0
+
+    async def request(self, account_id: str, operation: str) -> FakeResponse:
+        await asyncio.sleep(self.latency)
+        now = self.clock()
+        key = (account_id, operation)
+
+        window = self._windows.get(key)
+        if window is None or now >= window[1]:
+            window = self._windows[key] = [self.window_limit, now + self.window]
+        window[0] -= 1
+
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.burst_rate)
+        allowed = window[0] >= 0 and tokens >= 1
+        self._buckets[key] = [tokens - 1 if allowed else tokens, now]
+
+        headers = {
+            'x-rate-limit-limit': str(self.window_limit),
+            'x-rate-limit-remaining': str(max(window[0], 0)),
+            'x-rate-limit-reset': str(window[1])
+        }
+        if allowed:
+            self.ok += 1
+            return FakeResponse(200, headers)
+        self.throttled += 1
+        return FakeResponse(429, headers)
+
+LANGS = ('en', 'en', 'en', 'ja', 'es', 'pt', 'zh', 'und')
+WORDS = ('python', 'asyncio', 'data', 'release', 'model', 'open', 'source', 'scraping', 'proxy', 'pool',
+         'latency', 'benchmark', 'thread', 'news', 'today', 'launch', 'update', 'learn', 'code', 'rust')
+
+def synthetic_tweet_data(count: int, seed: int = 0, users: int = 50_000) -> Iterator[Dict]:
+    """逐条生成与test_data_extraction中tweet_data结构相同的记录，不在内存中保留"""
+    rng = random.Random(seed)
+    base_id = 1_800_000_000_000_000_000
+    # 与twscrape一致，日期带时区（UTC）
+    base_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        user = rng.randrange(users)
+        text = ' '.join(rng.choices(WORDS, k=rng.randint(8, 40)))
+        if rng.random() < 0.3:
+            text += f" #{rng.choice(WORDS)}"
+        if rng.random() < 0.2:
+            text = f"@user{rng.randrange(users)} " + text
+        media_count = rng.choice((0, 0, 0, 1, 1, 2, 4))
+        yield {
+            'basic_info': {
+                'id': base_id + i * 1000 + rng.randrange(1000),
+                'url': f"https://x.com/user{user}/status/{base_id + i}",
+                'created_at': (base_time + timedelta(seconds=i // 10)).isoformat(),
+                'lang': rng.choice(LANGS)
+            },
+            'content': {
+                'text': text,
+                'text_length': len(text),
+                'has_media': media_count > 0,
+                'media_count': media_count
+            },
+            'user_info': {
+                'username': f"user{user}",
+                'display_name': f"User {user}",
+                'verified': user % 50 == 0,
+                'followers_count': (user * 7919) % 2_000_000
+            },
+            'engagement': {
+                'retweets': int(rng.paretovariate(1.2)) - 1,
+                'likes': int(rng.paretovariate(1.0)) - 1,
+                'replies': int(rng.paretovariate(1.5)) - 1,
+                'quotes': int(rng.paretovariate(2.0)) - 1
+            },
+            'metadata': {
+                'is_retweet': rng.random() < 0.15,
+                'is_reply': text.startswith('@'),
+                'has_hashtags': '#' in text,
+                'has_mentions': '@' in text
+            }
+        }
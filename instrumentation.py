@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+运行时延迟直方图与Prometheus导出
+管理器的公开方法和存储命令各自记录HDR式对数-线性直方图：每个2的幂区间再分SUB_BUCKETS个
+等宽子桶，相对误差不超过1/SUB_BUCKETS，记录一次只需几次整数运算和一次列表自增，可常驻生产环境。
+导出时按固定的秒级边界折算为Prometheus histogram，另附错误计数和管道命令计数。
+
+用法:
+    instrumentation = Instrumentation()
+    manager = SOCKS5ProxyManager(instrumentation=instrumentation)
+    server = await instrumentation.serve(port=9108)  # GET /metrics
+    print(instrumentation.render())
+"""
+
+import asyncio
+import bisect
+import functools
+import itertools
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 每个2的幂区间的子桶数（2**SUB_BUCKET_BITS），相对误差约3%
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# 可记录的最大耗时约73分钟，超出的记入最后一个桶
+MAX_TRACKABLE_NS = 1 << 42
+
+# 导出给Prometheus的桶边界（秒）
+DEFAULT_BOUNDARIES = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+perf_counter_ns = time.perf_counter_ns
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+def _bucket_bounds(index: int) -> Tuple[int, int]:
+    """桶覆盖的耗时区间[lower, upper)，单位纳秒"""
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = index - (shift << SUB_BUCKET_BITS)
+    return mantissa << shift, (mantissa + 1) << shift
+
+BUCKET_COUNT = _bucket_index(MAX_TRACKABLE_NS - 1) + 1
+BUCKET_LOWER_BOUNDS = [_bucket_bounds(index)[0] for index in range(BUCKET_COUNT)]
+
+class LatencyHistogram:
+    """纳秒耗时的对数-线性直方图，另记调用数、错误数和总耗时"""
+
+    __slots__ = ('counts', 'count', 'errors', 'total_ns', 'max_ns')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, elapsed_ns: int):
+        if elapsed_ns >= MAX_TRACKABLE_NS:
+            elapsed_ns = MAX_TRACKABLE_NS - 1
+        if elapsed_ns < 2 * SUB_BUCKETS:
+            self.counts[elapsed_ns] += 1
+        else:
+            shift = elapsed_ns.bit_length() - SUB_BUCKET_BITS - 1
+            self.counts[(shift << SUB_BUCKET_BITS) + (elapsed_ns >> shift)] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    def percentile(self, pct: float) -> float:
+        """第pct百分位耗时（秒），取所在桶的中点"""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(pct / 100 * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                lower, upper = _bucket_bounds(index)
+                return min((lower + upper - 1) / 2, self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+    def cumulative(self, boundaries: Iterable[float]) -> List[int]:
+        """各边界（秒）以下的累计次数；桶按下界归入，边界附近的误差不超过一个子桶"""
+        totals = list(itertools.accumulate(self.counts))
+        result = []
+        for boundary in boundaries:
+            end = bisect.bisect_right(BUCKET_LOWER_BOUNDS, boundary * 1e9)
+            result.append(totals[end - 1] if end else 0)
+        return result
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'average': self.total_ns / self.count / 1e9 if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max_ns / 1e9
+        }
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Instrumentation:
+    """延迟直方图注册表
+
+    两类序列：pool_operation_duration_seconds{component,operation}记录管理器公开方法，
+    pool_storage_command_duration_seconds{command}记录存储命令（管道整体记为command="pipeline"）。
+    """
+
+    OPERATION = 'pool_operation'
+    STORAGE = 'pool_storage_command'
+    HELP = {
+        OPERATION: 'Latency of public pool manager methods.',
+        STORAGE: 'Latency of storage commands; pipelines are timed as a whole.',
+    }
+
+    def __init__(self, boundaries: Tuple[float, ...] = DEFAULT_BOUNDARIES):
+        self.boundaries = boundaries
+        self.logger = logging.getLogger(__name__)
+        self._series: Dict[str, Dict[Tuple[Tuple[str, str], ...], LatencyHistogram]] = {
+            self.OPERATION: {}, self.STORAGE: {}
+        }
+        # 管道中排队执行的命令总数（管道内的命令不单独计时）
+        self.pipelined_commands = 0
+
+    def histogram(self, family: str, **labels) -> LatencyHistogram:
+        key = tuple(sorted(labels.items()))
+        series = self._series[family]
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = LatencyHistogram()
+        return histogram
+
+    def timed(self, method: Callable, histogram: LatencyHistogram) -> Callable:
+        """包装协程函数，记录每次调用的耗时；抛出异常的调用另计错误数"""
+        @functools.wraps(method)
+        async def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                histogram.record(perf_counter_ns() - start)
+        return timed
+
+    def instrument_manager(self, manager, component: str, exclude: Iterable[str] = ()):
+        """在实例上替换全部公开协程方法；run_开头的常驻循环不计"""
+        exclude = set(exclude)
+        for name in dir(type(manager)):
+            if name.startswith(('_', 'run_')) or name in exclude:
+                continue
+            method = getattr(manager, name)
+            if asyncio.iscoroutinefunction(method):
+                setattr(manager, name,
+                        self.timed(method, self.histogram(self.OPERATION, component=component, operation=name)))
+        return manager
+
+    def instrument_storage(self, redis) -> 'InstrumentedStorage':
+        if isinstance(redis, InstrumentedStorage):
+            return redis
+        return InstrumentedStorage(redis, self)
+
+    def summary(self) -> Dict[str, Dict]:
+        """各序列的调用数、错误数和分位数（秒），便于日志输出"""
+        return {
+            f"{family}{_labels(key)}": histogram.summary()
+            for family, series in self._series.items()
+            for key, histogram in sorted(series.items())
+            if histogram.count
+        }
+
+    def render(self) -> str:
+        """Prometheus文本格式（0.0.4）"""
+        lines = []
+        for family, series in self._series.items():
+            name = f'{family}_duration_seconds'
+            lines.append(f'# HELP {name} {self.HELP[family]}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, histogram in sorted(series.items()):
+                for boundary, count in zip(self.boundaries, histogram.cumulative(self.boundaries)):
+                    bucket_labels = _labels(key, 'le="%s"' % _format_value(boundary))
+                    lines.append(f'{name}_bucket{bucket_labels} {count}')
+                bucket_labels = _labels(key, 'le="+Inf"')
+                lines.append(f'{name}_bucket{bucket_labels} {histogram.count}')
+                lines.append(f'{name}_sum{_labels(key)} {_format_value(histogram.total_ns / 1e9)}')
+                lines.append(f'{name}_count{_labels(key)} {histogram.count}')
+
+            name = f'{family}_errors_total'
+            lines.append(f'# HELP {name} Calls that raised an exception.')
+            lines.append(f'# TYPE {name} counter')
+            for key, histogram in sorted(series.items()):
+                lines.append(f'{name}{_labels(key)} {histogram.errors}')
+
+        name = 'pool_storage_pipelined_commands_total'
+        lines.append(f'# HELP {name} Commands executed inside pipelines.')
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name} {self.pipelined_commands}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        """写入文件供node_exporter的textfile收集器读取，先写临时文件再原子替换"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9108) -> asyncio.AbstractServer:
+        """启动只响应GET /metrics的HTTP端点，返回asyncio服务器，调用方负责close()"""
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request_line = await reader.readline()
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                parts = request_line.split()
+                if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                    status, body = b'200 OK', self.render().encode()
+                else:
+                    status, body = b'404 Not Found', b'not found\n'
+                writer.write(b'HTTP/1.1 ' + status + b'\r\n'
+                             b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                             b'Connection: close\r\n\r\n' + body)
+                await writer.drain()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        self.logger.info(f"Metrics endpoint listening on {host}:{server.sockets[0].getsockname()[1]}")
+        return server
+
+class InstrumentedStorage:
+    """包装MockRedis/SQLiteStore/redis客户端，为每个命令记录耗时
+
+    协程命令首次访问时包装并缓存在实例上，之后的访问不再经过__getattr__。
+    管道按整体计时，执行前累计排队的命令数。
+    """
+
+    def __init__(self, redis, instrumentation: Instrumentation):
+        self._redis = redis
+        self._instrumentation = instrumentation
+        self._pipeline_histogram = instrumentation.histogram(Instrumentation.STORAGE, command='pipeline')
+
+    def pipeline(self, transaction: bool = True):
+        pipe = self._redis.pipeline(transaction)
+        execute = pipe.execute
+        histogram = self._pipeline_histogram
+        instrumentation = self._instrumentation
+
+        async def timed_execute(*args, **kwargs):
+            instrumentation.pipelined_commands += len(pipe)
+            start = perf_counter_ns()
+            try:
+                return await execute(*args, **kwargs)
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                histogram.record(perf_counter_ns() - start)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._redis, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        timed = self._instrumentation.timed(
+            attr, self._instrumentation.histogram(Instrumentation.STORAGE, command=name))
+        setattr(self, name, timed)
+        return timed
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+指标写后聚合
+成功/错误先在进程内累积为增量（计数器、EMA响应时间、最近成功时间、连续错误），
+每flush_interval秒或累计flush_events个事件后用一个管道批量写入Redis。
+进程崩溃时最多丢失一个刷新周期内的增量；连续错误在本地实时计算，
+管理器据此立即执行暂停，不等待刷新。
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# 响应时间EMA的新样本权重，与管理器中的 avg * 0.8 + rt * 0.2 一致
+EMA_ALPHA = 0.2
+
+class MetricDelta:
+    """单个资源尚未写入的增量
+
+    连续错误：errors_reset为真时表示期间有过成功，刷新时直接写入errors，否则累加。
+    EMA：k个样本作用后 avg' = avg * ema_factor + ema_sum，可与Redis中的旧值直接合成。
+    """
+
+    __slots__ = ('total', 'successful', 'failed', 'errors', 'errors_reset',
+                 'ema_factor', 'ema_sum', 'last_success', 'events')
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.failed = 0
+        self.errors = 0
+        self.errors_reset = False
+        self.ema_factor = 1.0
+        self.ema_sum = 0.0
+        self.last_success: Optional[datetime] = None
+        self.events = 0
+
+    def merge(self, later: 'MetricDelta'):
+        """把时间上更晚的增量合并进来"""
+        self.total += later.total
+        self.successful += later.successful
+        self.failed += later.failed
+        if later.errors_reset:
+            self.errors = later.errors
+            self.errors_reset = True
+        else:
+            self.errors += later.errors
+        self.ema_sum = self.ema_sum * later.ema_factor + later.ema_sum
+        self.ema_factor *= later.ema_factor
+        if later.last_success:
+            self.last_success = later.last_success
+        self.events += later.events
+
+    def apply(self, metrics):
+        """把增量叠加到从Redis读出的指标对象上（ProxyMetrics或AccountMetrics）"""
+        metrics.total_requests += self.total
+        metrics.successful_requests += self.successful
+        metrics.failed_requests += self.failed
+        metrics.consecutive_errors = self.errors if self.errors_reset else metrics.consecutive_errors + self.errors
+        if self.ema_factor < 1.0 and hasattr(metrics, 'average_response_time'):
+            metrics.average_response_time = metrics.average_response_time * self.ema_factor + self.ema_sum
+        if self.last_success and (not metrics.last_success or self.last_success > metrics.last_success):
+            metrics.last_success = self.last_success
+
+class WriteBehindMetrics:
+    """指标写后聚合器
+
+    key_format为指标哈希键模板，如'proxy:{}:metrics'。on_flush(ids)在每次刷新成功后调用，
+    管理器可借此批量刷新索引。刷新失败时增量并回待写表，下次重试。
+
+    用法:
+        writer = WriteBehindMetrics(redis, 'proxy:{}:metrics', flush_interval=0.1, flush_events=1000)
+        writer.record_success(proxy_id, response_time)
+        await writer.maybe_flush()
+        await writer.close()
+    """
+
+    def __init__(self, redis, key_format: str, flush_interval: float = 0.1, flush_events: int = 1000,
+                 on_flush: Optional[Callable[[List[str]], Awaitable[None]]] = None):
+        self.redis = redis
+        self.key_format = key_format
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.on_flush = on_flush
+        self.logger = logging.getLogger(__name__)
+
+        self._pending: Dict[str, MetricDelta] = {}
+        self._in_flight: Dict[str, MetricDelta] = {}
+        self._events = 0
+        # 本地已知的连续错误数（Redis中的值叠加待写增量），暂停判定用；
+        # 每次刷新后只保留本批写入或仍有待写增量的资源，不随资源总数无限增长
+        self._consecutive: Dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._timer_task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_events = 0
+
+    @property
+    def pending_events(self) -> int:
+        """尚未写入Redis的事件数，即此刻崩溃会丢失的数量"""
+        return self._events
+
+    def record_success(self, resource_id: str, response_time: float = 0.0,
+                       now: Optional[datetime] = None):
+        delta = self._delta(resource_id)
+        delta.total += 1
+        delta.successful += 1
+        delta.errors = 0
+        delta.errors_reset = True
+        delta.last_success = now or datetime.utcnow()
+        if response_time > 0:
+            delta.ema_factor *= 1 - EMA_ALPHA
+            delta.ema_sum = delta.ema_sum * (1 - EMA_ALPHA) + response_time * EMA_ALPHA
+        self._consecutive[resource_id] = 0
+        self._count_event(delta)
+
+    def record_error(self, resource_id: str) -> Optional[int]:
+        """记录一次错误，返回本地连续错误数；尚不知道Redis中的基数时返回None"""
+        delta = self._delta(resource_id)
+        delta.total += 1
+        delta.failed += 1
+        delta.errors += 1
+        self._count_event(delta)
+
+        if resource_id not in self._consecutive:
+            return None
+        self._consecutive[resource_id] += 1
+        return self._consecutive[resource_id]
+
+    def reset_errors(self, resource_id: str):
+        """连续错误已在Redis中直接清零（如恢复暂停的资源），丢弃尚未写入的错误累加"""
+        for batch in (self._in_flight, self._pending):
+            delta = batch.get(resource_id)
+            if delta:
+                delta.errors = 0
+                delta.errors_reset = True
+        self._consecutive[resource_id] = 0
+
+    def overlay(self, resource_id: str, metrics):
+        """把待写和写入中的增量叠加到刚从Redis读出的指标上，并记下连续错误基数"""
+        for batch in (self._in_flight, self._pending):
+            delta = batch.get(resource_id)
+            if delta:
+                delta.apply(metrics)
+        self._consecutive[resource_id] = metrics.consecutive_errors
+        return metrics
+
+    async def maybe_flush(self) -> int:
+        """累计事件数达到flush_events时立即刷新；已有刷新在进行时跳过"""
+        if self._events < self.flush_events or self._flush_lock.locked():
+            return 0
+        try:
+            return await self.flush()
+        except Exception as e:
+            self.logger.error(f"Metric flush failed, will retry: {e}")
+            return 0
+
+    async def flush(self) -> int:
+        """把当前累积的增量写入Redis，返回写入的资源数"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._events = 0
+            self._in_flight = batch
+            try:
+                await self._write(batch)
+            except BaseException:
+                # 增量并回待写表（旧在前），不因一次写入失败丢失
+                for resource_id, delta in batch.items():
+                    later = self._pending.get(resource_id)
+                    if later:
+                        delta.merge(later)
+                    self._pending[resource_id] = delta
+                    self._events += delta.events
+                raise
+            finally:
+                self._in_flight = {}
+
+            self.flushes += 1
+            self.flushed_events += sum(delta.events for delta in batch.values())
+            # 一个刷新周期内没有事件的资源不再保留基数，下次出错时从Redis（或缓存叠加增量）重新读取
+            self._consecutive = {
+                resource_id: errors for resource_id, errors in self._consecutive.items()
+                if resource_id in batch or resource_id in self._pending
+            }
+
+        if self.on_flush:
+            await self.on_flush(list(batch))
+        return len(batch)
+
+    async def run(self):
+        """周期刷新循环，首次记录时自动启动"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Metric flush failed, will retry: {e}")
+
+    async def close(self):
+        """停止周期刷新并写入剩余增量"""
+        if self._timer_task and not self._timer_task.done():
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+        self._timer_task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'pending_events': self._events,
+            'pending_resources': len(self._pending),
+            'flushes': self.flushes,
+            'flushed_events': self.flushed_events
+        }
+
+    def _delta(self, resource_id: str) -> MetricDelta:
+        delta = self._pending.get(resource_id)
+        if delta is None:
+            delta = self._pending[resource_id] = MetricDelta()
+        return delta
+
+    def _count_event(self, delta: MetricDelta):
+        delta.events += 1
+        self._events += 1
+        if self._timer_task is None and self.flush_interval:
+            self._timer_task = asyncio.ensure_future(self.run())
+
+    async def _write(self, batch: Dict[str, MetricDelta]):
+        # EMA需要Redis中的旧均值，有响应时间样本时先读一次（整批一个往返）
+        ema_ids = [resource_id for resource_id, delta in batch.items() if delta.ema_factor < 1.0]
+        averages = {}
+        if ema_ids:
+            pipe = self.redis.pipeline(transaction=False)
+            for resource_id in ema_ids:
+                pipe.hget(self.key_format.format(resource_id), 'average_response_time')
+            averages = dict(zip(ema_ids, await pipe.execute()))
+
+        pipe = self.redis.pipeline()
+        for resource_id, delta in batch.items():
+            key = self.key_format.format(resource_id)
+            if delta.total:
+                pipe.hincrby(key, 'total_requests', delta.total)
+            if delta.successful:
+                pipe.hincrby(key, 'successful_requests', delta.successful)
+            if delta.failed:
+                pipe.hincrby(key, 'failed_requests', delta.failed)
+            if delta.errors and not delta.errors_reset:
+                pipe.hincrby(key, 'consecutive_errors', delta.errors)
+
+            fields = {}
+            if delta.errors_reset:
+                fields['consecutive_errors'] = str(delta.errors)
+            if delta.last_success:
+                fields['last_success'] = delta.last_success.isoformat()
+            if resource_id in averages:
+                current_avg = float(averages[resource_id] or 0.0)
+                fields['average_response_time'] = str(current_avg * delta.ema_factor + delta.ema_sum)
+            if fields:
+                pipe.hset(key, mapping=fields)
+        await pipe.execute()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+模拟Redis管道
+两个管理器示例中的MockRedis共用，接口与redis-py的Pipeline一致
+"""
+
+from typing import List
+
+class MockPipeline:
+    """命令先排队，execute()时一次性按顺序执行并返回结果列表"""
+
+    def __init__(self, redis: 'MockRedis', transaction: bool = True):
+        self.redis = redis
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __getattr__(self, name: str):
+        command = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.command_stack.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def __len__(self) -> int:
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def multi(self):
+        self.transaction = True
+        return self
+
+    def reset(self):
+        self.command_stack = []
+
+    async def execute(self, raise_on_error: bool = True) -> List:
+        stack, self.command_stack = self.command_stack, []
+
+        # MockRedis的命令不会让出事件循环，顺序执行期间不会插入其他协程的命令，
+        # 效果等同于MULTI/EXEC；与Redis一致，单条命令出错不回滚其余命令
+        results = []
+        for command, args, kwargs in stack:
+            try:
+                results.append(await command(*args, **kwargs))
+            except Exception as e:
+                results.append(e)
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+自适应请求节奏控制
+固定的sleep在账号健康时浪费大部分配额，被限流时又退避得不够快。PacingController为每个
+(账号, 操作)维护一个AIMD速率：成功时加性增加，收到429或请求出错时乘性减小，响应变慢时小幅减小；
+响应头x-rate-limit-remaining/reset给出剩余配额时，速率不超过把剩余配额均摊到窗口结束的速率，
+剩余为0时暂停到窗口重置。
+
+与TCP拥塞控制相同，开始时处于慢启动（每次成功增加increase，约每秒翻倍），第一次减速后转为
+加性增加（每次成功增加increase/rate，约每秒增加increase）；同一批在途请求只触发一次减速。
+
+用法:
+    pacing = PacingController()
+    async with pacing.request(account_id, 'SearchTimeline') as call:
+        response = await client.get(...)
+        call.record(response.status_code, response.headers)
+
+    # twscrape的*_raw方法每页产出一个httpx.Response，按页控制并解析出推文
+    async for tweet in pacing.paged(api.search_raw(q, limit=100), lambda rep: parse_tweets(rep.json(), 100),
+                                    'twscrape', 'SearchTimeline', accounts=active_accounts):
+        ...
+
+控制要放在能看到每次请求的状态码和响应头的请求层，即按页而不是按条目。twscrape在QueueClient内部
+为每个查询挑选账号，响应上没有账号标识，因此按整个账号池建一个节奏（accounts为池中活跃账号数）：
+响应头的配额按单个账号计，均摊上限乘以accounts；单个账号配额耗尽时由twscrape锁定该账号，不暂停整个池。
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+class AIMDPacer:
+    """单个(账号, 操作)的请求速率（次/秒）和下一个发送时刻"""
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.05, max_rate: float = 20.0,
+                 increase: float = 1.0, decrease: float = 0.5, latency_target: float = 2.0,
+                 latency_decrease: float = 0.8):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.latency_decrease = latency_decrease
+
+        self.slow_start = True
+        self.next_at = 0.0
+        self.blocked_until = 0.0
+        # 响应头给出的速率上限及其有效期（窗口重置时间）
+        self.ceiling = max_rate
+        self.ceiling_until = 0.0
+        self.last_decrease = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.slow = 0
+
+    def reserve(self, now: float) -> float:
+        """预留下一个发送时刻，返回发送时刻；并发调用方依次排在1/rate间隔之后"""
+        sent_at = max(now, self.next_at, self.blocked_until)
+        self.next_at = sent_at + 1 / self.rate
+        return sent_at
+
+    def on_response(self, now: float, sent_at: float, status: Optional[int] = None,
+                    latency: Optional[float] = None, headers: Optional[Mapping] = None,
+                    error: bool = False, accounts: int = 1):
+        self.requests += 1
+        reset_at = self._apply_headers(now, headers, accounts) if headers else None
+
+        throttled = status == 429
+        slow = latency is not None and latency > self.latency_target
+        if throttled:
+            self.throttled += 1
+            if reset_at is None:
+                # 没有重置时间时至少等一个新的发送间隔
+                self.blocked_until = max(self.blocked_until, now + 1 / max(self.rate * self.decrease, self.min_rate))
+        if error:
+            self.errors += 1
+        if slow:
+            self.slow += 1
+
+        if throttled or error or slow:
+            # 减速之前发出的请求带回的信号属于同一次拥塞，不重复减速
+            if sent_at >= self.last_decrease:
+                factor = self.decrease if throttled or error else self.latency_decrease
+                self.rate = max(self.min_rate, self.rate * factor)
+                self.slow_start = False
+                self.last_decrease = now
+            return
+
+        step = self.increase if self.slow_start else self.increase / self.rate
+        self.rate = min(self.rate + step, self.max_rate)
+        if now < self.ceiling_until and self.rate > self.ceiling:
+            self.rate = self.ceiling
+            self.slow_start = False
+
+    def _apply_headers(self, now: float, headers: Mapping, accounts: int = 1) -> Optional[float]:
+        fields = {key.lower(): value for key, value in headers.items()}
+        try:
+            remaining = int(fields['x-rate-limit-remaining'])
+            reset_at = float(fields['x-rate-limit-reset'])
+        except (KeyError, ValueError):
+            return None
+        if reset_at <= now:
+            return None
+
+        if remaining <= 0 and accounts > 1:
+            # 账号池中只是当前账号耗尽，池内其他账号继续
+            return None
+
+        self.ceiling_until = reset_at
+        if remaining <= 0:
+            self.blocked_until = max(self.blocked_until, reset_at)
+            self.ceiling = self.max_rate
+        else:
+            self.ceiling = max(self.min_rate, remaining * accounts / (reset_at - now))
+        return reset_at
+
+    def summary(self, now: float) -> Dict:
+        return {
+            'rate': self.rate,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'slow': self.slow,
+            'blocked_for': max(0.0, self.blocked_until - now)
+        }
+
+class PacedCall:
+    """request()产出的调用句柄，调用方用record()交回状态码和响应头"""
+
+    __slots__ = ('sent_at', 'status', 'headers')
+
+    def __init__(self, sent_at: float):
+        self.sent_at = sent_at
+        self.status: Optional[int] = None
+        self.headers: Optional[Mapping] = None
+
+    def record(self, status: int, headers: Optional[Mapping] = None):
+        self.status = status
+        self.headers = headers
+
+class PacingController:
+    """按(账号, 操作)懒创建AIMDPacer，所有采集循环共用一个实例
+
+    pacer_options传给每个新建的AIMDPacer；clock为Unix秒，与x-rate-limit-reset同一时钟。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time, **pacer_options):
+        self.clock = clock
+        self.pacer_options = pacer_options
+        self.logger = logging.getLogger(__name__)
+        self._pacers: Dict[Tuple[str, str], AIMDPacer] = {}
+
+    def pacer(self, account_id: str, operation: str) -> AIMDPacer:
+        pacer = self._pacers.get((account_id, operation))
+        if pacer is None:
+            pacer = self._pacers[(account_id, operation)] = AIMDPacer(**self.pacer_options)
+        return pacer
+
+    async def acquire(self, account_id: str, operation: str) -> float:
+        """等到轮到本次请求，返回发送时刻"""
+        now = self.clock()
+        sent_at = self.pacer(account_id, operation).reserve(now)
+        if sent_at > now:
+            await asyncio.sleep(sent_at - now)
+        return sent_at
+
+    def record(self, account_id: str, operation: str, sent_at: float, status: Optional[int] = None,
+               latency: Optional[float] = None, headers: Optional[Mapping] = None, error: bool = False,
+               accounts: int = 1):
+        """交回一次请求的结果；account_id为账号池时accounts为池中活跃账号数"""
+        pacer = self.pacer(account_id, operation)
+        rate = pacer.rate
+        pacer.on_response(self.clock(), sent_at, status, latency, headers, error, accounts)
+        if pacer.rate < rate:
+            self.logger.debug(f"Pacing {account_id}/{operation} down to {pacer.rate:.2f}/s "
+                              f"(status={status}, latency={latency}, error={error})")
+
+    @asynccontextmanager
+    async def request(self, account_id: str, operation: str, accounts: int = 1) -> AsyncIterator[PacedCall]:
+        """按节奏发出一次请求，退出时以耗时和call.record()交回的状态更新速率；抛出异常记为出错"""
+        call = PacedCall(await self.acquire(account_id, operation))
+        try:
+            yield call
+        except Exception:
+            self.record(account_id, operation, call.sent_at, call.status,
+                        self.clock() - call.sent_at, call.headers, error=call.status is None, accounts=accounts)
+            raise
+        self.record(account_id, operation, call.sent_at, call.status, self.clock() - call.sent_at, call.headers,
+                    accounts=accounts)
+
+    async def paced(self, iterator, account_id: str, operation: str, accounts: int = 1) -> AsyncIterator:
+        """按节奏逐条取出异步迭代器的结果，迭代器抛出异常记为出错
+
+        只适用于每个条目对应一次请求的迭代器，如twscrape的search_raw/user_tweets_raw（每页一个
+        httpx.Response）：每条的等待时间作为延迟信号，条目带status_code/headers时一并交回。
+        """
+        iterator = iterator.__aiter__()
+        try:
+            while True:
+                sent_at = await self.acquire(account_id, operation)
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception:
+                    self.record(account_id, operation, sent_at, latency=self.clock() - sent_at, error=True,
+                                accounts=accounts)
+                    raise
+                self.record(account_id, operation, sent_at, getattr(item, 'status_code', None),
+                            self.clock() - sent_at, getattr(item, 'headers', None), accounts=accounts)
+                yield item
+        finally:
+            aclose = getattr(iterator, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+
+    async def paged(self, pages, parse: Callable[[Any], Iterable], account_id: str, operation: str,
+                    accounts: int = 1) -> AsyncIterator:
+        """按页节奏控制原始响应迭代器（每页一次请求），逐条产出parse(response)解析出的条目"""
+        responses = self.paced(pages, account_id, operation, accounts)
+        try:
+            async for response in responses:
+                for item in parse(response):
+                    yield item
+        finally:
+            await responses.aclose()
+
+    def stats(self) -> Dict[str, Dict]:
+        now = self.clock()
+        return {
+            f"{account_id}/{operation}": pacer.summary(now)
+            for (account_id, operation), pacer in sorted(self._pacers.items())
+        }
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+账号-代理配对调度器
+每个账号绑定少量代理（同地区、同服务商优先），一次调用同时租用账号和代理；
+只有绑定的代理退化（被暂停、健康分不达标或超日限额）时才重新绑定，减少账号的IP切换。
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from account_manager_example import SimpleAccountManager, AccountPriority
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyConfig, ProxyLease, ProxyRegion
+
+# 绑定关系的保留时间，与开发文档中的7天绑定期一致
+BINDING_TTL_SECONDS = 7 * 86400
+
+@dataclass
+class PairLease:
+    """账号+代理租约，由PairingScheduler.lease()创建"""
+    account_id: str
+    account: Dict
+    proxy: ProxyLease
+    sticky: bool = True
+    account_error: Optional[str] = None
+
+    @property
+    def proxy_id(self) -> str:
+        return self.proxy.proxy_id
+
+    def fail(self, error: str):
+        """标记代理侧失败（连接错误、超时），释放时记为代理错误"""
+        self.proxy.fail(error)
+
+    def fail_account(self, error: str):
+        """标记账号侧失败（限流、登录失效），释放时记为账号错误"""
+        self.account_error = error
+
+class PairingScheduler:
+    """账号-代理配对调度器
+
+    绑定关系写入Redis哈希account:{id}:proxies（代理ID -> 服务商），内存中保留绑定顺序（首个为主代理）。
+    绑定的代理都在满负荷时临时借用其他代理，不改变绑定。
+    账号地区内没有可选代理时不限地区租用，避免无限等待。
+    """
+
+    def __init__(self, account_manager: SimpleAccountManager, proxy_manager: SOCKS5ProxyManager,
+                 proxies_per_account: int = 2, accounts_per_proxy: int = 4):
+        self.accounts = account_manager
+        self.proxies = proxy_manager
+        self.redis = account_manager.redis
+        self.logger = logging.getLogger(__name__)
+        self.proxies_per_account = proxies_per_account
+        self.accounts_per_proxy = accounts_per_proxy
+
+        self._bindings: Dict[str, List[str]] = {}
+        self._providers: Dict[str, str] = {}
+        self._proxy_accounts = Counter()
+        self._counters = Counter()
+
+    @asynccontextmanager
+    async def lease(self, priority: Optional[AccountPriority] = None, timeout: Optional[float] = None,
+                    operation: Optional[str] = None):
+        """同时租用账号和代理
+
+        没有可用账号时抛出LookupError（指定operation且全部无配额时消息中带最早的窗口重置时间）；
+        代理在timeout秒内无容量时抛出asyncio.TimeoutError。
+        正常退出记为账号和代理成功；抛出异常或调用pair.fail()记为代理错误，
+        账号侧问题用pair.fail_account()标记。
+
+        用法: async with scheduler.lease(priority=AccountPriority.HIGH) as pair: ...
+        """
+        pair = await self.acquire(priority, timeout, operation)
+        outcome = 'success'
+        try:
+            yield pair
+        except Exception as e:
+            pair.fail(f"{type(e).__name__}: {e}")
+            raise
+        except BaseException:
+            outcome = None
+            raise
+        finally:
+            await self.release(pair, outcome)
+
+    async def acquire(self, priority: Optional[AccountPriority] = None, timeout: Optional[float] = None,
+                      operation: Optional[str] = None) -> PairLease:
+        """租用账号和代理，需配合release归还"""
+        account = await self.accounts.get_available_account(priority, operation)
+        if account is None:
+            reset_at = self.accounts.rate_limit_reset_at(operation) if operation else None
+            if reset_at is not None:
+                raise LookupError(f"No account has quota for {operation} until {reset_at:.0f}")
+            raise LookupError("No available account")
+        account_id = account['account_id']
+        bindings = await self._get_bindings(account_id)
+
+        # 依次尝试已绑定的代理，退化的解除绑定
+        for proxy_id in list(bindings):
+            proxy_lease = await self.proxies.try_acquire_lease(proxy_id)
+            if proxy_lease:
+                self._counters['sticky'] += 1
+                return PairLease(account_id, account, proxy_lease)
+            if not await self.proxies.is_proxy_selectable(proxy_id):
+                await self._unbind(account_id, proxy_id)
+                self._counters['rebinds'] += 1
+
+        region = None if account['region'] == 'global' else ProxyRegion(account['region'])
+        if region and not await self.proxies.has_selectable_proxy(region):
+            # 地区过滤是硬条件，地区内没有可选代理时按地区排队会一直等待
+            self._counters['region_fallbacks'] += 1
+            region = None
+        preferred_providers = {self._providers.get(proxy_id) for proxy_id in bindings}
+
+        def prefer(config: ProxyConfig) -> int:
+            rank = 0
+            if self._proxy_accounts[config.proxy_id] >= self.accounts_per_proxy:
+                rank += 2
+            if preferred_providers and config.provider not in preferred_providers:
+                rank += 1
+            return rank
+
+        try:
+            proxy_lease = await self.proxies.acquire_lease(region, timeout, prefer)
+        except BaseException:
+            # 账号已记录使用但本次未能配对
+            self._counters['no_proxy'] += 1
+            self.accounts.release_account(account_id)
+            raise
+
+        # 绑定数已满（绑定的代理都在忙）时只临时借用
+        if len(bindings) < self.proxies_per_account and proxy_lease.proxy_id not in bindings:
+            await self._bind(account_id, proxy_lease.proxy_id, proxy_lease.proxy['provider'])
+            self._counters['binds'] += 1
+            return PairLease(account_id, account, proxy_lease)
+
+        self._counters['borrowed'] += 1
+        return PairLease(account_id, account, proxy_lease, sticky=False)
+
+    async def release(self, pair: PairLease, outcome: Optional[str] = 'success'):
+        """归还租约：代理结果交给代理管理器，账号按fail_account或成功记录"""
+        try:
+            await self.proxies.release_lease(pair.proxy, outcome)
+        finally:
+            if pair.account_error:
+                await self.accounts.mark_account_error(pair.account_id, pair.account_error)
+            elif outcome == 'success' and not pair.proxy.error:
+                await self.accounts.update_account_success(pair.account_id)
+            else:
+                self.accounts.release_account(pair.account_id)
+
+    def stats(self) -> Dict:
+        """绑定数量、粘滞命中率和重新绑定次数"""
+        leases = self._counters['sticky'] + self._counters['binds'] + self._counters['borrowed']
+        return {
+            'bound_accounts': len(self._bindings),
+            'bindings': sum(len(bindings) for bindings in self._bindings.values()),
+            'sticky_rate': self._counters['sticky'] / leases if leases else 0.0,
+            **{name: self._counters[name] for name in ('sticky', 'binds', 'rebinds', 'borrowed',
+                                                           'region_fallbacks', 'no_proxy')}
+        }
+
+    async def _get_bindings(self, account_id: str) -> List[str]:
+        bindings = self._bindings.get(account_id)
+        if bindings is None:
+            providers = {
+                (key.decode() if isinstance(key, bytes) else key):
+                    (value.decode() if isinstance(value, bytes) else value)
+                for key, value in (await self.redis.hgetall(f'account:{account_id}:proxies')).items()
+            }
+            bindings = self._bindings[account_id] = sorted(providers)
+            for proxy_id in bindings:
+                self._providers[proxy_id] = providers[proxy_id]
+                self._proxy_accounts[proxy_id] += 1
+        return bindings
+
+    async def _bind(self, account_id: str, proxy_id: str, provider: str):
+        key = f'account:{account_id}:proxies'
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={proxy_id: provider})
+        pipe.expire(key, BINDING_TTL_SECONDS)
+        await pipe.execute()
+
+        self._bindings[account_id].append(proxy_id)
+        self._providers[proxy_id] = provider
+        self._proxy_accounts[proxy_id] += 1
+        self.logger.debug(f"Account {account_id} bound to proxy {proxy_id}")
+
+    async def _unbind(self, account_id: str, proxy_id: str):
+        await self.redis.hdel(f'account:{account_id}:proxies', proxy_id)
+
+        self._bindings[account_id].remove(proxy_id)
+        self._proxy_accounts[proxy_id] -= 1
+        if self._proxy_accounts[proxy_id] <= 0:
+            del self._proxy_accounts[proxy_id]
+        self.logger.info(f"Account {account_id} unbound from degraded proxy {proxy_id}")
+
+# 使用示例
+async def example_usage():
+    """配对调度器使用示例"""
+    logging.basicConfig(level=logging.INFO)
+
+    account_manager = SimpleAccountManager()
+    proxy_manager = SOCKS5ProxyManager()
+    scheduler = PairingScheduler(account_manager, proxy_manager)
+
+    await account_manager.add_account("test_user1", "test1@example.com", AccountPriority.HIGH, region='us')
+    await account_manager.add_account("test_user2", "test2@example.com", AccountPriority.NORMAL)
+
+    # 示例中直接写入代理配置，跳过连接测试
+    for i, region in enumerate([ProxyRegion.US, ProxyRegion.US, ProxyRegion.EU]):
+        config = ProxyConfig(
+            proxy_id=f"socks5_10.0.0.{i}_1080",
+            host=f"10.0.0.{i}",
+            port=1080,
+            username=f"user{i}",
+            password=f"pass{i}",
+            region=region,
+            provider="ProxyProvider1"
+        )
+        await proxy_manager._save_proxy_config(config)
+        await proxy_manager._initialize_proxy_metrics(config.proxy_id)
+
+    print("=== 账号-代理配对演示 ===")
+    for _ in range(4):
+        async with scheduler.lease(timeout=5) as pair:
+            print(f"账号 {pair.account['username']} -> 代理 {pair.proxy_id} (地区 {pair.proxy.proxy['region']})")
+
+    print(f"配对统计: {scheduler.stats()}")
+    await proxy_manager.close()
+
+if __name__ == "__main__":
+    asyncio.run(example_usage())
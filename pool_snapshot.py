@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+资源池二进制快照与热启动
+冷启动时逐个add_proxy_batch/add_account会重新测试每个代理、逐条写入账号，数万条目需要几分钟。
+快照把配置、指标和状态（状态集合与评分/优先级索引均由此导出）写成定长记录，
+启动时内存映射读取，分块管道批量写回Redis并直接填充管理器的缓存、索引和统计，
+代理健康复查转入后台，进程在一秒内即可开始选择。
+
+文件布局（小端）：
+    表头（64字节）：魔数、格式版本、字符串数、代理数、账号数、生成时间、用量日、字符串区长度、CRC32
+    字符串表：(n+1)个u32偏移量 + UTF-8字符串区，所有ID、主机、凭据、状态值去重后只存一份，8字节对齐
+    代理记录：PROXY_RECORD定长记录
+    账号记录：ACCOUNT_RECORD定长记录
+时间字段存为UTC微秒数，0表示空。日用量只在快照与启动属于同一用量日时恢复。
+"""
+
+import asyncio
+import gc
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from account_manager_example import (
+    AccountConfig, AccountMetrics, AccountPriority, AccountStatus, SimpleAccountManager
+)
+from socks5_proxy_manager import (
+    ProxyConfig, ProxyMetrics, ProxyRegion, ProxyStatus, SOCKS5ProxyManager, USAGE_DAY_SECONDS
+)
+
+MAGIC = b'POOLSNP1'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIIIIdqII')
+HEADER_SIZE = 64
+
+# 字符串下标：proxy_id、host、username、password、provider、region、status；端口；
+# max_concurrent、daily_limit；总请求、成功、失败；连续错误、日用量；平均响应时间；最近使用、最近成功
+PROXY_RECORD = struct.Struct('<7IH2x2I3q2Id2q')
+
+# 字符串下标：account_id、username、email、status、priority、region；daily_limit、max_consecutive_errors；
+# 总请求、成功、失败；连续错误、日用量；最近使用、最近成功
+ACCOUNT_RECORD = struct.Struct('<6I2I3q2I2q')
+
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+class PoolSnapshot(NamedTuple):
+    created_at: float
+    usage_day: int
+    proxies: List[Tuple[ProxyConfig, ProxyMetrics]]
+    accounts: List[Tuple[AccountConfig, AccountMetrics]]
+
+def _to_micros(value: Optional[datetime]) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1) if value else 0
+
+def _from_micros(value: int) -> Optional[datetime]:
+    return EPOCH + timedelta(microseconds=value) if value else None
+
+class _StringTable:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.encoded: List[bytes] = []
+
+    def add(self, value: str) -> int:
+        index = self.index.get(value)
+        if index is None:
+            index = self.index[value] = len(self.encoded)
+            self.encoded.append(value.encode())
+        return index
+
+    def pack(self) -> Tuple[bytes, int]:
+        """返回偏移量表+字符串区（补齐到8字节）和字符串区长度"""
+        offsets = [0]
+        for encoded in self.encoded:
+            offsets.append(offsets[-1] + len(encoded))
+        blob = b''.join(self.encoded)
+        packed = struct.pack(f'<{len(offsets)}I', *offsets) + blob
+        return packed + b'\0' * (-len(packed) % 8), len(blob)
+
+def encode_snapshot(proxies: List[Tuple[ProxyConfig, ProxyMetrics]],
+                    accounts: List[Tuple[AccountConfig, AccountMetrics]],
+                    usage_day: int, created_at: Optional[float] = None) -> bytes:
+    strings = _StringTable()
+    add = strings.add
+
+    proxy_records = bytearray(PROXY_RECORD.size * len(proxies))
+    for i, (config, metrics) in enumerate(proxies):
+        PROXY_RECORD.pack_into(
+            proxy_records, i * PROXY_RECORD.size,
+            add(config.proxy_id), add(config.host), add(config.username), add(config.password),
+            add(config.provider), add(config.region.value), add(config.status.value),
+            config.port, config.max_concurrent, config.daily_limit,
+            metrics.total_requests, metrics.successful_requests, metrics.failed_requests,
+            metrics.consecutive_errors, metrics.daily_usage, metrics.average_response_time,
+            _to_micros(metrics.last_used), _to_micros(metrics.last_success)
+        )
+
+    account_records = bytearray(ACCOUNT_RECORD.size * len(accounts))
+    for i, (config, metrics) in enumerate(accounts):
+        ACCOUNT_RECORD.pack_into(
+            account_records, i * ACCOUNT_RECORD.size,
+            add(config.account_id), add(config.username), add(config.email), add(config.status.value),
+            add(config.priority.value), add(config.region), config.daily_limit, config.max_consecutive_errors,
+            metrics.total_requests, metrics.successful_requests, metrics.failed_requests,
+            metrics.consecutive_errors, metrics.daily_usage,
+            _to_micros(metrics.last_used), _to_micros(metrics.last_success)
+        )
+
+    string_section, blob_size = strings.pack()
+    body = b''.join((string_section, proxy_records, account_records))
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(strings.encoded), len(proxies), len(accounts),
+        time.time() if created_at is None else created_at, usage_day, blob_size, zlib.crc32(body)
+    )
+    return header.ljust(HEADER_SIZE, b'\0') + body
+
+def decode_snapshot(buffer, usage_day: Optional[int] = None) -> PoolSnapshot:
+    """从bytes或内存映射解码快照；usage_day与快照的用量日不同时日用量按0恢复
+
+    记录按偏移量直接从缓冲区解包，不保留子视图，解码失败时内存映射也能正常关闭。
+    """
+    with memoryview(buffer) as view:
+        if len(view) < HEADER_SIZE:
+            raise ValueError("Snapshot truncated")
+        (magic, version, string_count, proxy_count, account_count,
+         created_at, snapshot_day, blob_size, checksum) = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a pool snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        if zlib.crc32(view[HEADER_SIZE:]) != checksum:
+            raise ValueError("Snapshot checksum mismatch")
+
+        offsets = struct.unpack_from(f'<{string_count + 1}I', view, HEADER_SIZE)
+        blob_start = HEADER_SIZE + 4 * (string_count + 1)
+        blob = view[blob_start:blob_start + blob_size].tobytes()
+        strings = [blob[offsets[i]:offsets[i + 1]].decode() for i in range(string_count)]
+
+        proxy_start = blob_start + blob_size + (-(blob_start + blob_size) % 8)
+        account_start = proxy_start + proxy_count * PROXY_RECORD.size
+        if account_start + account_count * ACCOUNT_RECORD.size != len(view):
+            raise ValueError("Snapshot truncated")
+        keep_usage = usage_day is None or usage_day == snapshot_day
+
+        regions = {region.value: region for region in ProxyRegion}
+        proxy_statuses = {status.value: status for status in ProxyStatus}
+        unpack = PROXY_RECORD.unpack_from
+        proxies = []
+        for offset in range(proxy_start, account_start, PROXY_RECORD.size):
+            (proxy_id, host, username, password, provider, region, status, port,
+             max_concurrent, daily_limit, total, successful, failed, consecutive, daily_usage,
+             average_response_time, last_used, last_success) = unpack(view, offset)
+            proxies.append((
+                ProxyConfig(strings[proxy_id], strings[host], port, strings[username], strings[password],
+                            regions[strings[region]], proxy_statuses[strings[status]],
+                            max_concurrent, daily_limit, strings[provider]),
+                ProxyMetrics(total, successful, failed, consecutive, daily_usage if keep_usage else 0,
+                             average_response_time, _from_micros(last_used), _from_micros(last_success))
+            ))
+
+        priorities = {priority.value: priority for priority in AccountPriority}
+        account_statuses = {status.value: status for status in AccountStatus}
+        unpack = ACCOUNT_RECORD.unpack_from
+        accounts = []
+        for offset in range(account_start, len(view), ACCOUNT_RECORD.size):
+            (account_id, username, email, status, priority, region, daily_limit, max_consecutive_errors,
+             total, successful, failed, consecutive, daily_usage, last_used, last_success) = unpack(view, offset)
+            accounts.append((
+                AccountConfig(strings[account_id], strings[username], strings[email],
+                              account_statuses[strings[status]], priorities[strings[priority]],
+                              strings[region], daily_limit, max_consecutive_errors),
+                AccountMetrics(total, successful, failed, consecutive, daily_usage if keep_usage else 0,
+                               _from_micros(last_used), _from_micros(last_success))
+            ))
+    return PoolSnapshot(created_at, snapshot_day, proxies, accounts)
+
+def read_snapshot(path: str, usage_day: Optional[int] = None) -> PoolSnapshot:
+    """内存映射读取快照文件"""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_snapshot(mapped, usage_day)
+
+def _current_usage_day(*managers) -> int:
+    for manager in managers:
+        if manager is not None:
+            return int(manager.clock() // USAGE_DAY_SECONDS)
+    return int(time.time() // USAGE_DAY_SECONDS)
+
+def _write_atomic(path: str, data: bytes):
+    # 先写临时文件再原子替换，崩溃时保留上一份完整快照
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def _members(redis, keys: List[str]) -> List[str]:
+    """一次往返取回多个状态集合的成员，去重并保持顺序"""
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.smembers(key)
+    members = {}
+    for result in await pipe.execute():
+        for member in result:
+            members[member.decode() if isinstance(member, bytes) else member] = None
+    return list(members)
+
+async def _proxy_ids(manager: SOCKS5ProxyManager) -> List[str]:
+    return await _members(manager.redis, [f'proxies:{status.value}' for status in ProxyStatus])
+
+async def _account_ids(manager: SimpleAccountManager) -> List[str]:
+    return await _members(manager.redis, [f'accounts:{status.value}' for status in AccountStatus])
+
+async def load_proxy_records(manager: SOCKS5ProxyManager, proxy_ids: Optional[List[str]] = None,
+                             chunk_size: int = 1000) -> List[Tuple[ProxyConfig, ProxyMetrics]]:
+    """分块管道从Redis读取代理配置和指标，每块一个往返"""
+    if manager.metric_writer:
+        await manager.metric_writer.flush()
+    if proxy_ids is None:
+        proxy_ids = await _proxy_ids(manager)
+
+    records = []
+    for chunk in _chunks(proxy_ids, chunk_size):
+        pipe = manager.redis.pipeline(transaction=False)
+        for proxy_id in chunk:
+            pipe.hgetall(f'proxy:{proxy_id}:config')
+            pipe.hgetall(f'proxy:{proxy_id}:metrics')
+            pipe.get(manager._usage_keys(proxy_id)[0])
+        results = await pipe.execute()
+
+        for i in range(len(chunk)):
+            config_data, metrics_data, daily_usage = results[3 * i:3 * i + 3]
+            config = manager._parse_proxy_config(config_data)
+            if config is None:
+                continue
+            if metrics_data:
+                metrics_data['daily_usage'] = daily_usage or 0
+            records.append((config, manager._parse_proxy_metrics(metrics_data)))
+    return records
+
+async def load_account_records(manager: SimpleAccountManager, account_ids: Optional[List[str]] = None,
+                               chunk_size: int = 1000) -> List[Tuple[AccountConfig, AccountMetrics]]:
+    """分块管道从Redis读取账号配置和指标，每块一个往返"""
+    if manager.metric_writer:
+        await manager.metric_writer.flush()
+    if account_ids is None:
+        account_ids = await _account_ids(manager)
+
+    records = []
+    for chunk in _chunks(account_ids, chunk_size):
+        pipe = manager.redis.pipeline(transaction=False)
+        for account_id in chunk:
+            pipe.hgetall(f'account:{account_id}:config')
+            pipe.hgetall(f'account:{account_id}:metrics')
+            pipe.get(manager._usage_keys(account_id)[0])
+        results = await pipe.execute()
+
+        for i in range(len(chunk)):
+            config_data, metrics_data, daily_usage = results[3 * i:3 * i + 3]
+            config = manager._parse_account_config(config_data)
+            if config is not None:
+                records.append((config, manager._parse_account_metrics(metrics_data, daily_usage)))
+    return records
+
+async def dump_snapshot(path: str, proxy_manager: Optional[SOCKS5ProxyManager] = None,
+                        account_manager: Optional[SimpleAccountManager] = None,
+                        chunk_size: int = 1000) -> Dict:
+    """把Redis中的代理和账号写成快照文件（原子替换），返回条目数、字节数和耗时"""
+    started = time.perf_counter()
+    proxies = await load_proxy_records(proxy_manager, chunk_size=chunk_size) if proxy_manager else []
+    accounts = await load_account_records(account_manager, chunk_size=chunk_size) if account_manager else []
+
+    data = encode_snapshot(proxies, accounts, _current_usage_day(proxy_manager, account_manager))
+    await asyncio.get_running_loop().run_in_executor(None, _write_atomic, path, data)
+
+    return {
+        'proxies': len(proxies),
+        'accounts': len(accounts),
+        'bytes': len(data),
+        'seconds': time.perf_counter() - started
+    }
+
+async def run_periodic_snapshots(path: str, proxy_manager: Optional[SOCKS5ProxyManager] = None,
+                                 account_manager: Optional[SimpleAccountManager] = None,
+                                 interval: float = 300.0):
+    """周期快照任务，用asyncio.create_task启动"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await dump_snapshot(path, proxy_manager, account_manager)
+        except Exception as e:
+            logger.error(f"Pool snapshot failed: {e}")
+
+def _metrics_mapping(metrics) -> Dict:
+    # 日用量存放在分桶计数器中
+    mapping = {}
+    for key, value in vars(metrics).items():
+        if key == 'daily_usage':
+            continue
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif value is None:
+            value = ''
+        mapping[key] = str(value)
+    return mapping
+
+def _queue_status_sets(pipe, prefix: str, statuses, members_by_status: Dict):
+    """按状态整组写入状态集合，并从其他状态集合中移除，每个集合一条命令"""
+    for status, members in members_by_status.items():
+        for other in statuses:
+            if other != status:
+                pipe.srem(f'{prefix}:{other.value}', *members)
+        pipe.sadd(f'{prefix}:{status.value}', *members)
+
+async def _restore_proxies(manager: SOCKS5ProxyManager, records: List[Tuple[ProxyConfig, ProxyMetrics]],
+                           chunk_size: int):
+    for chunk in _chunks(records, chunk_size):
+        pipe = manager.redis.pipeline()
+        by_status = defaultdict(list)
+        for config, metrics in chunk:
+            config_dict = dict(vars(config))
+            config_dict['region'] = config.region.value
+            config_dict['status'] = config.status.value
+            pipe.hset(f'proxy:{config.proxy_id}:config', mapping=config_dict)
+            pipe.hset(f'proxy:{config.proxy_id}:metrics', mapping=_metrics_mapping(metrics))
+            if metrics.daily_usage:
+                pipe.set(manager._usage_keys(config.proxy_id)[0], str(metrics.daily_usage),
+                         ex=2 * USAGE_DAY_SECONDS)
+            by_status[config.status].append(config.proxy_id)
+        pipe.sadd('proxies:all', *(config.proxy_id for config, _ in chunk))
+        _queue_status_sets(pipe, 'proxies', ProxyStatus, by_status)
+        await pipe.execute()
+
+async def _restore_accounts(manager: SimpleAccountManager, records: List[Tuple[AccountConfig, AccountMetrics]],
+                            chunk_size: int):
+    for chunk in _chunks(records, chunk_size):
+        pipe = manager.redis.pipeline()
+        by_status = defaultdict(list)
+        for config, metrics in chunk:
+            config_dict = dict(vars(config))
+            config_dict['status'] = config.status.value
+            config_dict['priority'] = config.priority.value
+            pipe.hset(f'account:{config.account_id}:config', mapping=config_dict)
+            pipe.hset(f'account:{config.account_id}:metrics', mapping=_metrics_mapping(metrics))
+            if metrics.daily_usage:
+                pipe.set(manager._usage_keys(config.account_id)[0], str(metrics.daily_usage),
+                         ex=2 * USAGE_DAY_SECONDS)
+            by_status[config.status].append(config.account_id)
+        _queue_status_sets(pipe, 'accounts', AccountStatus, by_status)
+        await pipe.execute()
+
+async def warm_start(path: str, proxy_manager: Optional[SOCKS5ProxyManager] = None,
+                     account_manager: Optional[SimpleAccountManager] = None,
+                     restore: Optional[bool] = None, recheck: bool = True,
+                     recheck_concurrency: int = 100, chunk_size: int = 1000) -> Dict:
+    """从快照热启动管理器
+
+    restore为None时按Redis是否为空决定：为空（如MockRedis或新实例）则把快照批量写回Redis；
+    已有数据时以Redis为准，分块管道批量读取，快照不覆盖。两种情况都直接填充缓存、索引和统计，
+    不逐个测试。recheck为真时活跃代理的健康复查在后台进行，返回结果中的'recheck'为该任务。
+    Redis为空且快照文件不存在时抛出FileNotFoundError，调用方退回冷启动。
+    """
+    started = time.perf_counter()
+    result = {'proxies': 0, 'accounts': 0, 'restored': False, 'recheck': None}
+
+    # 一次性创建大量长寿命对象，期间暂停分代回收，否则回收遍历的对象数随载入量增长
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        proxy_ids = await _proxy_ids(proxy_manager) if proxy_manager else []
+        account_ids = await _account_ids(account_manager) if account_manager else []
+        if restore is None:
+            restore = not proxy_ids and not account_ids
+
+        if restore:
+            snapshot = read_snapshot(path, _current_usage_day(proxy_manager, account_manager))
+            proxies, accounts = snapshot.proxies, snapshot.accounts
+            if proxy_manager:
+                await _restore_proxies(proxy_manager, proxies, chunk_size)
+            if account_manager:
+                await _restore_accounts(account_manager, accounts, chunk_size)
+            result['restored'] = True
+            result['snapshot_age'] = time.time() - snapshot.created_at
+        else:
+            proxies = await load_proxy_records(proxy_manager, proxy_ids, chunk_size) if proxy_manager else []
+            accounts = await load_account_records(account_manager, account_ids, chunk_size) if account_manager else []
+
+        if proxy_manager:
+            proxy_manager.prime_from_snapshot(proxies)
+            result['proxies'] = len(proxies)
+        if account_manager:
+            account_manager.prime_from_snapshot(accounts)
+            result['accounts'] = len(accounts)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    result['seconds'] = time.perf_counter() - started
+
+    if proxy_manager and recheck:
+        active = [config.proxy_id for config, _ in proxies if config.status == ProxyStatus.ACTIVE]
+        result['recheck'] = asyncio.ensure_future(
+            proxy_manager.recheck_proxies(active, concurrency=recheck_concurrency))
+
+    logger.info(f"Warm start: {result['proxies']} proxies, {result['accounts']} accounts "
+                f"in {result['seconds']:.3f}s (restored={result['restored']})")
+    return result
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+资源池运行聚合值
+代理和账号管理器共用：按状态计数，对活跃资源按分组计数并累加各数值字段，
+统计查询为常数时间。
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List
+
+class PoolStatistics:
+    """资源池运行聚合值
+
+    记录每个资源当前对聚合值的贡献，状态或指标变化时先减旧值再加新值。
+    totals为需要在活跃资源上累加的数值字段，如代理的('health', 'usage', 'response_time')。
+    """
+
+    def __init__(self, active_status: str, totals: Iterable[str] = ('health', 'usage')):
+        self.active_status = active_status
+        self.fields = ('status', 'group') + tuple(totals)
+        self.status_counts = Counter()
+        self.group_counts = Counter()
+        self.totals: Dict[str, float] = {field: 0 for field in self.fields[2:]}
+        self._entries: Dict[str, List] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def update(self, key: str, **changes):
+        """更新资源的部分字段；未跟踪的资源需带status才会加入"""
+        entry = self._entries.get(key)
+        if entry is None:
+            if changes.get('status') is None:
+                return
+            entry = self._entries[key] = [None, None] + [0] * len(self.totals)
+        else:
+            self._apply(entry, -1)
+
+        for i, field in enumerate(self.fields):
+            if changes.get(field) is not None:
+                entry[i] = changes[field]
+        self._apply(entry, 1)
+
+    def remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._apply(entry, -1)
+
+    def count(self, status: str) -> int:
+        return self.status_counts[status]
+
+    def average(self, field: str) -> float:
+        """活跃资源上的字段平均值"""
+        active = self.count(self.active_status)
+        return self.totals[field] / active if active > 0 else 0.0
+
+    def group_distribution(self) -> Dict[str, int]:
+        return {group: n for group, n in self.group_counts.items() if n > 0}
+
+    def _apply(self, entry: List, sign: int):
+        status, group = entry[0], entry[1]
+        self.status_counts[status] += sign
+        if status != self.active_status:
+            return
+
+        self.group_counts[group] += sign
+        for field, value in zip(self.fields[2:], entry[2:]):
+            self.totals[field] += sign * value
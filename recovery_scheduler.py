@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+暂停资源自动恢复
+账号和代理被暂停后进入冷却，冷却时间按重复暂停次数指数增长；到期后先做一次
+廉价探测，通过才移回活跃集合，否则以下一级冷却时间重新排期。
+冷却计时使用分层时间轮，十万级待恢复资源下每个计时器的插入、取消和到期均为O(1)。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from account_manager_example import SimpleAccountManager, AccountStatus
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyStatus
+
+class HierarchicalTimingWheel:
+    """分层时间轮
+
+    第0层每格一个tick，第l层每格slots**l个tick；计时器按剩余时间放入对应层级，
+    上层格子到期时整体下放到下层。超出全部层级范围的计时器暂存在溢出表中，
+    顶层转完一圈时重新放入。取消为惰性删除：只移除登记，格子中的旧条目到期时跳过。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, start: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = int(start // tick)
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._wheels: List[List[List[Tuple[Hashable, int, int]]]] = [
+            [[] for _ in range(slots)] for _ in range(levels)
+        ]
+        self._overflow: List[Tuple[Hashable, int, int]] = []
+        self._timers: Dict[Hashable, Tuple[int, int]] = {}
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def schedule(self, key: Hashable, deadline: float):
+        """在deadline（与start同一时钟）到期，已有同名计时器时替换"""
+        self._generation += 1
+        deadline_tick = max(int(-(-deadline // self.tick)), self.current + 1)
+        self._timers[key] = (deadline_tick, self._generation)
+        self._place((key, deadline_tick, self._generation))
+
+    def cancel(self, key: Hashable) -> bool:
+        return self._timers.pop(key, None) is not None
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        timer = self._timers.get(key)
+        return timer[0] * self.tick if timer else None
+
+    def advance(self, now: float) -> List[Hashable]:
+        """推进到now，返回期间到期的计时器（按到期先后）"""
+        target = int(now // self.tick)
+        expired = []
+        while self.current < target:
+            if not self._timers:
+                self.current = target
+                break
+            self.current += 1
+            self._cascade()
+
+            bucket = self._wheels[0][self.current % self.slots]
+            self._wheels[0][self.current % self.slots] = []
+            for key, deadline_tick, generation in bucket:
+                if self._timers.get(key) == (deadline_tick, generation):
+                    del self._timers[key]
+                    expired.append(key)
+        return expired
+
+    def _place(self, entry: Tuple[Hashable, int, int]):
+        delta = entry[1] - self.current
+        for level in range(self.levels):
+            if delta < self._spans[level + 1]:
+                self._wheels[level][entry[1] // self._spans[level] % self.slots].append(entry)
+                return
+        self._overflow.append(entry)
+
+    def _cascade(self):
+        if self.current % self._spans[self.levels] == 0 and self._overflow:
+            overflow, self._overflow = self._overflow, []
+            for entry in overflow:
+                self._place(entry)
+
+        # 从高层往低层下放，保证下放到第0层的条目在本tick内处理
+        for level in range(self.levels - 1, 0, -1):
+            if self.current % self._spans[level] == 0:
+                index = self.current // self._spans[level] % self.slots
+                bucket, self._wheels[level][index] = self._wheels[level][index], []
+                for entry in bucket:
+                    if self._timers.get(entry[0]) == entry[1:]:
+                        self._place(entry)
+
+class RecoveryScheduler:
+    """暂停资源的冷却恢复调度器
+
+    重复暂停次数记在带过期时间的计数键中，offense_ttl内没有再次暂停则退避清零。
+    代理用一次测试请求探测；账号管理器没有网络客户端，管理账号时必须传入account_probe
+    （如用账号发一次轻量请求），仅在账号仍处于暂停状态时调用。
+
+    用法:
+        scheduler = RecoveryScheduler(account_manager, proxy_manager, account_probe=check_account)
+        await scheduler.recover_existing()
+        asyncio.create_task(scheduler.run())
+    """
+
+    def __init__(self, account_manager: Optional[SimpleAccountManager] = None,
+                 proxy_manager: Optional[SOCKS5ProxyManager] = None,
+                 base_cooldown: float = 300.0, max_cooldown: float = 86400.0, backoff: float = 2.0,
+                 offense_ttl: int = 86400, tick: float = 1.0, probe_concurrency: int = 50,
+                 account_probe: Optional[Callable[[str], Awaitable[bool]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.accounts = account_manager
+        self.proxies = proxy_manager
+        self.logger = logging.getLogger(__name__)
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.backoff = backoff
+        self.offense_ttl = offense_ttl
+        self.probe_concurrency = probe_concurrency
+        if account_manager and account_probe is None:
+            raise ValueError("管理账号时需要提供account_probe探测函数")
+        self.account_probe = account_probe
+        self.clock = clock
+        self.wheel = HierarchicalTimingWheel(tick=tick, start=clock())
+        self.reinstated = 0
+        self.probe_failures = 0
+
+        if account_manager:
+            account_manager.suspension_listeners.append(
+                lambda account_id, reason: self.schedule('account', account_id))
+        if proxy_manager:
+            proxy_manager.suspension_listeners.append(
+                lambda proxy_id, reason: self.schedule('proxy', proxy_id))
+
+    async def schedule(self, kind: str, resource_id: str) -> float:
+        """记录一次暂停并按退避排期，返回冷却秒数"""
+        offenses = await self._record_offense(kind, resource_id)
+        cooldown = self.cooldown_for(offenses)
+        self.wheel.schedule((kind, resource_id), self.clock() + cooldown)
+        self.logger.info(f"{kind} {resource_id} cooldown {cooldown:.0f}s (offense {offenses})")
+        return cooldown
+
+    def cooldown_for(self, offenses: int) -> float:
+        return min(self.base_cooldown * self.backoff ** max(offenses - 1, 0), self.max_cooldown)
+
+    async def recover_existing(self) -> int:
+        """启动时为已处于暂停状态的资源排期，返回排期数量"""
+        scheduled = 0
+        sources = []
+        if self.accounts:
+            sources.append(('account', self.accounts.redis, f'accounts:{AccountStatus.SUSPENDED.value}'))
+        if self.proxies:
+            sources.append(('proxy', self.proxies.redis, f'proxies:{ProxyStatus.ERROR.value}'))
+
+        for kind, redis, key in sources:
+            for member in await redis.smembers(key):
+                resource_id = member.decode() if isinstance(member, bytes) else member
+                if (kind, resource_id) not in self.wheel:
+                    self.wheel.schedule((kind, resource_id), self.clock() + self.base_cooldown)
+                    scheduled += 1
+        return scheduled
+
+    async def run_due(self) -> int:
+        """处理已到期的资源，返回恢复数量"""
+        due = self.wheel.advance(self.clock())
+        if not due:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.probe_concurrency)
+
+        async def recover(key):
+            async with semaphore:
+                try:
+                    return await self._recover(*key)
+                except Exception as e:
+                    self.logger.error(f"Recovery of {key[0]} {key[1]} failed: {e}")
+                    return False
+
+        results = await asyncio.gather(*(recover(key) for key in due))
+        return sum(results)
+
+    async def run(self):
+        """恢复循环，用asyncio.create_task启动"""
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            await self.run_due()
+
+    def stats(self) -> Dict:
+        return {
+            'pending': len(self.wheel),
+            'reinstated': self.reinstated,
+            'probe_failures': self.probe_failures
+        }
+
+    async def _recover(self, kind: str, resource_id: str) -> bool:
+        if kind == 'proxy':
+            # 冷却期间已被手动恢复或删除的代理不再探测
+            config = await self.proxies.get_proxy_config(resource_id)
+            if config is None or config.status != ProxyStatus.ERROR:
+                return False
+            ok = await self.proxies.probe_proxy(resource_id)
+        else:
+            # 冷却期间已被手动恢复或删除的账号不再探测
+            config = await self.accounts.get_account_config(resource_id)
+            if config is None or config.status != AccountStatus.SUSPENDED:
+                return False
+            ok = await self.account_probe(resource_id)
+
+        if not ok:
+            self.probe_failures += 1
+            await self.schedule(kind, resource_id)
+            return False
+
+        if kind == 'proxy':
+            await self.proxies.reinstate_proxy(resource_id)
+        else:
+            await self.accounts.reinstate_account(resource_id)
+        self.reinstated += 1
+        return True
+
+    async def _record_offense(self, kind: str, resource_id: str) -> int:
+        manager = self.proxies if kind == 'proxy' else self.accounts
+        key = f'{kind}:{resource_id}:offenses'
+        pipe = manager.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.offense_ttl)
+        offenses, _ = await pipe.execute()
+        return int(offenses)
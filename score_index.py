@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+分桶评分索引
+代理按地区、账号按优先级分桶，每个桶是一个评分最大堆。评分更新时压入带新版本号的条目，
+旧条目到达堆顶时惰性删除，旧条目超过本桶存活成员数两倍时整体压缩；
+另按桶维护成员数组，支持O(1)均匀随机抽样。
+"""
+
+import heapq
+import itertools
+import random
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+class BucketedScoreIndex:
+    """分桶的版本化评分最大堆
+
+    不指定桶时peek/pop在所有桶中取评分最高者，sample在所有桶的成员中均匀抽样。
+    """
+
+    def __init__(self, buckets: Iterable[Hashable]):
+        self._heaps: Dict[Hashable, List[Tuple[float, int, str]]] = {bucket: [] for bucket in buckets}
+        self._entries: Dict[str, Tuple[float, Hashable, int]] = {}
+        self._versions = itertools.count()
+        self._members: Dict[Hashable, List[str]] = {bucket: [] for bucket in self._heaps}
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def bucket_size(self, bucket: Hashable) -> int:
+        return len(self._members[bucket])
+
+    def get(self, key: str) -> Optional[Tuple[Hashable, float]]:
+        """返回成员的 (bucket, score)，不存在时返回None"""
+        entry = self._entries.get(key)
+        return (entry[1], entry[0]) if entry else None
+
+    def items(self) -> Iterator[Tuple[str, Hashable, float]]:
+        """遍历全部成员 (key, bucket, score)"""
+        for key, (score, bucket, _) in self._entries.items():
+            yield key, bucket, score
+
+    def update(self, key: str, bucket: Hashable, score: float):
+        """插入或更新评分，O(log n)"""
+        previous = self._entries.get(key)
+        if previous is None:
+            self._add_member(key, bucket)
+        elif previous[1] != bucket:
+            self._remove_member(key, previous[1])
+            self._add_member(key, bucket)
+
+        version = next(self._versions)
+        self._entries[key] = (score, bucket, version)
+        heap = self._heaps[bucket]
+        heapq.heappush(heap, (-score, version, key))
+
+        # 旧条目超过本桶存活成员数时压缩堆（与全局条目数比较时小桶永远不会压缩）
+        if len(heap) > 64 and len(heap) > 2 * len(self._members[bucket]):
+            self._compact(bucket)
+
+    def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._remove_member(key, entry[1])
+
+    def clear(self):
+        for heap in self._heaps.values():
+            heap.clear()
+        for members in self._members.values():
+            members.clear()
+        self._entries.clear()
+        self._positions.clear()
+
+    def sample(self, k: int, bucket: Optional[Hashable] = None,
+               rng: random.Random = random) -> List[Tuple[str, float]]:
+        """均匀随机抽取最多k个不同的成员 [(key, score)]，O(k)"""
+        pools = [self._members[bucket]] if bucket is not None else list(self._members.values())
+        total = sum(len(pool) for pool in pools)
+
+        sampled = []
+        for offset in rng.sample(range(total), min(k, total)):
+            for pool in pools:
+                if offset < len(pool):
+                    key = pool[offset]
+                    sampled.append((key, self._entries[key][0]))
+                    break
+                offset -= len(pool)
+        return sampled
+
+    def peek(self, bucket: Optional[Hashable] = None) -> Optional[Tuple[str, float]]:
+        """返回评分最高的成员 (key, score)"""
+        best = None
+        for b in ([bucket] if bucket is not None else self._heaps):
+            heap = self._heaps[b]
+            while heap and not self._is_live(heap[0]):
+                heapq.heappop(heap)
+            if heap and (best is None or heap[0] < best):
+                best = heap[0]
+
+        if best is None:
+            return None
+        return best[2], -best[0]
+
+    def pop(self, bucket: Optional[Hashable] = None) -> Optional[Tuple[str, float]]:
+        """取出评分最高的成员，O(log n)"""
+        top = self.peek(bucket)
+        if top:
+            self.discard(top[0])
+        return top
+
+    def _is_live(self, item: Tuple[float, int, str]) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[2] == item[1]
+
+    def _compact(self, bucket: Hashable):
+        heap = [item for item in self._heaps[bucket] if self._is_live(item)]
+        heapq.heapify(heap)
+        self._heaps[bucket] = heap
+
+    def _add_member(self, key: str, bucket: Hashable):
+        self._positions[key] = len(self._members[bucket])
+        self._members[bucket].append(key)
+
+    def _remove_member(self, key: str, bucket: Hashable):
+        # 与末尾元素交换后删除，O(1)
+        members = self._members[bucket]
+        position = self._positions.pop(key)
+        last = members.pop()
+        if last != key:
+            members[position] = last
+            self._positions[last] = position
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+多关键词并发搜索
+twscrape的API.search一次只跑一个查询，逐条等待时吞吐被限制在单个账号上。SearchEngine把一批查询
+分给与活跃账号数成比例的工作协程并发执行，结果经有界队列合并成一个异步迭代器按到达顺序产出，
+消费方处理慢时工作协程在队列上等待，内存占用不随结果数增长。
+
+twscrape的账号池在一个查询的整个翻页过程中独占一个账号（按SearchTimeline队列加锁），
+工作协程数超过活跃账号数时，多出的协程在账号池内等待空闲账号，因此per_account_concurrency默认为1。
+
+用法:
+    engine = SearchEngine(API())
+    async for hit in engine.search_many(["python", "#AI", "openai lang:en"], limit=100):
+        print(hit.query, hit.tweet.id)
+    print(engine.stats)
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, NamedTuple, Optional
+
+try:
+    from twscrape.models import parse_tweets
+except ImportError:
+    parse_tweets = None
+
+class SearchHit(NamedTuple):
+    query: str
+    tweet: Any
+
+# 工作协程结束的标记
+_DONE = object()
+
+class _SetSeen:
+    """单次search_many内的去重，接口与TweetDeduplicator.seen相同"""
+
+    def __init__(self):
+        self._ids = set()
+
+    def seen(self, tweet_id) -> bool:
+        if tweet_id in self._ids:
+            return True
+        self._ids.add(tweet_id)
+        return False
+
+class SearchEngine:
+    """把一批查询并发分给账号池执行并合并结果
+
+    api只需提供search(query, limit, kv)异步迭代器和pool.get_all()，即twscrape.API的接口。
+    dedupe为True时按tweet.id跨查询去重，只产出第一次出现的推文；给出deduplicator（TweetDeduplicator）
+    时由它判重，去重范围扩展到多次调用和进程重启之间。
+    给出pacing（PacingController）时改用search_raw逐页请求，每页按响应的状态码、x-rate-limit-*响应头和
+    耗时控制节奏，再用parse_page(response, limit)解析出推文（默认twscrape.models.parse_tweets）。
+    twscrape不暴露每页使用的账号，全部查询共用pacing_key这一个账号池节奏，配额按活跃账号数放大。
+    """
+
+    def __init__(self, api, per_account_concurrency: int = 1, max_concurrency: Optional[int] = None,
+                 buffer_size: int = 1000, dedupe: bool = True, pacing=None, pacing_key: str = 'twscrape',
+                 deduplicator=None, parse_page: Optional[Callable[[Any, int], Iterable]] = None):
+        if pacing is not None and parse_page is None:
+            if parse_tweets is None:
+                raise ImportError("按页节奏控制需要twscrape解析响应: pip install twscrape")
+            parse_page = lambda response, limit: parse_tweets(response.json(), limit)
+        self.api = api
+        self.deduplicator = deduplicator
+        self.pacing = pacing
+        self.pacing_key = pacing_key
+        self.parse_page = parse_page
+        self.logger = logging.getLogger(__name__)
+        self.per_account_concurrency = per_account_concurrency
+        self.max_concurrency = max_concurrency
+        self.buffer_size = buffer_size
+        self.dedupe = dedupe
+        self.stats: Dict[str, Dict] = {}
+
+    async def active_accounts(self) -> int:
+        accounts = await self.api.pool.get_all()
+        return sum(1 for account in accounts if account.active)
+
+    async def concurrency(self, queries: int, accounts: Optional[int] = None) -> int:
+        """工作协程数：活跃账号数×per_account_concurrency，不超过查询数和max_concurrency"""
+        if accounts is None:
+            accounts = await self.active_accounts()
+        workers = accounts * self.per_account_concurrency
+        if self.max_concurrency is not None:
+            workers = min(workers, self.max_concurrency)
+        return min(workers, queries)
+
+    async def search_many(self, queries: Iterable[str], limit: int = -1,
+                          kv: Optional[Dict] = None) -> AsyncIterator[SearchHit]:
+        """并发执行全部查询，按到达顺序产出SearchHit
+
+        单个查询失败只记入stats[query]['error']，不影响其他查询；没有活跃账号时抛出LookupError。
+        迭代器关闭时（aclose()或被取消）停止全部工作协程；break后异步生成器要等垃圾回收才关闭，
+        提前退出时应显式调用aclose()以立即归还账号。
+        """
+        pending = list(dict.fromkeys(queries))
+        if not pending:
+            return
+        accounts = await self.active_accounts()
+        workers = await self.concurrency(len(pending), accounts)
+        if workers <= 0:
+            raise LookupError("No active accounts for search")
+
+        self.stats = {query: {'tweets': 0, 'duplicates': 0, 'seconds': 0.0, 'error': None} for query in pending}
+        todo: asyncio.Queue = asyncio.Queue()
+        for query in pending:
+            todo.put_nowait(query)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_size)
+
+        async def worker():
+            while not todo.empty():
+                query = todo.get_nowait()
+                stats = self.stats[query]
+                start = time.perf_counter()
+                if self.pacing is None:
+                    tweets = self.api.search(query, limit=limit, kv=kv)
+                else:
+                    tweets = self.pacing.paged(self.api.search_raw(query, limit=limit, kv=kv),
+                                               lambda response: self.parse_page(response, limit),
+                                               self.pacing_key, 'SearchTimeline', accounts)
+                try:
+                    async for tweet in tweets:
+                        await results.put(SearchHit(query, tweet))
+                except Exception as e:
+                    stats['error'] = f"{type(e).__name__}: {e}"
+                    self.logger.warning(f"Search {query!r} failed: {stats['error']}")
+                finally:
+                    stats['seconds'] = time.perf_counter() - start
+                    # 取消时立即关闭查询迭代器，让twscrape归还账号锁，而不是等垃圾回收；
+                    # 普通异步迭代器没有aclose
+                    aclose = getattr(tweets, 'aclose', None)
+                    if aclose is not None:
+                        await aclose()
+            # 被取消时不放结束标记，队列已满时put会阻塞取消流程
+            await results.put(_DONE)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        seen = self.deduplicator.seen if self.deduplicator is not None else _SetSeen().seen
+        running = workers
+        try:
+            while running:
+                hit = await results.get()
+                if hit is _DONE:
+                    running -= 1
+                    continue
+                stats = self.stats[hit.query]
+                if self.dedupe and seen(hit.tweet.id):
+                    stats['duplicates'] += 1
+                    continue
+                stats['tweets'] += 1
+                yield hit
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+资源选择策略
+管理器从评分索引取出评分最高的window个可用候选，或从整个可用池均匀抽取samples个候选，
+按评分降序交给策略选出其中一个。只取最高分会让同一时刻的大量并发请求集中到同一个资源上，
+随机化的策略把负载分散开。
+"""
+
+import random
+from typing import Dict, List, NamedTuple, Optional, Type
+
+class Candidate(NamedTuple):
+    resource_id: str
+    score: float
+    load: int  # 在途请求数，管理器不跟踪时为0
+
+class SelectionStrategy:
+    """选择策略基类：choose返回候选列表中的下标
+
+    samples大于0时管理器从可用池均匀抽样，抽到的候选都不可用时退回按评分取前window个。
+    """
+
+    name = 'best'
+    window = 1
+    samples = 0
+    rng = random.Random()
+
+    def choose(self, candidates: List[Candidate]) -> int:
+        return 0
+
+class BestScore(SelectionStrategy):
+    """总是选评分最高者（默认，与原行为一致）"""
+
+class PowerOfTwoChoices(SelectionStrategy):
+    """从整个可用池随机抽两个，选在途请求少的；持平时选评分高的"""
+
+    name = 'p2c'
+
+    def __init__(self, samples: int = 2, rng: Optional[random.Random] = None):
+        self.samples = samples
+        self.rng = rng or random.Random()
+
+    def choose(self, candidates: List[Candidate]) -> int:
+        # 候选按评分降序，负载相同时min取下标小者
+        return min(range(len(candidates)), key=lambda i: candidates[i].load)
+
+class WeightedRandom(SelectionStrategy):
+    """在前window个候选中按评分加权随机选择"""
+
+    name = 'weighted'
+
+    def __init__(self, window: int = 16, rng: Optional[random.Random] = None):
+        self.window = window
+        self.rng = rng or random.Random()
+
+    def choose(self, candidates: List[Candidate]) -> int:
+        weights = [max(candidate.score, 1e-6) for candidate in candidates]
+        return self.rng.choices(range(len(candidates)), weights)[0]
+
+class ScoreBandRoundRobin(SelectionStrategy):
+    """与最高分相差不超过band的候选轮流使用"""
+
+    name = 'round_robin'
+
+    def __init__(self, band: float = 0.05, window: int = 16):
+        self.band = band
+        self.window = window
+        self._cursor = 0
+
+    def choose(self, candidates: List[Candidate]) -> int:
+        floor = candidates[0].score - self.band
+        in_band = sum(1 for candidate in candidates if candidate.score >= floor)
+        self._cursor += 1
+        return self._cursor % in_band
+
+STRATEGIES: Dict[str, Type[SelectionStrategy]] = {
+    strategy.name: strategy
+    for strategy in (BestScore, PowerOfTwoChoices, WeightedRandom, ScoreBandRoundRobin)
+}
+
+def create_strategy(name: str, **kwargs) -> SelectionStrategy:
+    """按名称创建策略：best、p2c、weighted、round_robin"""
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown selection strategy {name!r}, expected one of {', '.join(STRATEGIES)}")
+    return STRATEGIES[name](**kwargs)
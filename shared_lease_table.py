@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+多进程共享租用表
+同一台机器上的多个工作进程各自运行账号/代理管理器时，彼此看不到对方的在途使用，
+会同时选中同一个"最佳"资源。租用表放在multiprocessing.shared_memory中，每个资源一个
+定长槽位（在途数、最近使用时间、状态），进程间协调只需一次内存访问，不需要Redis往返。
+
+槽位用序列锁保护：写入方持有槽位所在分段的锁，写前写后各把版本号加一；
+读取方不加锁，版本号为奇数或前后不一致时重读。compare_and_set按版本号比较后写入。
+"""
+
+import hashlib
+import multiprocessing
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional
+
+# 槽位布局：版本号、在途数、最近使用时间、状态码、键长度、填充、键
+SLOT = struct.Struct('<IidBB6x56s')
+SLOT_STATE = struct.Struct('<IidB')
+VERSION = struct.Struct('<I')
+KEY_OFFSET = 24
+KEY_SIZE = 56
+KEY_LENGTH_OFFSET = 17
+
+# 表头：魔数、容量、槽位大小
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+MAGIC = b'LEASETB1'
+
+# 账号和代理状态共用的状态码，0表示未设置（视为可用）
+STATUSES = ('', 'active', 'error', 'banned', 'testing', 'suspended', 'maintenance')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+class LeaseSlot(NamedTuple):
+    in_flight: int
+    last_used: float
+    status: str
+    version: int
+
+class SharedLeaseTable:
+    """共享内存租用表
+
+    主进程创建后把表作为参数传给子进程（Process/Pool的initializer），子进程按名称重新挂接，
+    分段锁随之继承。槽位按键的CRC32开放寻址分配，只增不删；键超过56字节时存其摘要。
+    容量按资源数的1.5倍以上设置，每个槽位80字节，65536个槽位约5MB。
+
+    用法:
+        table = SharedLeaseTable(capacity=65536)
+        if table.try_acquire('account:acc_1', limit=1):
+            ...
+            table.release('account:acc_1')
+        table.unlink()  # 最后退出的进程释放共享内存
+    """
+
+    def __init__(self, capacity: int = 65536, name: Optional[str] = None, stripes: int = 64,
+                 create: bool = True, locks: Optional[List] = None):
+        size = HEADER_SIZE + capacity * SLOT.size
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, capacity, SLOT.size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            magic, capacity, slot_size = HEADER.unpack_from(self.shm.buf, 0)
+            if magic != MAGIC or slot_size != SLOT.size:
+                raise ValueError(f"Shared memory {name!r} is not a lease table")
+
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.buf = self.shm.buf
+        self.locks = locks or [multiprocessing.Lock() for _ in range(stripes)]
+        self._slots: Dict[str, int] = {}
+
+    def __getstate__(self):
+        return {'name': self.name, 'locks': self.locks}
+
+    def __setstate__(self, state):
+        self.__init__(name=state['name'], create=False, locks=state['locks'])
+
+    def __len__(self) -> int:
+        return sum(1 for index in range(self.capacity) if self.buf[self._offset(index) + KEY_LENGTH_OFFSET])
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def read(self, key: str) -> Optional[LeaseSlot]:
+        """无锁读取槽位，键不存在时返回None"""
+        index = self._find(key, create=False)
+        if index is None:
+            return None
+        return self._read(self._offset(index))
+
+    def in_flight(self, key: str) -> int:
+        slot = self.read(key)
+        return slot.in_flight if slot else 0
+
+    def status(self, key: str) -> Optional[str]:
+        slot = self.read(key)
+        return slot.status if slot and slot.status else None
+
+    def compare_and_set(self, key: str, version: int, in_flight: Optional[int] = None,
+                        last_used: Optional[float] = None, status: Optional[str] = None) -> bool:
+        """槽位版本号仍为version时写入给出的字段并返回True，否则不写入返回False"""
+        index = self._find(key, create=True)
+        offset = self._offset(index)
+        with self.locks[index % len(self.locks)]:
+            current_version, current_in_flight, current_last_used, current_status = \
+                SLOT_STATE.unpack_from(self.buf, offset)
+            if current_version != version:
+                return False
+
+            # 版本号按32位回绕，奇偶性不变
+            writing = (version + 1) & 0xFFFFFFFF
+            VERSION.pack_into(self.buf, offset, writing)
+            SLOT_STATE.pack_into(
+                self.buf, offset, writing,
+                current_in_flight if in_flight is None else in_flight,
+                current_last_used if last_used is None else last_used,
+                current_status if status is None else STATUS_CODES[status]
+            )
+            VERSION.pack_into(self.buf, offset, (version + 2) & 0xFFFFFFFF)
+        return True
+
+    def try_acquire(self, key: str, limit: int, now: Optional[float] = None) -> bool:
+        """在途数低于limit且状态可用时在途数加一，否则返回False"""
+        now = time.time() if now is None else now
+        offset = self._offset(self._find(key, create=True))
+        while True:
+            slot = self._read(offset)
+            if slot.status not in ('', 'active') or slot.in_flight >= limit:
+                return False
+            if self.compare_and_set(key, slot.version, in_flight=slot.in_flight + 1, last_used=now):
+                return True
+
+    def release(self, key: str):
+        """在途数减一（不低于0）"""
+        offset = self._offset(self._find(key, create=True))
+        while True:
+            slot = self._read(offset)
+            if slot.in_flight <= 0:
+                return
+            if self.compare_and_set(key, slot.version, in_flight=slot.in_flight - 1):
+                return
+
+    def set_status(self, key: str, status: str):
+        offset = self._offset(self._find(key, create=True))
+        while True:
+            slot = self._read(offset)
+            if slot.status == status or self.compare_and_set(key, slot.version, status=status):
+                return
+
+    def stats(self) -> Dict:
+        used = len(self)
+        return {
+            'capacity': self.capacity,
+            'used': used,
+            'load_factor': used / self.capacity,
+            'nbytes': self.nbytes
+        }
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        """释放共享内存，由最后一个使用者调用"""
+        self.close()
+        self.shm.unlink()
+
+    def _offset(self, index: int) -> int:
+        return HEADER_SIZE + index * SLOT.size
+
+    def _read(self, offset: int) -> LeaseSlot:
+        while True:
+            version, in_flight, last_used, status = SLOT_STATE.unpack_from(self.buf, offset)
+            if version & 1 == 0 and VERSION.unpack_from(self.buf, offset)[0] == version:
+                return LeaseSlot(in_flight, last_used, STATUSES[status], version)
+
+    @staticmethod
+    def _encode_key(key: str) -> bytes:
+        encoded = key.encode()
+        if len(encoded) > KEY_SIZE:
+            encoded = hashlib.blake2b(encoded, digest_size=KEY_SIZE // 2).hexdigest().encode()
+        return encoded
+
+    def _find(self, key: str, create: bool) -> Optional[int]:
+        index = self._slots.get(key)
+        if index is not None:
+            return index
+
+        encoded = self._encode_key(key)
+        start = zlib.crc32(encoded) % self.capacity
+        for probe in range(self.capacity):
+            index = (start + probe) % self.capacity
+            offset = self._offset(index)
+            length = self.buf[offset + KEY_LENGTH_OFFSET]
+            if length == 0:
+                if not create:
+                    return None
+                with self.locks[index % len(self.locks)]:
+                    # 加锁后重查，其他进程可能刚占用了这个槽位
+                    length = self.buf[offset + KEY_LENGTH_OFFSET]
+                    if length == 0:
+                        self.buf[offset + KEY_OFFSET:offset + KEY_OFFSET + len(encoded)] = encoded
+                        # 键长度最后写入，读取方看到非零长度时键已完整
+                        self.buf[offset + KEY_LENGTH_OFFSET] = len(encoded)
+                        self._slots[key] = index
+                        return index
+            if bytes(self.buf[offset + KEY_OFFSET:offset + KEY_OFFSET + length]) == encoded:
+                self._slots[key] = index
+                return index
+        raise LookupError(f"Lease table full ({self.capacity} slots)")
@@ -6,22 +6,79 @@ SOCKS5代理管理器实现示例
 
 import asyncio
 import aiohttp
+import heapq
 import json
 import logging
 import time
 import random
-from typing import Dict, List, Optional
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass, asdict
 
+from instrumentation import Instrumentation
+from metric_aggregator import WriteBehindMetrics
+from mock_pipeline import MockPipeline
+from pool_statistics import PoolStatistics
+from score_index import BucketedScoreIndex
+from selection_strategies import BestScore, Candidate, SelectionStrategy
+from shared_lease_table import SharedLeaseTable
+
+# 列式指标存储使用numpy（可选依赖）
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# aiohttp本身不支持SOCKS5代理，需要aiohttp-socks提供连接器（可选依赖）
+try:
+    from aiohttp_socks import ProxyConnector
+except ImportError:
+    ProxyConnector = None
+
 # 模拟Redis（实际使用时替换为真实的Redis客户端）
 class MockRedis:
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
         self.data = {}
         self.sets = {}
+        
+        # 过期时间：访问时惰性检查，另按截止时间堆定期主动清理（与Redis一致）
+        self.clock = clock
+        self.expires: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._last_active_expire = clock()
+        self.active_expire_interval = 0.1
+    
+    def _check_expiry(self, key: str):
+        deadline = self.expires.get(key)
+        now = self.clock()
+        if deadline is not None and deadline <= now:
+            self._remove(key)
+        
+        if now - self._last_active_expire >= self.active_expire_interval:
+            self.evict_expired()
+    
+    def _remove(self, key: str):
+        self.data.pop(key, None)
+        self.sets.pop(key, None)
+        self.expires.pop(key, None)
+    
+    def evict_expired(self, max_keys: int = 1000) -> int:
+        """主动清理已过期的键，每次最多max_keys个，返回清理数量"""
+        now = self._last_active_expire = self.clock()
+        evicted = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now and evicted < max_keys:
+            deadline, key = heapq.heappop(self._expiry_heap)
+            # 堆中可能残留已被覆盖或取消的过期时间
+            if self.expires.get(key) == deadline:
+                self._remove(key)
+                evicted += 1
+        return evicted
     
     async def hset(self, key: str, field: str = None, value: str = None, mapping: Dict = None, **kwargs):
+        self._check_expiry(key)
         if key not in self.data:
             self.data[key] = {}
         if mapping:
@@ -31,42 +88,100 @@ class MockRedis:
         self.data[key].update(kwargs)
     
     async def hget(self, key: str, field: str):
+        self._check_expiry(key)
         return self.data.get(key, {}).get(field)
     
     async def hgetall(self, key: str):
-        return self.data.get(key, {})
+        self._check_expiry(key)
+        return dict(self.data.get(key, {}))
     
     async def hincrby(self, key: str, field: str, amount: int = 1):
+        self._check_expiry(key)
         if key not in self.data:
             self.data[key] = {}
         current = int(self.data[key].get(field, 0))
         self.data[key][field] = str(current + amount)
+        return current + amount
+    
+    async def hdel(self, key: str, *fields) -> int:
+        self._check_expiry(key)
+        removed = 0
+        for field in fields:
+            removed += self.data.get(key, {}).pop(field, None) is not None
+        return removed
     
     async def sadd(self, key: str, *values):
+        self._check_expiry(key)
         if key not in self.sets:
             self.sets[key] = set()
         for value in values:
             self.sets[key].add(value)
     
     async def smembers(self, key: str):
+        self._check_expiry(key)
         return [v.encode() if isinstance(v, str) else v for v in self.sets.get(key, set())]
     
     async def srem(self, key: str, *values):
+        self._check_expiry(key)
         if key in self.sets:
             for value in values:
                 self.sets[key].discard(value)
     
+    async def smove(self, src: str, dst: str, member: str) -> bool:
+        """与Redis SMOVE一致：成员从src原子移动到dst，不在src中时返回False"""
+        self._check_expiry(src)
+        self._check_expiry(dst)
+        if member not in self.sets.get(src, ()):
+            return False
+        self.sets[src].discard(member)
+        self.sets.setdefault(dst, set()).add(member)
+        return True
+    
+    def pipeline(self, transaction: bool = True) -> MockPipeline:
+        return MockPipeline(self, transaction)
+    
+    def multi(self) -> MockPipeline:
+        return self.pipeline(transaction=True).multi()
+    
+    async def get(self, key: str):
+        self._check_expiry(key)
+        value = self.data.get(key)
+        return value if isinstance(value, str) else None
+    
+    async def set(self, key: str, value: str, ex: Optional[int] = None):
+        self._check_expiry(key)
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex:
+            await self.expire(key, ex)
+    
     async def incr(self, key: str):
+        self._check_expiry(key)
         current = int(self.data.get(key, 0))
         self.data[key] = str(current + 1)
         return current + 1
     
-    async def expire(self, key: str, seconds: int):
-        pass  # 简化实现，实际Redis会自动过期
+    async def expire(self, key: str, seconds: int) -> bool:
+        self._check_expiry(key)
+        if key not in self.data and key not in self.sets:
+            return False
+        
+        deadline = self.clock() + seconds
+        self.expires[key] = deadline
+        heapq.heappush(self._expiry_heap, (deadline, key))
+        return True
+    
+    async def ttl(self, key: str) -> int:
+        """与Redis一致：键不存在返回-2，未设置过期返回-1"""
+        self._check_expiry(key)
+        if key not in self.data and key not in self.sets:
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, int(round(self.expires[key] - self.clock())))
     
     async def delete(self, key: str):
-        self.data.pop(key, None)
-        self.sets.pop(key, None)
+        self._remove(key)
 
 class ProxyStatus(Enum):
     ACTIVE = "active"
@@ -80,6 +195,10 @@ class ProxyRegion(Enum):
     ASIA = "asia"
     GLOBAL = "global"
 
+# 用量按时间分桶计数，桶键自动过期，跨天/跨窗口无需清零扫描
+USAGE_DAY_SECONDS = 86400
+USAGE_WINDOW_SECONDS = 900
+
 @dataclass
 class ProxyMetrics:
     total_requests: int = 0
@@ -132,21 +251,438 @@ class ProxyConfig:
             'proxy_url': self.proxy_url
         }
 
+class ProxyScoreIndex(BucketedScoreIndex):
+    """代理评分索引 - 按地区分桶；不指定地区时在所有地区中取最高分、均匀抽样"""
+    
+    def __init__(self):
+        super().__init__(ProxyRegion)
+
+class RecordCache:
+    """解码后数据类的有界LRU缓存
+    
+    管理器自身的写入就地更新缓存对象；ttl用于限制其他进程写入造成的陈旧时间。
+    """
+    
+    def __init__(self, max_size: int = 100_000, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._items: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def get(self, key: str) -> Optional[Any]:
+        value = self.peek(key)
+        if value is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+    
+    def peek(self, key: str) -> Optional[Any]:
+        """读取但不计入命中统计、不调整LRU顺序"""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        
+        value, loaded_at = item
+        if self.ttl is not None and self.clock() - loaded_at > self.ttl:
+            del self._items[key]
+            return None
+        return value
+    
+    def put(self, key: str, value: Any):
+        self._items[key] = (value, self.clock())
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+    
+    def invalidate(self, key: str):
+        self._items.pop(key, None)
+    
+    def values(self) -> List[Any]:
+        return [value for value, _ in self._items.values()]
+    
+    def clear(self):
+        self._items.clear()
+    
+    @property
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class ProxyMetricsColumns:
+    """列式代理指标存储（需要numpy）
+    
+    每个代理占用一个稠密槽位，计数器、EMA延迟和日用量按列存放，
+    整个代理池的健康分数和选择评分一次向量化计算完成。
+    """
+    
+    REGIONS = list(ProxyRegion)
+    STATUSES = list(ProxyStatus)
+    COLUMNS = (
+        'total_requests', 'successful_requests', 'failed_requests', 'consecutive_errors',
+        'daily_usage', 'daily_limit', 'average_response_time', 'last_used', 'last_success',
+        'region', 'status'
+    )
+    
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise ImportError("ProxyMetricsColumns requires numpy: pip install numpy")
+        
+        self.slots: Dict[str, int] = {}
+        self.proxy_ids: List[Optional[str]] = []
+        self._free_slots: List[int] = []
+        
+        self.total_requests = np.zeros(capacity, dtype=np.int32)
+        self.successful_requests = np.zeros(capacity, dtype=np.int32)
+        self.failed_requests = np.zeros(capacity, dtype=np.int32)
+        self.consecutive_errors = np.zeros(capacity, dtype=np.int32)
+        self.daily_usage = np.zeros(capacity, dtype=np.int32)
+        self.daily_limit = np.ones(capacity, dtype=np.int32)
+        # 与Python评分使用相同精度，阈值附近（如3.0秒）的判定保持一致
+        self.average_response_time = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.full(capacity, np.nan, dtype=np.float64)
+        self.last_success = np.full(capacity, np.nan, dtype=np.float64)
+        self.region = np.zeros(capacity, dtype=np.int8)
+        self.status = np.full(capacity, -1, dtype=np.int8)
+    
+    def __len__(self) -> int:
+        return len(self.slots)
+    
+    def __contains__(self, proxy_id: str) -> bool:
+        return proxy_id in self.slots
+    
+    @property
+    def capacity(self) -> int:
+        return len(self.total_requests)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, column).nbytes for column in self.COLUMNS)
+    
+    def slot(self, proxy_id: str) -> int:
+        """返回代理槽位，不存在时分配"""
+        slot = self.slots.get(proxy_id)
+        if slot is not None:
+            return slot
+        
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.proxy_ids[slot] = proxy_id
+        else:
+            slot = len(self.proxy_ids)
+            if slot >= self.capacity:
+                self._grow()
+            self.proxy_ids.append(proxy_id)
+        
+        self.slots[proxy_id] = slot
+        return slot
+    
+    def remove(self, proxy_id: str):
+        slot = self.slots.pop(proxy_id, None)
+        if slot is None:
+            return
+        
+        self.proxy_ids[slot] = None
+        self.status[slot] = -1
+        self._free_slots.append(slot)
+    
+    def set_config(self, config: ProxyConfig):
+        slot = self.slot(config.proxy_id)
+        self.daily_limit[slot] = config.daily_limit
+        self.region[slot] = self.REGIONS.index(config.region)
+        self.status[slot] = self.STATUSES.index(config.status)
+    
+    def set_metrics(self, proxy_id: str, metrics: ProxyMetrics):
+        self.slot(proxy_id)
+        self.update(proxy_id, **asdict(metrics))
+    
+    def update(self, proxy_id: str, **fields):
+        """更新单个代理的部分字段；未登记的代理（如删除后迟到的指标写入）忽略"""
+        slot = self.slots.get(proxy_id)
+        if slot is None:
+            return
+        for field, value in fields.items():
+            if field == 'status':
+                value = self.STATUSES.index(value)
+            elif field == 'region':
+                value = self.REGIONS.index(value)
+            elif field in ('last_used', 'last_success'):
+                value = value.timestamp() if value else np.nan
+            getattr(self, field)[slot] = value
+    
+    def health_scores(self) -> 'np.ndarray':
+        """向量化计算ProxyMetrics.health_score"""
+        n = len(self.proxy_ids)
+        total = self.total_requests[:n]
+        success_rate = np.divide(
+            self.successful_requests[:n], total,
+            out=np.ones(n, dtype=np.float64), where=total > 0
+        )
+        error_penalty = np.minimum(self.consecutive_errors[:n] * 0.15, 0.6)
+        time_factor = np.where(self.average_response_time[:n] < 3.0, 1.0, 0.8)
+        usage_factor = np.where(self.daily_usage[:n] < 800, 1.0, 0.8)
+        return np.maximum(0.0, (success_rate - error_penalty) * time_factor * usage_factor)
+    
+    def selection_scores(self, health: Optional['np.ndarray'] = None) -> 'np.ndarray':
+        """向量化计算SOCKS5ProxyManager._calculate_score"""
+        n = len(self.proxy_ids)
+        health = self.health_scores() if health is None else health
+        usage_score = (1 - self.daily_usage[:n] / self.daily_limit[:n]) * 0.3
+        response_score = np.maximum(0.0, (5.0 - self.average_response_time[:n]) / 5.0) * 0.2
+        return health * 0.5 + usage_score + response_score
+    
+    def selectable_mask(self, health_threshold: float, region: Optional[ProxyRegion] = None,
+                        health: Optional['np.ndarray'] = None) -> 'np.ndarray':
+        n = len(self.proxy_ids)
+        health = self.health_scores() if health is None else health
+        mask = (
+            (self.status[:n] == self.STATUSES.index(ProxyStatus.ACTIVE))
+            & (self.daily_usage[:n] < self.daily_limit[:n])
+            & (health >= health_threshold)
+        )
+        if region:
+            mask &= self.region[:n] == self.REGIONS.index(region)
+        return mask
+    
+    def _grow(self):
+        for column in self.COLUMNS:
+            array = getattr(self, column)
+            fill = {'daily_limit': 1, 'last_used': np.nan, 'last_success': np.nan, 'status': -1}.get(column, 0)
+            grown = np.full(len(array) * 2, fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, column, grown)
+
+@dataclass
+class ProxyLease:
+    """代理租约，由SOCKS5ProxyManager.lease()创建"""
+    proxy_id: str
+    proxy: Dict
+    wait_time: float
+    acquired_at: float
+    response_time: Optional[float] = None
+    error: Optional[str] = None
+    
+    def fail(self, error: str):
+        """标记本次使用失败，释放时记为代理错误"""
+        self.error = error
+
+class LatencySamples:
+    """最近N个耗时样本，用于计算分位数"""
+    
+    def __init__(self, max_samples: int = 4096):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=max_samples)
+    
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+    
+    def percentile(self, pct: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'average': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+class ProxySessionPool:
+    """按proxy_id复用的长连接会话池
+    
+    每个代理一个aiohttp会话，连接器上限取ProxyConfig.max_concurrent，
+    健康检查和业务请求共享同一批隧道；空闲超过idle_timeout的会话被关闭。
+    """
+    
+    def __init__(self, idle_timeout: float = 300.0, keepalive_timeout: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.logger = logging.getLogger(__name__)
+        
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._last_used: Dict[str, float] = {}
+        self._borrowed: Dict[str, int] = defaultdict(int)
+        self._last_sweep = time.monotonic()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    @asynccontextmanager
+    async def borrow(self, config: ProxyConfig):
+        """借出代理的共享会话，退出时不关闭会话"""
+        await self._maybe_evict_idle()
+        
+        session = self._sessions.get(config.proxy_id)
+        if session is None or session.closed:
+            session = self._create_session(config)
+            self._sessions[config.proxy_id] = session
+        
+        self._borrowed[config.proxy_id] += 1
+        try:
+            yield session
+        finally:
+            self._borrowed[config.proxy_id] -= 1
+            self._last_used[config.proxy_id] = time.monotonic()
+    
+    async def discard(self, proxy_id: str):
+        """关闭并移除代理的会话（代理下线时调用）"""
+        session = self._sessions.pop(proxy_id, None)
+        self._last_used.pop(proxy_id, None)
+        self._borrowed.pop(proxy_id, None)
+        if session:
+            await session.close()
+    
+    async def evict_idle(self) -> int:
+        """关闭空闲超时且未被借用的会话，返回关闭数量"""
+        now = time.monotonic()
+        self._last_sweep = now
+        idle = [
+            proxy_id for proxy_id, last_used in self._last_used.items()
+            if now - last_used >= self.idle_timeout and not self._borrowed.get(proxy_id)
+        ]
+        for proxy_id in idle:
+            await self.discard(proxy_id)
+        
+        if idle:
+            self.logger.debug(f"Evicted {len(idle)} idle proxy sessions")
+        return len(idle)
+    
+    async def close(self):
+        for proxy_id in list(self._sessions):
+            await self.discard(proxy_id)
+    
+    async def _maybe_evict_idle(self):
+        # 最多每1/10空闲时长清扫一次，借出路径保持O(1)
+        if time.monotonic() - self._last_sweep >= self.idle_timeout / 10:
+            await self.evict_idle()
+    
+    def _create_session(self, config: ProxyConfig) -> aiohttp.ClientSession:
+        limit = max(1, config.max_concurrent)
+        
+        if ProxyConnector:
+            connector = ProxyConnector.from_url(
+                config.proxy_url, limit=limit, limit_per_host=limit,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            return aiohttp.ClientSession(connector=connector)
+        
+        connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector, proxy=config.proxy_url)
+
 class SOCKS5ProxyManager:
     """SOCKS5代理管理器"""
     
-    def __init__(self, redis_client=None):
+    # 统计聚合中在活跃代理上累加的字段（账号没有响应时间）
+    STATS_TOTALS = ('health', 'usage', 'response_time')
+    
+    def __init__(self, redis_client=None, cache_size: int = 100_000, cache_ttl: Optional[float] = None,
+                 columnar: bool = False, selection: Optional[SelectionStrategy] = None,
+                 flush_interval: Optional[float] = None, flush_events: int = 1000,
+                 lease_table: Optional[SharedLeaseTable] = None,
+                 instrumentation: Optional[Instrumentation] = None):
         self.redis = redis_client or MockRedis()
         self.logger = logging.getLogger(__name__)
+        
+        # 可选延迟直方图：每个存储命令和公开方法各自计时，以Prometheus格式导出
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            self.redis = instrumentation.instrument_storage(self.redis)
+        
+        # 候选选择策略，默认取评分最高者；高并发下可换成p2c等随机化策略分散负载
+        self.selection = selection or BestScore()
         self.health_threshold = 0.7
         
-    async def add_proxy_batch(self, proxy_list: List[Dict]) -> Dict[str, bool]:
-        """批量添加SOCKS5代理"""
-        results = {}
+        # 解码后的配置/指标缓存，多进程共享Redis时设置cache_ttl
+        self.config_cache = RecordCache(cache_size, cache_ttl)
+        self.metrics_cache = RecordCache(cache_size, cache_ttl)
+        
+        # 可选列式指标镜像，用于整池向量化评分（需要numpy）
+        self.metrics_columns = ProxyMetricsColumns() if columnar else None
+        
+        # 用量分桶使用的时钟（UTC秒）
+        self.clock = time.time
+        self._usage_day = int(self.clock() // USAGE_DAY_SECONDS)
+        
+        # 连接测试配置
+        self.test_url = 'https://httpbin.org/ip'
+        self.test_timeout = 10
+        
+        # 按代理复用的连接池，健康检查与业务请求共用
+        self.session_pool = ProxySessionPool()
+        
+        # 可选代理评分索引，首次选择时从Redis全量构建
+        self._score_index = ProxyScoreIndex()
+        self._score_index_ready = False
+        
+        # 代理租用：在途请求数、先来先到等待队列和时延指标
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        # 多进程共享租用表：设置时max_concurrent按同机所有进程的在途总数计算。
+        # 其他进程归还容量不会唤醒本进程的排队者，有排队者时每shared_poll_interval秒重试分配
+        self.lease_table = lease_table
+        self.shared_poll_interval = 0.05
+        self._shared_capacity_poll: Optional[asyncio.Task] = None
+        self._lease_waiters = deque()
+        self._lease_lock = asyncio.Lock()
+        self._lease_dispatching = False
+        self._lease_dispatch_requested = False
+        self._lease_wait_times = LatencySamples()
+        self._lease_hold_times = LatencySamples()
+        
+        # 统计聚合值，首次查询时全量对账构建，之后增量维护
+        self._pool_stats = PoolStatistics(ProxyStatus.ACTIVE.value, self.STATS_TOTALS)
+        self._pool_stats_ready = False
+        
+        # 代理被暂停时依次调用 listener(proxy_id, reason)，如恢复调度器
+        self.suspension_listeners: List[Callable[[str, str], Awaitable[None]]] = []
+        
+        # 设置flush_interval时成功/错误指标写后聚合，每flush_interval秒或flush_events个事件批量写入；
+        # 缓存指标和暂停判定仍实时更新。默认每次立即写入
+        self.metric_writer = (
+            WriteBehindMetrics(self.redis, 'proxy:{}:metrics', flush_interval, flush_events)
+            if flush_interval is not None else None
+        )
+        
+        if instrumentation is not None:
+            instrumentation.instrument_manager(self, 'proxy')
+        
+    async def add_proxy_batch(self, proxy_list: List[Dict], concurrency: int = 100,
+                              per_host_limit: int = 4,
+                              progress: Optional[Callable[[int, int], None]] = None,
+                              results: Optional[Dict[str, bool]] = None) -> Dict[str, bool]:
+        """批量添加SOCKS5代理
+        
+        并发验证，最多concurrency个测试同时进行，同一主机最多per_host_limit个。
+        progress(done, total)在每个代理完成后回调。结果逐个写入results，
+        调用方传入自己的字典即可在任务被取消时保留已完成的部分。
+        """
+        results = {} if results is None else results
+        configs = []
         
         for proxy_data in proxy_list:
             try:
-                proxy_config = ProxyConfig(
+                configs.append(ProxyConfig(
                     proxy_id=f"socks5_{proxy_data['host']}_{proxy_data['port']}",
                     host=proxy_data['host'],
                     port=int(proxy_data['port']),
@@ -154,22 +690,57 @@ class SOCKS5ProxyManager:
                     password=proxy_data['password'],
                     region=ProxyRegion(proxy_data.get('region', 'global')),
                     provider=proxy_data.get('provider', 'unknown')
-                )
-                
-                success = await self._add_single_proxy(proxy_config)
-                results[proxy_config.proxy_id] = success
-                
+                ))
             except Exception as e:
                 self.logger.error(f"Failed to add proxy {proxy_data}: {e}")
                 results[f"error_{proxy_data.get('host', 'unknown')}"] = False
         
+        total = len(configs)
+        done = 0
+        slots = asyncio.Semaphore(max(1, concurrency))
+        host_slots = defaultdict(lambda: asyncio.Semaphore(max(1, per_host_limit)))
+        
+        async def verify(config: ProxyConfig):
+            nonlocal done
+            # 先占主机槽位再占全局槽位，避免排队等待同一主机时占住全局并发
+            async with host_slots[config.host]:
+                async with slots:
+                    success = await self._add_single_proxy(config)
+            
+            results[config.proxy_id] = success
+            done += 1
+            if progress:
+                progress(done, total)
+        
+        tasks = [asyncio.ensure_future(verify(config)) for config in self._interleave_by_host(configs)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # 被取消时停止剩余测试，未完成的代理停留在testing状态，不会被选中
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
         successful = sum(results.values())
         self.logger.info(f"Batch add completed: {successful}/{len(proxy_list)} successful")
         return results
     
+    @staticmethod
+    def _interleave_by_host(configs: List[ProxyConfig]) -> List[ProxyConfig]:
+        """按主机轮转排列，避免同一服务商的大量端口占满前排"""
+        by_host = defaultdict(list)
+        for config in configs:
+            by_host[config.host].append(config)
+        
+        groups = list(by_host.values())
+        return [group[i] for i in range(max(map(len, groups), default=0))
+                for group in groups if i < len(group)]
+    
     async def _add_single_proxy(self, config: ProxyConfig) -> bool:
         """添加单个代理"""
         try:
+            # 测试通过前保持testing状态
+            config.status = ProxyStatus.TESTING
             await self._save_proxy_config(config)
             await self._initialize_proxy_metrics(config.proxy_id)
             
@@ -181,6 +752,7 @@ class SOCKS5ProxyManager:
                 self.logger.info(f"Proxy {config.proxy_id} added and verified")
             else:
                 await self._update_proxy_status(config.proxy_id, ProxyStatus.ERROR)
+                await self.session_pool.discard(config.proxy_id)
                 self.logger.warning(f"Proxy {config.proxy_id} added but failed initial test")
             
             return True
@@ -192,74 +764,397 @@ class SOCKS5ProxyManager:
     async def get_available_proxy(self, region: Optional[ProxyRegion] = None) -> Optional[Dict]:
         """获取可用代理"""
         try:
-            # 获取活跃代理
-            active_proxies = await self.redis.smembers('proxies:active')
+            selected = await self._select_proxy(region)
+            if not selected:
+                return None
             
-            candidates = []
-            for proxy_id in active_proxies:
-                proxy_id = proxy_id.decode() if isinstance(proxy_id, bytes) else proxy_id
-                
-                config = await self._get_proxy_config(proxy_id)
-                metrics = await self._get_proxy_metrics(proxy_id)
+            return self._proxy_info(*selected)
+            
+        except Exception as e:
+            self.logger.error(f"Failed to get available proxy: {e}")
+            return None
+    
+    @asynccontextmanager
+    async def lease(self, region: Optional[ProxyRegion] = None, timeout: Optional[float] = None):
+        """租用代理，受ProxyConfig.max_concurrent约束
+        
+        没有可用容量时按先来先到排队等待；timeout秒内仍未获得则抛出asyncio.TimeoutError。
+        正常退出记为成功（响应时间取lease.response_time或租用时长），
+        抛出异常或调用lease.fail()记为错误。
+        
+        用法: async with manager.lease(region=ProxyRegion.US) as lease: ...
+        """
+        lease = await self.acquire_lease(region, timeout)
+        outcome = 'success'
+        try:
+            yield lease
+        except Exception as e:
+            lease.fail(f"{type(e).__name__}: {e}")
+            raise
+        except BaseException:
+            # 被取消时只归还容量，不计入成功或错误
+            outcome = None
+            raise
+        finally:
+            await self.release_lease(lease, outcome)
+    
+    def lease_stats(self) -> Dict:
+        """租用相关指标：活跃租用、排队数、排队等待和租用时长分布"""
+        return {
+            'active_leases': sum(self._in_flight.values()),
+            'waiting': len(self._lease_waiters),
+            'wait_time': self._lease_wait_times.summary(),
+            'hold_time': self._lease_hold_times.summary()
+        }
+    
+    async def _select_proxy(self, region: Optional[ProxyRegion] = None,
+                            prefer: Optional[Callable[[ProxyConfig], int]] = None, lookahead: int = 8
+                            ) -> Optional[Tuple[str, ProxyConfig, ProxyMetrics]]:
+        """从评分索引选出可用代理并记录使用，跳过并发已满的代理
+        
+        取评分最高的selection.window个可用候选，由选择策略决定使用哪个。
+        prefer返回候选的偏好等级（0最优），此时最多查看lookahead个候选，
+        只在等级最低的候选中应用选择策略。
+        """
+        self._check_usage_rollover()
+        await self._ensure_score_index()
+        
+        if self.selection.samples and prefer is None:
+            sampled = await self._sample_candidates(region)
+            if sampled:
+                proxy_id, config, metrics, _ = sampled[self.selection.choose([
+                    Candidate(candidate[0], candidate[3], self._proxy_load(candidate[0]))
+                    for candidate in sampled
+                ])]
+                await self._record_usage(proxy_id)
+                return proxy_id, config, metrics
+            # 抽到的候选都不可用时退回按评分查找
+        
+        window = self.selection.window
+        limit = max(window, lookahead) if prefer else window
+        saturated = []
+        candidates = []
+        preferred = 0
+        chosen = None
+        
+        try:
+            while True:
+                # 从评分索引取出最佳候选
+                top = self._score_index.pop(region)
+                if top is None:
+                    break
                 
-                if not config or not metrics:
-                    continue
+                proxy_id, indexed_score = top
+                config, metrics = await self._load_proxy(proxy_id)
                 
-                # 地区过滤
-                if region and config.region != region:
+                # 校验候选（索引可能落后于其他进程的写入）
+                if not self._is_selectable(config, metrics):
                     continue
                 
-                # 检查使用限制
-                if metrics.daily_usage >= config.daily_limit:
+                if self._proxy_load(proxy_id) >= config.max_concurrent:
+                    saturated.append((proxy_id, config, metrics))
                     continue
                 
-                # 健康分数过滤
-                if metrics.health_score < self.health_threshold:
-                    continue
+                score = self._calculate_score(config, metrics)
+                if score < indexed_score:
+                    runner_up = self._score_index.peek(region)
+                    if runner_up and runner_up[1] > score:
+                        self._score_index.update(proxy_id, config.region, score)
+                        continue
                 
-                candidates.append({
-                    'proxy_id': proxy_id,
-                    'config': config,
-                    'metrics': metrics,
-                    'score': self._calculate_score(config, metrics)
-                })
+                rank = prefer(config) if prefer else 0
+                candidates.append((rank, proxy_id, config, metrics, score))
+                preferred += rank == 0
+                if preferred >= window or len(candidates) >= limit:
+                    break
             
             if not candidates:
                 return None
+            best_rank = min(candidate[0] for candidate in candidates)
+            pool = [candidate for candidate in candidates if candidate[0] == best_rank]
+            chosen = pool[self.selection.choose([
+                Candidate(candidate[1], candidate[4], self._proxy_load(candidate[1])) for candidate in pool
+            ])]
+        finally:
+            # 并发已满和未被选中的候选放回索引
+            for item in saturated:
+                self._index_proxy(*item)
+            for candidate in candidates:
+                if candidate is not chosen:
+                    self._index_proxy(*candidate[1:4])
+        
+        # 记录使用（同时将代理以新评分放回索引）
+        _, proxy_id, config, metrics, _ = chosen
+        await self._record_usage(proxy_id)
+        return proxy_id, config, metrics
+    
+    async def _sample_candidates(self, region: Optional[ProxyRegion]
+                                 ) -> List[Tuple[str, ProxyConfig, ProxyMetrics, float]]:
+        """从评分索引均匀抽样可用候选，按评分降序返回"""
+        candidates = []
+        for proxy_id, _ in self._score_index.sample(self.selection.samples, region, self.selection.rng):
+            config, metrics = await self._load_proxy(proxy_id)
+            if not self._is_selectable(config, metrics):
+                self._score_index.discard(proxy_id)
+                continue
+            if self._proxy_load(proxy_id) >= config.max_concurrent:
+                continue
+            candidates.append((proxy_id, config, metrics, self._calculate_score(config, metrics)))
+        
+        candidates.sort(key=lambda candidate: -candidate[3])
+        return candidates
+    
+    @staticmethod
+    def _proxy_info(proxy_id: str, config: ProxyConfig, metrics: ProxyMetrics) -> Dict:
+        return {
+            'proxy_id': proxy_id,
+            'proxy_url': config.proxy_url,
+            'connection_info': config.connection_info,
+            'health_score': metrics.health_score,
+            'region': config.region.value,
+            'provider': config.provider,
+            'response_time': metrics.average_response_time
+        }
+    
+    async def acquire_lease(self, region: Optional[ProxyRegion] = None, timeout: Optional[float] = None,
+                            prefer: Optional[Callable[[ProxyConfig], int]] = None) -> 'ProxyLease':
+        """租用代理，需配合release_lease归还；lease()是其上下文管理器形式
+        
+        prefer仅作用于无需排队的立即分配，排队者按地区分配评分最高的代理。
+        """
+        loop = asyncio.get_running_loop()
+        requested_at = loop.time()
+        
+        # 已有排队者时新请求直接排队，避免插队
+        selected = None
+        if not self._lease_waiters:
+            async with self._lease_lock:
+                selected = await self._select_proxy(region, prefer)
+                if selected is not None and not self._claim_proxy(selected[0], selected[1]):
+                    # 被其他进程抢先占满，排队等待
+                    selected = None
+        
+        if selected is None:
+            waiter = loop.create_future()
+            entry = (region, waiter)
+            self._lease_waiters.append(entry)
+            if self.lease_table is not None and (
+                    self._shared_capacity_poll is None or self._shared_capacity_poll.done()):
+                self._shared_capacity_poll = asyncio.ensure_future(self._poll_shared_capacity())
+            try:
+                selected = await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except BaseException:
+                if entry in self._lease_waiters:
+                    self._lease_waiters.remove(entry)
+                # 分配结果已送达但调用方放弃等待时归还容量
+                if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    self._release_proxy_claim(waiter.result()[0])
+                    self._schedule_lease_dispatch()
+                waiter.cancel()
+                raise
+        
+        return self._new_lease(selected, requested_at)
+    
+    async def try_acquire_lease(self, proxy_id: str) -> Optional['ProxyLease']:
+        """立即租用指定代理，不排队；代理不可选或并发已满时返回None"""
+        requested_at = asyncio.get_running_loop().time()
+        async with self._lease_lock:
+            config, metrics = await self._load_proxy(proxy_id)
+            if not self._is_selectable(config, metrics):
+                return None
+            if self._proxy_load(proxy_id) >= config.max_concurrent:
+                return None
+            if not self._claim_proxy(proxy_id, config):
+                return None
             
-            # 选择最佳代理
-            best = max(candidates, key=lambda x: x['score'])
+            await self._record_usage(proxy_id)
+        
+        return self._new_lease((proxy_id, config, metrics), requested_at)
+    
+    async def is_proxy_selectable(self, proxy_id: str) -> bool:
+        """代理是否活跃、健康分达标且未超日限额（不考虑并发占用）"""
+        return self._is_selectable(*await self._load_proxy(proxy_id))
+    
+    async def has_selectable_proxy(self, region: Optional[ProxyRegion] = None) -> bool:
+        """地区内是否有可选代理（不考虑并发占用），无可选代理时按地区租用会一直等待"""
+        self._check_usage_rollover()
+        await self._ensure_score_index()
+        return self._score_index.peek(region) is not None
+    
+    def _new_lease(self, selected: Tuple[str, ProxyConfig, ProxyMetrics], requested_at: float) -> 'ProxyLease':
+        now = asyncio.get_running_loop().time()
+        self._lease_wait_times.add(now - requested_at)
+        return ProxyLease(
+            proxy_id=selected[0],
+            proxy=self._proxy_info(*selected),
+            wait_time=now - requested_at,
+            acquired_at=now
+        )
+    
+    async def release_lease(self, lease: 'ProxyLease', outcome: Optional[str] = 'success'):
+        """归还租约：outcome为'success'记为成功，lease.error非空记为错误，None只归还容量"""
+        held = asyncio.get_running_loop().time() - lease.acquired_at
+        self._lease_hold_times.add(held)
+        self._release_proxy_claim(lease.proxy_id)
+        
+        try:
+            if lease.error:
+                await self.mark_proxy_error(lease.proxy_id, lease.error)
+            elif outcome == 'success':
+                await self.update_proxy_success(lease.proxy_id, lease.response_time or held)
+        finally:
+            self._schedule_lease_dispatch()
+    
+    def _proxy_load(self, proxy_id: str) -> int:
+        """在途请求数；有共享租用表时为同机所有进程的合计"""
+        if self.lease_table is None:
+            return self._in_flight.get(proxy_id, 0)
+        return self.lease_table.in_flight(f'proxy:{proxy_id}')
+    
+    def _claim_proxy(self, proxy_id: str, config: ProxyConfig) -> bool:
+        if self.lease_table is not None and not self.lease_table.try_acquire(
+                f'proxy:{proxy_id}', config.max_concurrent, self.clock()):
+            return False
+        self._in_flight[proxy_id] += 1
+        return True
+    
+    def _release_proxy_claim(self, proxy_id: str):
+        self._in_flight[proxy_id] -= 1
+        if self._in_flight[proxy_id] <= 0:
+            del self._in_flight[proxy_id]
+        if self.lease_table is not None:
+            self.lease_table.release(f'proxy:{proxy_id}')
+    
+    async def _poll_shared_capacity(self):
+        while self._lease_waiters:
+            await asyncio.sleep(self.shared_poll_interval)
+            self._schedule_lease_dispatch()
+    
+    def _schedule_lease_dispatch(self):
+        if not self._lease_waiters:
+            return
+        
+        # 分配进行中时只记下请求，由当前分配任务再跑一轮，避免丢失唤醒
+        self._lease_dispatch_requested = True
+        if not self._lease_dispatching:
+            self._lease_dispatching = True
+            asyncio.ensure_future(self._dispatch_lease_waiters())
+    
+    async def _dispatch_lease_waiters(self):
+        """按先来先到为排队者分配代理；某地区无容量时不阻塞其他地区的排队者"""
+        try:
+            while self._lease_dispatch_requested and self._lease_waiters:
+                self._lease_dispatch_requested = False
+                async with self._lease_lock:
+                    await self._dispatch_lease_round()
+        except Exception as e:
+            self.logger.error(f"Lease dispatch failed: {e}")
+        finally:
+            self._lease_dispatching = False
+    
+    async def _dispatch_lease_round(self):
+        exhausted = set()
+        for entry in list(self._lease_waiters):
+            region, waiter = entry
+            if waiter.done():
+                continue
+            if region in exhausted or None in exhausted:
+                continue
             
-            # 记录使用
-            await self._record_usage(best['proxy_id'])
+            selected = await self._select_proxy(region)
+            if selected is None:
+                exhausted.add(region)
+                continue
+            if not self._claim_proxy(selected[0], selected[1]):
+                # 被其他进程抢先占满，留在队列中等下一轮
+                continue
             
-            return {
-                'proxy_id': best['proxy_id'],
-                'proxy_url': best['config'].proxy_url,
-                'connection_info': best['config'].connection_info,
-                'health_score': best['metrics'].health_score,
-                'region': best['config'].region.value,
-                'response_time': best['metrics'].average_response_time
-            }
+            # 放弃等待的排队者会自行移出队列
+            if entry in self._lease_waiters:
+                self._lease_waiters.remove(entry)
+            if waiter.done():
+                # 排队者在分配期间放弃，归还刚占用的容量
+                self._release_proxy_claim(selected[0])
+                continue
+            waiter.set_result(selected)
+    
+    async def rebuild_score_index(self) -> int:
+        """全量扫描活跃代理重建评分索引，返回索引中的代理数"""
+        self._score_index.clear()
+        active_proxies = await self.redis.smembers('proxies:active')
+        
+        for proxy_id in active_proxies:
+            proxy_id = proxy_id.decode() if isinstance(proxy_id, bytes) else proxy_id
             
-        except Exception as e:
-            self.logger.error(f"Failed to get available proxy: {e}")
-            return None
+            config, metrics = await self._load_proxy(proxy_id)
+            self._index_proxy(proxy_id, config, metrics)
+        
+        self._score_index_ready = True
+        self.logger.info(f"Score index rebuilt: {len(self._score_index)}/{len(active_proxies)} selectable")
+        return len(self._score_index)
+    
+    def prime_from_snapshot(self, records: List[Tuple[ProxyConfig, ProxyMetrics]]) -> int:
+        """用快照记录直接填充缓存、评分索引和统计聚合值，跳过启动时的Redis全量扫描
+        
+        记录需与Redis中的数据一致（由pool_snapshot.warm_start先写回或确认），返回可选代理数。
+        """
+        self._score_index.clear()
+        self._pool_stats = PoolStatistics(ProxyStatus.ACTIVE.value, self.STATS_TOTALS)
+        for config, metrics in records:
+            self.config_cache.put(config.proxy_id, config)
+            self.metrics_cache.put(config.proxy_id, metrics)
+            if self.metrics_columns is not None:
+                self.metrics_columns.set_config(config)
+                self.metrics_columns.set_metrics(config.proxy_id, metrics)
+            
+            self._index_proxy(config.proxy_id, config, metrics)
+            if config.status == ProxyStatus.ACTIVE:
+                self._pool_stats.update(config.proxy_id, status=config.status.value,
+                                        **self._stats_fields(config, metrics))
+            else:
+                self._pool_stats.update(config.proxy_id, status=config.status.value)
+        
+        self._usage_day = int(self.clock() // USAGE_DAY_SECONDS)
+        self._score_index_ready = True
+        self._pool_stats_ready = True
+        return len(self._score_index)
+    
+    @asynccontextmanager
+    async def session(self, proxy_id: str):
+        """借用代理的共享aiohttp会话供业务请求使用
+        
+        用法: async with manager.session(proxy['proxy_id']) as session: ...
+        """
+        config = await self._get_proxy_config(proxy_id)
+        if not config:
+            raise KeyError(f"Unknown proxy {proxy_id}")
+        
+        async with self.session_pool.borrow(config) as session:
+            yield session
+    
+    async def close(self):
+        """写入剩余的聚合指标并关闭所有代理会话"""
+        if self.metric_writer:
+            await self.metric_writer.close()
+        await self.session_pool.close()
+    
+    def cache_stats(self) -> Dict:
+        """配置/指标缓存的命中统计"""
+        return {
+            'config': self.config_cache.stats,
+            'metrics': self.metrics_cache.stats
+        }
     
     async def _test_proxy_connection(self, config: ProxyConfig) -> bool:
         """测试SOCKS5代理连接"""
         try:
             start_time = time.time()
             
-            # 使用aiohttp测试代理连接
-            proxy_url = config.proxy_url
-            timeout = aiohttp.ClientTimeout(total=10)
+            # 通过连接池中的共享会话测试，复用已建立的隧道
+            timeout = aiohttp.ClientTimeout(total=self.test_timeout)
             
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(
-                    'https://httpbin.org/ip',
-                    proxy=proxy_url
-                ) as response:
+            async with self.session_pool.borrow(config) as session:
+                async with session.get(self.test_url, timeout=timeout) as response:
                     if response.status == 200:
                         response_time = time.time() - start_time
                         await self._update_response_time(config.proxy_id, response_time)
@@ -273,69 +1168,156 @@ class SOCKS5ProxyManager:
     
     async def update_proxy_success(self, proxy_id: str, response_time: float = 0.0):
         """更新代理成功记录"""
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'total_requests', 1)
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'successful_requests', 1)
-        await self.redis.hset(f'proxy:{proxy_id}:metrics', 'consecutive_errors', '0')
-        await self.redis.hset(f'proxy:{proxy_id}:metrics', 'last_success', datetime.utcnow().isoformat())
+        now = datetime.utcnow()
+        if self.metric_writer:
+            _, metrics = await self._load_proxy(proxy_id)
+            fields = {
+                'total_requests': metrics.total_requests + 1,
+                'successful_requests': metrics.successful_requests + 1,
+                'consecutive_errors': 0,
+                'last_success': now
+            }
+            if response_time > 0:
+                fields['average_response_time'] = self._next_average(metrics, response_time)
+            self.metric_writer.record_success(proxy_id, response_time, now)
+            self._update_cached_metrics(proxy_id, **fields)
+            await self._refresh_proxy(proxy_id)
+            await self.metric_writer.maybe_flush()
+            return
         
+        mapping = {
+            'consecutive_errors': '0',
+            'last_success': now.isoformat()
+        }
+        fields = {'consecutive_errors': 0, 'last_success': now}
         if response_time > 0:
-            await self._update_response_time(proxy_id, response_time)
+            # 平均响应时间按缓存指标计算，与计数写入同一管道（未命中时的读取随后评分刷新也要做）
+            fields['average_response_time'] = self._next_average(await self._get_proxy_metrics(proxy_id), response_time)
+            mapping['average_response_time'] = str(fields['average_response_time'])
+        
+        pipe = self.redis.pipeline()
+        pipe.hincrby(f'proxy:{proxy_id}:metrics', 'total_requests', 1)
+        pipe.hincrby(f'proxy:{proxy_id}:metrics', 'successful_requests', 1)
+        pipe.hset(f'proxy:{proxy_id}:metrics', mapping=mapping)
+        results = await pipe.execute()
+        
+        self._update_cached_metrics(
+            proxy_id, total_requests=results[0], successful_requests=results[1], **fields
+        )
+        
+        await self._refresh_proxy(proxy_id)
         
         self.logger.debug(f"Proxy {proxy_id} success recorded")
     
     async def mark_proxy_error(self, proxy_id: str, error: str):
         """标记代理错误"""
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'total_requests', 1)
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'failed_requests', 1)
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'consecutive_errors', 1)
+        if self.metric_writer:
+            # 缓存指标已叠加待写增量，连续错误在本地判定，暂停不等待刷新
+            _, metrics = await self._load_proxy(proxy_id)
+            self.metric_writer.record_error(proxy_id)
+            total_requests, failed_requests = metrics.total_requests + 1, metrics.failed_requests + 1
+            consecutive_errors = metrics.consecutive_errors + 1
+        else:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(f'proxy:{proxy_id}:metrics', 'total_requests', 1)
+            pipe.hincrby(f'proxy:{proxy_id}:metrics', 'failed_requests', 1)
+            pipe.hincrby(f'proxy:{proxy_id}:metrics', 'consecutive_errors', 1)
+            total_requests, failed_requests, consecutive_errors = await pipe.execute()
+        
+        self._update_cached_metrics(
+            proxy_id, total_requests=total_requests, failed_requests=failed_requests,
+            consecutive_errors=consecutive_errors
+        )
         
         # 检查是否需要暂停
-        consecutive_errors = await self.redis.hget(f'proxy:{proxy_id}:metrics', 'consecutive_errors')
         if consecutive_errors and int(consecutive_errors) >= 5:
             await self._suspend_proxy(proxy_id, f"Too many errors: {error}")
+        else:
+            await self._refresh_proxy(proxy_id)
+        if self.metric_writer:
+            await self.metric_writer.maybe_flush()
         
         self.logger.warning(f"Proxy {proxy_id} error: {error}")
     
     async def get_statistics(self) -> Dict:
-        """获取代理池统计信息"""
+        """获取代理池统计信息（增量聚合，常数时间）"""
         try:
-            active_proxies = await self.redis.smembers('proxies:active')
-            error_proxies = await self.redis.smembers('proxies:error')
+            self._check_usage_rollover()
+            if not self._pool_stats_ready:
+                await self.reconcile_statistics()
             
-            total_health = 0.0
-            total_usage = 0
-            total_response_time = 0.0
-            region_stats = {}
+            return self._format_statistics(self._pool_stats)
             
-            for proxy_id in active_proxies:
+        except Exception as e:
+            self.logger.error(f"Failed to get proxy statistics: {e}")
+            return {}
+    
+    async def reconcile_statistics(self) -> Dict:
+        """全量扫描重算统计聚合值，替换运行值并返回两者的偏差"""
+        scanned = PoolStatistics(ProxyStatus.ACTIVE.value, self.STATS_TOTALS)
+        
+        for status in ProxyStatus:
+            members = await self.redis.smembers(f'proxies:{status.value}')
+            for proxy_id in members:
                 proxy_id = proxy_id.decode() if isinstance(proxy_id, bytes) else proxy_id
                 
-                config = await self._get_proxy_config(proxy_id)
-                metrics = await self._get_proxy_metrics(proxy_id)
+                if status != ProxyStatus.ACTIVE:
+                    scanned.update(proxy_id, status=status.value)
+                    continue
                 
+                config, metrics = await self._load_proxy(proxy_id)
                 if config and metrics:
-                    total_health += metrics.health_score
-                    total_usage += metrics.daily_usage
-                    total_response_time += metrics.average_response_time
-                    
-                    region = config.region.value
-                    region_stats[region] = region_stats.get(region, 0) + 1
-            
-            active_count = len(active_proxies)
-            
-            return {
-                'total_proxies': active_count + len(error_proxies),
-                'active_proxies': active_count,
-                'error_proxies': len(error_proxies),
-                'average_health_score': total_health / active_count if active_count > 0 else 0.0,
-                'average_response_time': total_response_time / active_count if active_count > 0 else 0.0,
-                'total_daily_usage': total_usage,
-                'region_distribution': region_stats
+                    scanned.update(proxy_id, status=status.value, **self._stats_fields(config, metrics))
+        
+        drift = {}
+        if self._pool_stats_ready:
+            running = self._format_statistics(self._pool_stats)
+            expected = self._format_statistics(scanned)
+            drift = {
+                key: {'running': running[key], 'scanned': expected[key]}
+                for key in expected
+                if (abs(running[key] - expected[key]) > 1e-6
+                    if isinstance(expected[key], float) else running[key] != expected[key])
             }
-            
-        except Exception as e:
-            self.logger.error(f"Failed to get proxy statistics: {e}")
-            return {}
+            if drift:
+                self.logger.warning(f"Proxy statistics drift corrected: {drift}")
+        
+        self._pool_stats = scanned
+        self._pool_stats_ready = True
+        return drift
+    
+    async def run_statistics_reconciliation(self, interval: float = 300.0):
+        """周期对账任务，用asyncio.create_task启动"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_statistics()
+            except Exception as e:
+                self.logger.error(f"Statistics reconciliation failed: {e}")
+    
+    @staticmethod
+    def _format_statistics(stats: PoolStatistics) -> Dict:
+        active_count = stats.count(ProxyStatus.ACTIVE.value)
+        error_count = stats.count(ProxyStatus.ERROR.value)
+        
+        return {
+            'total_proxies': active_count + error_count,
+            'active_proxies': active_count,
+            'error_proxies': error_count,
+            'average_health_score': stats.average('health'),
+            'average_response_time': stats.average('response_time'),
+            'total_daily_usage': stats.totals['usage'],
+            'region_distribution': stats.group_distribution()
+        }
+    
+    @staticmethod
+    def _stats_fields(config: ProxyConfig, metrics: ProxyMetrics) -> Dict:
+        return {
+            'group': config.region.value,
+            'health': metrics.health_score,
+            'usage': metrics.daily_usage,
+            'response_time': metrics.average_response_time
+        }
     
     # 辅助方法
     async def _save_proxy_config(self, config: ProxyConfig):
@@ -343,12 +1325,53 @@ class SOCKS5ProxyManager:
         config_dict['region'] = config.region.value
         config_dict['status'] = config.status.value
         
-        await self.redis.hset(f'proxy:{config.proxy_id}:config', mapping=config_dict)
-        await self.redis.sadd('proxies:all', config.proxy_id)
-        await self.redis.sadd('proxies:active', config.proxy_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(f'proxy:{config.proxy_id}:config', mapping=config_dict)
+        pipe.sadd('proxies:all', config.proxy_id)
+        pipe.sadd(f'proxies:{config.status.value}', config.proxy_id)
+        await pipe.execute()
+        
+        self.config_cache.put(config.proxy_id, config)
+        if self.metrics_columns is not None:
+            self.metrics_columns.set_config(config)
+    
+    async def _load_proxy(self, proxy_id: str) -> Tuple[Optional[ProxyConfig], ProxyMetrics]:
+        """读取代理配置和指标，缓存未命中的部分一次往返取回"""
+        self._check_usage_rollover()
+        config = self.config_cache.get(proxy_id)
+        metrics = self.metrics_cache.get(proxy_id)
+        if config and metrics:
+            return config, metrics
+        
+        pipe = self.redis.pipeline(transaction=False)
+        if not config:
+            pipe.hgetall(f'proxy:{proxy_id}:config')
+        if not metrics:
+            pipe.hgetall(f'proxy:{proxy_id}:metrics')
+            pipe.get(self._usage_keys(proxy_id)[0])
+        results = await pipe.execute()
+        
+        if not config:
+            config = self._cache_proxy_config(proxy_id, results.pop(0))
+        if not metrics:
+            metrics = self._cache_proxy_metrics(proxy_id, results[0], results[1])
+        return config, metrics
     
     async def _get_proxy_config(self, proxy_id: str) -> Optional[ProxyConfig]:
-        config_data = await self.redis.hgetall(f'proxy:{proxy_id}:config')
+        config = self.config_cache.get(proxy_id)
+        if config:
+            return config
+        return self._cache_proxy_config(proxy_id, await self.redis.hgetall(f'proxy:{proxy_id}:config'))
+    
+    def _cache_proxy_config(self, proxy_id: str, config_data: Dict) -> Optional[ProxyConfig]:
+        config = self._parse_proxy_config(config_data)
+        if config:
+            self.config_cache.put(proxy_id, config)
+            if self.metrics_columns is not None:
+                self.metrics_columns.set_config(config)
+        return config
+    
+    def _parse_proxy_config(self, config_data: Dict) -> Optional[ProxyConfig]:
         if not config_data:
             return None
         
@@ -365,6 +1388,9 @@ class SOCKS5ProxyManager:
         metrics = ProxyMetrics()
         metrics_dict = asdict(metrics)
         
+        # 日用量存放在分桶计数器中
+        metrics_dict.pop('daily_usage')
+        
         for key, value in metrics_dict.items():
             if isinstance(value, datetime):
                 metrics_dict[key] = value.isoformat()
@@ -372,9 +1398,45 @@ class SOCKS5ProxyManager:
                 metrics_dict[key] = ''
         
         await self.redis.hset(f'proxy:{proxy_id}:metrics', mapping=metrics_dict)
+        self.metrics_cache.put(proxy_id, metrics)
+        if self.metrics_columns is not None:
+            self.metrics_columns.set_metrics(proxy_id, metrics)
     
     async def _get_proxy_metrics(self, proxy_id: str) -> ProxyMetrics:
-        metrics_data = await self.redis.hgetall(f'proxy:{proxy_id}:metrics')
+        self._check_usage_rollover()
+        metrics = self.metrics_cache.get(proxy_id)
+        if metrics:
+            return metrics
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(f'proxy:{proxy_id}:metrics')
+        pipe.get(self._usage_keys(proxy_id)[0])
+        metrics_data, daily_usage = await pipe.execute()
+        return self._cache_proxy_metrics(proxy_id, metrics_data, daily_usage)
+    
+    def _cache_proxy_metrics(self, proxy_id: str, metrics_data: Dict, daily_usage: Optional[str] = None) -> ProxyMetrics:
+        if metrics_data:
+            metrics_data['daily_usage'] = daily_usage or 0
+        metrics = self._parse_proxy_metrics(metrics_data)
+        # 不存在的代理返回默认指标，但不缓存
+        if metrics_data:
+            if self.metric_writer:
+                self.metric_writer.overlay(proxy_id, metrics)
+            self.metrics_cache.put(proxy_id, metrics)
+            if self.metrics_columns is not None:
+                self.metrics_columns.set_metrics(proxy_id, metrics)
+        return metrics
+    
+    def _update_cached_metrics(self, proxy_id: str, **fields):
+        """写穿：把刚写入Redis的字段同步到缓存对象"""
+        metrics = self.metrics_cache.peek(proxy_id)
+        if metrics:
+            for field, value in fields.items():
+                setattr(metrics, field, value)
+        if self.metrics_columns is not None:
+            self.metrics_columns.update(proxy_id, **fields)
+    
+    def _parse_proxy_metrics(self, metrics_data: Dict) -> ProxyMetrics:
         if not metrics_data:
             return ProxyMetrics()
         
@@ -398,26 +1460,207 @@ class SOCKS5ProxyManager:
         return health_score + usage_score + response_score
     
     async def _record_usage(self, proxy_id: str):
-        await self.redis.hincrby(f'proxy:{proxy_id}:metrics', 'daily_usage', 1)
-        await self.redis.hset(f'proxy:{proxy_id}:metrics', 'last_used', datetime.utcnow().isoformat())
+        self._check_usage_rollover()
+        day_key, window_key = self._usage_keys(proxy_id)
+        now = datetime.utcnow()
+        
+        pipe = self.redis.pipeline()
+        pipe.incr(day_key)
+        pipe.expire(day_key, 2 * USAGE_DAY_SECONDS)
+        pipe.incr(window_key)
+        pipe.expire(window_key, 2 * USAGE_WINDOW_SECONDS)
+        pipe.hset(f'proxy:{proxy_id}:metrics', 'last_used', now.isoformat())
+        daily_usage = (await pipe.execute())[0]
+        
+        self._update_cached_metrics(proxy_id, daily_usage=daily_usage, last_used=now)
+        await self._refresh_proxy(proxy_id)
+    
+    async def get_usage(self, proxy_id: str) -> Dict:
+        """当天和当前15分钟窗口的使用次数"""
+        day_key, window_key = self._usage_keys(proxy_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(day_key)
+        pipe.get(window_key)
+        daily, window = await pipe.execute()
+        return {'daily': int(daily or 0), 'window': int(window or 0)}
+    
+    def _usage_keys(self, proxy_id: str) -> Tuple[str, str]:
+        now = self.clock()
+        return (
+            f'proxy:{proxy_id}:usage:day:{int(now // USAGE_DAY_SECONDS)}',
+            f'proxy:{proxy_id}:usage:15m:{int(now // USAGE_WINDOW_SECONDS)}'
+        )
+    
+    def _check_usage_rollover(self):
+        """跨天时清零本地缓存的日用量，评分索引和统计聚合在下次使用时重建"""
+        day = int(self.clock() // USAGE_DAY_SECONDS)
+        if day == self._usage_day:
+            return
+        
+        self._usage_day = day
+        for metrics in self.metrics_cache.values():
+            metrics.daily_usage = 0
+        if self.metrics_columns is not None:
+            self.metrics_columns.daily_usage[:] = 0
+        
+        self._score_index_ready = False
+        self._pool_stats_ready = False
+        self.logger.info("Usage day rolled over, local indexes will be rebuilt")
+    
+    def _is_selectable(self, config: Optional[ProxyConfig], metrics: Optional[ProxyMetrics]) -> bool:
+        if not config or not metrics:
+            return False
+        if config.status != ProxyStatus.ACTIVE:
+            return False
+        if metrics.daily_usage >= config.daily_limit:
+            return False
+        return metrics.health_score >= self.health_threshold
+    
+    def _index_proxy(self, proxy_id: str, config: Optional[ProxyConfig], metrics: Optional[ProxyMetrics]):
+        if self._is_selectable(config, metrics):
+            self._score_index.update(proxy_id, config.region, self._calculate_score(config, metrics))
+        else:
+            self._score_index.discard(proxy_id)
+    
+    async def _ensure_score_index(self):
+        if not self._score_index_ready:
+            await self.rebuild_score_index()
+    
+    async def _refresh_proxy(self, proxy_id: str):
+        """代理配置或指标变化后增量更新评分索引和统计聚合值"""
+        if not self._score_index_ready and not self._pool_stats_ready:
+            return
+        
+        config, metrics = await self._load_proxy(proxy_id)
+        if self._score_index_ready:
+            self._index_proxy(proxy_id, config, metrics)
+            if proxy_id in self._score_index:
+                self._schedule_lease_dispatch()
+        if self._pool_stats_ready and config:
+            self._pool_stats.update(proxy_id, status=config.status.value, **self._stats_fields(config, metrics))
+    
+    @staticmethod
+    def _next_average(metrics: ProxyMetrics, response_time: float) -> float:
+        return metrics.average_response_time * 0.8 + response_time * 0.2
     
     async def _update_response_time(self, proxy_id: str, response_time: float):
-        current_avg = await self.redis.hget(f'proxy:{proxy_id}:metrics', 'average_response_time')
-        current_avg = float(current_avg) if current_avg else 0.0
-        new_avg = (current_avg * 0.8) + (response_time * 0.2)
+        new_avg = self._next_average(await self._get_proxy_metrics(proxy_id), response_time)
         await self.redis.hset(f'proxy:{proxy_id}:metrics', 'average_response_time', str(new_avg))
+        self._update_cached_metrics(proxy_id, average_response_time=new_avg)
     
     async def _update_proxy_status(self, proxy_id: str, status: ProxyStatus):
-        await self.redis.hset(f'proxy:{proxy_id}:config', 'status', status.value)
+        """状态字段与状态索引在一个事务内切换，代理不会出现在零个或多个状态集合中"""
+        config = self.config_cache.peek(proxy_id)
+        previous = config.status if config else None
+        
+        pipe = self.redis.pipeline()
+        if previous is not None:
+            pipe.hset(f'proxy:{proxy_id}:config', 'status', status.value)
+            pipe.smove(f'proxies:{previous.value}', f'proxies:{status.value}', proxy_id)
+        else:
+            self._queue_status_reset(pipe, proxy_id, status)
+        results = await pipe.execute()
         
-        # 更新状态索引
+        if self.lease_table is not None:
+            self.lease_table.set_status(f'proxy:{proxy_id}', status.value)
+        
+        if previous is not None and not results[-1]:
+            # 缓存中的旧状态已过期（如并发切换），按全部状态集合重置，仍是单个事务
+            pipe = self.redis.pipeline()
+            self._queue_status_reset(pipe, proxy_id, status)
+            await pipe.execute()
+        
+        if config:
+            config.status = status
+        if self.metrics_columns is not None:
+            self.metrics_columns.update(proxy_id, status=status)
+        
+        await self._refresh_proxy(proxy_id)
+    
+    def _queue_status_reset(self, pipe, proxy_id: str, status: ProxyStatus):
+        # 同时写入状态字段：较晚执行的重置会覆盖其间其他切换写入的状态字段，与状态集合保持一致
+        pipe.hset(f'proxy:{proxy_id}:config', 'status', status.value)
         for s in ProxyStatus:
-            await self.redis.srem(f'proxies:{s.value}', proxy_id)
-        await self.redis.sadd(f'proxies:{status.value}', proxy_id)
+            if s != status:
+                pipe.srem(f'proxies:{s.value}', proxy_id)
+        pipe.sadd(f'proxies:{status.value}', proxy_id)
     
     async def _suspend_proxy(self, proxy_id: str, reason: str):
         await self._update_proxy_status(proxy_id, ProxyStatus.ERROR)
+        await self.session_pool.discard(proxy_id)
         self.logger.warning(f"Proxy {proxy_id} suspended: {reason}")
+        
+        for listener in self.suspension_listeners:
+            await listener(proxy_id, reason)
+    
+    async def probe_proxy(self, proxy_id: str) -> bool:
+        """发送一次测试请求检查代理是否恢复，不改变状态"""
+        config = await self._get_proxy_config(proxy_id)
+        if not config:
+            return False
+        return await self._test_proxy_connection(config)
+    
+    async def recheck_proxies(self, proxy_ids: Optional[List[str]] = None, concurrency: int = 100) -> Dict:
+        """重新测试活跃代理（默认全部），未通过的暂停并通知监听者；用于快照热启动后的后台复查"""
+        if proxy_ids is None:
+            proxy_ids = [
+                member.decode() if isinstance(member, bytes) else member
+                for member in await self.redis.smembers(f'proxies:{ProxyStatus.ACTIVE.value}')
+            ]
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        failed = []
+        
+        async def check(proxy_id: str):
+            async with semaphore:
+                try:
+                    healthy = await self.probe_proxy(proxy_id)
+                except Exception as e:
+                    self.logger.error(f"Recheck of proxy {proxy_id} failed: {e}")
+                    return
+                config = self.config_cache.peek(proxy_id)
+                # 复查期间已被其他路径切换状态的代理不再处理
+                if not healthy and (config is None or config.status == ProxyStatus.ACTIVE):
+                    failed.append(proxy_id)
+                    await self._suspend_proxy(proxy_id, "Failed health recheck")
+        
+        await asyncio.gather(*(check(proxy_id) for proxy_id in proxy_ids))
+        self.logger.info(f"Rechecked {len(proxy_ids)} proxies, {len(failed)} suspended")
+        return {'checked': len(proxy_ids), 'failed': len(failed)}
+    
+    async def reinstate_proxy(self, proxy_id: str):
+        """恢复暂停的代理：清零连续错误并移回活跃集合"""
+        await self.redis.hset(f'proxy:{proxy_id}:metrics', 'consecutive_errors', '0')
+        if self.metric_writer:
+            self.metric_writer.reset_errors(proxy_id)
+        self._update_cached_metrics(proxy_id, consecutive_errors=0)
+        await self._update_proxy_status(proxy_id, ProxyStatus.ACTIVE)
+        self.logger.info(f"Proxy {proxy_id} reinstated")
+    
+    async def get_proxy_config(self, proxy_id: str) -> Optional[ProxyConfig]:
+        """获取代理配置，代理不存在时返回None"""
+        return await self._get_proxy_config(proxy_id)
+    
+    async def remove_proxy(self, proxy_id: str):
+        """从代理池删除代理：删除配置、指标和用量计数，并移出全部索引"""
+        pipe = self.redis.pipeline()
+        pipe.delete(f'proxy:{proxy_id}:config')
+        pipe.delete(f'proxy:{proxy_id}:metrics')
+        for key in self._usage_keys(proxy_id):
+            pipe.delete(key)
+        pipe.srem('proxies:all', proxy_id)
+        for status in ProxyStatus:
+            pipe.srem(f'proxies:{status.value}', proxy_id)
+        await pipe.execute()
+    
+        self.config_cache.invalidate(proxy_id)
+        self.metrics_cache.invalidate(proxy_id)
+        self._score_index.discard(proxy_id)
+        self._pool_stats.remove(proxy_id)
+        if self.metrics_columns is not None:
+            self.metrics_columns.remove(proxy_id)
+        await self.session_pool.discard(proxy_id)
+        self.logger.info(f"Proxy {proxy_id} removed")
 
 # 使用示例
 async def example_usage():
@@ -488,6 +1731,8 @@ async def example_usage():
     # 再次获取统计
     stats = await proxy_manager.get_statistics()
     print(f"\n更新后平均健康分数: {stats['average_health_score']:.2f}")
+    
+    await proxy_manager.close()
 
 if __name__ == "__main__":
     asyncio.run(example_usage())
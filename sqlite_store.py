@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+SQLite持久化存储
+与MockRedis接口一致的异步存储（hset/hget/hgetall/hincrby/sadd/smembers/srem/smove/
+get/set/incr/expire/ttl/delete/pipeline），数据写入WAL模式的SQLite文件，重启后代理和账号的
+指标、健康历史不丢失，同机多个进程可打开同一文件共享池状态。
+
+所有命令交给一个专用线程按提交顺序执行：线程每次取出队列中积压的全部命令，
+在一个事务内执行并提交后再返回结果，高并发时多条命令共用一次提交。
+管道的命令作为整体执行，同一事务内不会插入其他命令，等同于MULTI/EXEC。
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (key TEXT, field TEXT, value TEXT, PRIMARY KEY (key, field)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS strings (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sets (key TEXT, member TEXT, PRIMARY KEY (key, member)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS expires (key TEXT PRIMARY KEY, deadline REAL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS expires_deadline ON expires (deadline);
+"""
+
+Command = Tuple[str, tuple, dict]
+
+class SQLitePipeline:
+    """命令先排队，execute()时作为一个整体交给写线程，接口与MockPipeline一致"""
+
+    def __init__(self, store: 'SQLiteStore', transaction: bool = True):
+        self.store = store
+        self.transaction = transaction
+        self.command_stack: List[Command] = []
+
+    def __getattr__(self, name: str):
+        if name not in SQLiteStore.COMMANDS:
+            raise AttributeError(name)
+
+        def queue_command(*args, **kwargs):
+            self.command_stack.append((name, args, kwargs))
+            return self
+
+        return queue_command
+
+    def __len__(self) -> int:
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def multi(self):
+        self.transaction = True
+        return self
+
+    def reset(self):
+        self.command_stack = []
+
+    async def execute(self, raise_on_error: bool = True) -> List:
+        stack, self.command_stack = self.command_stack, []
+        if not stack:
+            return []
+
+        # 与Redis一致，单条命令出错不回滚其余命令
+        results = await self.store._submit(stack)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+class SQLiteStore:
+    """SQLite（WAL）持久化存储，可替换MockRedis传给管理器
+
+    过期时间使用墙上时钟，重启后继续生效；访问时惰性检查，写线程空闲前按截止时间主动清理。
+    synchronous=NORMAL：进程崩溃不丢已返回的写入，断电可能丢失最后几个事务。
+
+    用法:
+        store = SQLiteStore('pool.db')
+        manager = SOCKS5ProxyManager(redis_client=store)
+        ...
+        await store.close()
+    """
+
+    COMMANDS = frozenset({
+        'hset', 'hget', 'hgetall', 'hincrby', 'sadd', 'smembers', 'srem', 'smove',
+        'get', 'set', 'incr', 'expire', 'ttl', 'delete', 'evict_expired'
+    })
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time, max_batch: int = 1000,
+                 busy_timeout: float = 5.0):
+        self.path = path
+        self.clock = clock
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self.logger = logging.getLogger(__name__)
+        self.active_expire_interval = 0.1
+        self._last_active_expire = clock()
+
+        self.commits = 0
+        self.commands = 0
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name=f'sqlite-store:{path}', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error:
+            raise self._startup_error
+
+    # 命令接口（与MockRedis一致）
+    async def hset(self, key: str, field: str = None, value: str = None, mapping: Dict = None, **kwargs):
+        return await self._call('hset', key, field, value, mapping, **kwargs)
+
+    async def hget(self, key: str, field: str):
+        return await self._call('hget', key, field)
+
+    async def hgetall(self, key: str):
+        return await self._call('hgetall', key)
+
+    async def hincrby(self, key: str, field: str, amount: int = 1):
+        return await self._call('hincrby', key, field, amount)
+
+    async def sadd(self, key: str, *values):
+        return await self._call('sadd', key, *values)
+
+    async def smembers(self, key: str):
+        return await self._call('smembers', key)
+
+    async def srem(self, key: str, *values):
+        return await self._call('srem', key, *values)
+
+    async def smove(self, src: str, dst: str, member: str) -> bool:
+        return await self._call('smove', src, dst, member)
+
+    async def get(self, key: str):
+        return await self._call('get', key)
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None):
+        return await self._call('set', key, value, ex)
+
+    async def incr(self, key: str):
+        return await self._call('incr', key)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return await self._call('expire', key, seconds)
+
+    async def ttl(self, key: str) -> int:
+        return await self._call('ttl', key)
+
+    async def delete(self, key: str):
+        return await self._call('delete', key)
+
+    async def evict_expired(self, max_keys: int = 1000) -> int:
+        """主动清理已过期的键，每次最多max_keys个，返回清理数量"""
+        return await self._call('evict_expired', max_keys)
+
+    def pipeline(self, transaction: bool = True) -> SQLitePipeline:
+        return SQLitePipeline(self, transaction)
+
+    def multi(self) -> SQLitePipeline:
+        return self.pipeline(transaction=True).multi()
+
+    async def close(self):
+        """处理完已提交的命令后关闭数据库"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
+    def stats(self) -> Dict:
+        return {
+            'commands': self.commands,
+            'commits': self.commits,
+            'commands_per_commit': self.commands / self.commits if self.commits else 0.0
+        }
+
+    async def _call(self, name: str, *args, **kwargs) -> Any:
+        result = (await self._submit([(name, args, kwargs)]))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _submit(self, commands: List[Command]) -> List:
+        if not self._thread.is_alive():
+            raise RuntimeError("SQLiteStore is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((commands, loop, future))
+        return await future
+
+    # 写线程
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   timeout=self.busy_timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+        except BaseException as e:
+            self._startup_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        closing = False
+        while not closing:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # 取出积压的全部命令，共用一个事务
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            self._execute_batch(conn, batch)
+
+        conn.close()
+
+    def _execute_batch(self, conn: sqlite3.Connection, batch: List):
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = self.clock()
+            for commands, loop, future in batch:
+                results = []
+                for name, args, kwargs in commands:
+                    try:
+                        results.append(getattr(self, f'_{name}')(conn, now, *args, **kwargs))
+                    except Exception as e:
+                        results.append(e)
+                outcomes.append((loop, future, results))
+                self.commands += len(commands)
+
+            if now - self._last_active_expire >= self.active_expire_interval:
+                self._evict_expired(conn, now)
+            conn.execute('COMMIT')
+            self.commits += 1
+        except Exception as e:
+            self.logger.error(f"SQLite batch failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, loop, future in batch:
+                loop.call_soon_threadsafe(self._resolve, future, e)
+            return
+
+        # 提交之后才返回结果，已返回的写入不会因进程崩溃丢失
+        for loop, future, results in outcomes:
+            loop.call_soon_threadsafe(self._resolve, future, results)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, outcome):
+        if future.done():
+            return
+        if isinstance(outcome, BaseException):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+
+    def _check_expiry(self, conn: sqlite3.Connection, now: float, key: str):
+        row = conn.execute('SELECT deadline FROM expires WHERE key = ?', (key,)).fetchone()
+        if row and row[0] <= now:
+            self._remove(conn, key)
+
+    @staticmethod
+    def _remove(conn: sqlite3.Connection, key: str):
+        for table in ('hashes', 'strings', 'sets', 'expires'):
+            conn.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+    @staticmethod
+    def _exists(conn: sqlite3.Connection, key: str) -> bool:
+        return any(
+            conn.execute(f'SELECT 1 FROM {table} WHERE key = ? LIMIT 1', (key,)).fetchone()
+            for table in ('hashes', 'strings', 'sets')
+        )
+
+    def _hset(self, conn, now, key, field=None, value=None, mapping=None, **kwargs):
+        self._check_expiry(conn, now, key)
+        fields = dict(mapping or {})
+        if field and value:
+            fields[field] = value
+        fields.update(kwargs)
+        conn.executemany(
+            'INSERT INTO hashes (key, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (key, field) DO UPDATE SET value = excluded.value',
+            [(key, name, str(item)) for name, item in fields.items()]
+        )
+
+    def _hget(self, conn, now, key, field):
+        self._check_expiry(conn, now, key)
+        row = conn.execute('SELECT value FROM hashes WHERE key = ? AND field = ?', (key, field)).fetchone()
+        return row[0] if row else None
+
+    def _hgetall(self, conn, now, key):
+        self._check_expiry(conn, now, key)
+        return dict(conn.execute('SELECT field, value FROM hashes WHERE key = ?', (key,)))
+
+    def _hincrby(self, conn, now, key, field, amount=1):
+        self._check_expiry(conn, now, key)
+        row = conn.execute(
+            'INSERT INTO hashes (key, field, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (key, field) DO UPDATE SET value = CAST(value AS INTEGER) + ? RETURNING value',
+            (key, field, str(amount), amount)
+        ).fetchone()
+        return int(row[0])
+
+    def _sadd(self, conn, now, key, *values):
+        self._check_expiry(conn, now, key)
+        conn.executemany('INSERT OR IGNORE INTO sets (key, member) VALUES (?, ?)',
+                         [(key, value) for value in values])
+
+    def _smembers(self, conn, now, key):
+        self._check_expiry(conn, now, key)
+        return [row[0].encode() for row in conn.execute('SELECT member FROM sets WHERE key = ?', (key,))]
+
+    def _srem(self, conn, now, key, *values):
+        self._check_expiry(conn, now, key)
+        conn.executemany('DELETE FROM sets WHERE key = ? AND member = ?', [(key, value) for value in values])
+
+    def _smove(self, conn, now, src, dst, member):
+        self._check_expiry(conn, now, src)
+        self._check_expiry(conn, now, dst)
+        if not conn.execute('DELETE FROM sets WHERE key = ? AND member = ?', (src, member)).rowcount:
+            return False
+        conn.execute('INSERT OR IGNORE INTO sets (key, member) VALUES (?, ?)', (dst, member))
+        return True
+
+    def _get(self, conn, now, key):
+        self._check_expiry(conn, now, key)
+        row = conn.execute('SELECT value FROM strings WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, conn, now, key, value, ex=None):
+        self._check_expiry(conn, now, key)
+        conn.execute('INSERT INTO strings (key, value) VALUES (?, ?) '
+                     'ON CONFLICT (key) DO UPDATE SET value = excluded.value', (key, str(value)))
+        conn.execute('DELETE FROM expires WHERE key = ?', (key,))
+        if ex:
+            self._expire(conn, now, key, ex)
+
+    def _incr(self, conn, now, key):
+        self._check_expiry(conn, now, key)
+        row = conn.execute(
+            "INSERT INTO strings (key, value) VALUES (?, '1') "
+            'ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1 RETURNING value', (key,)
+        ).fetchone()
+        return int(row[0])
+
+    def _expire(self, conn, now, key, seconds):
+        self._check_expiry(conn, now, key)
+        if not self._exists(conn, key):
+            return False
+        conn.execute('INSERT INTO expires (key, deadline) VALUES (?, ?) '
+                     'ON CONFLICT (key) DO UPDATE SET deadline = excluded.deadline', (key, now + seconds))
+        return True
+
+    def _ttl(self, conn, now, key):
+        """与Redis一致：键不存在返回-2，未设置过期返回-1"""
+        self._check_expiry(conn, now, key)
+        if not self._exists(conn, key):
+            return -2
+        row = conn.execute('SELECT deadline FROM expires WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return -1
+        return max(0, int(round(row[0] - now)))
+
+    def _delete(self, conn, now, key):
+        self._remove(conn, key)
+
+    def _evict_expired(self, conn, now, max_keys=1000):
+        self._last_active_expire = now
+        keys = [row[0] for row in conn.execute(
+            'SELECT key FROM expires WHERE deadline <= ? ORDER BY deadline LIMIT ?', (now, max_keys))]
+        for key in keys:
+            self._remove(conn, key)
+        return len(keys)
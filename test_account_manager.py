@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+账号管理器测试
+"""
+
+import asyncio
+import random
+
+from account_manager_example import USAGE_DAY_SECONDS, AccountStatus, MockRedis, SimpleAccountManager
+from mock_pipeline import MockPipeline
+
+def test_rate_limit_parking():
+    """测试操作配额用尽时返回None并给出最早重置时间，其他操作不受影响，窗口重置或响应头校准后恢复"""
+
+    async def run():
+        manager = SimpleAccountManager()
+        now = [1_000_000.0]
+        manager.clock = lambda: now[0]
+        manager._rate_limits.limits = {'SearchTimeline': 2}
+        first = await manager.add_account("first", "first@example.com")
+        second = await manager.add_account("second", "second@example.com")
+
+        served = [(await manager.get_available_account(operation='SearchTimeline'))['account_id'] for _ in range(4)]
+        exhausted = await manager.get_available_account(operation='SearchTimeline')
+        reset_at = manager.rate_limit_reset_at('SearchTimeline')
+        other = await manager.get_available_account(operation='UserByScreenName')
+        assert sorted(served) == sorted([first, first, second, second]) and exhausted is None, (
+            f"配额用尽后仍返回账号: served={served} exhausted={exhausted}")
+        assert reset_at == now[0] + manager._rate_limits.window and other is not None
+        assert len(manager._operation_indexes['SearchTimeline']) == 0 and len(manager._priority_index) == 2
+
+        # 响应头显示仍有配额时立即放回
+        await manager.record_rate_limit(first, 'SearchTimeline', {
+            'x-rate-limit-limit': '2', 'x-rate-limit-remaining': '1', 'x-rate-limit-reset': str(reset_at)})
+        assert (await manager.get_available_account(operation='SearchTimeline'))['account_id'] == first
+        assert await manager.get_available_account(operation='SearchTimeline') is None
+
+        # 窗口重置后两个账号都回到该操作的索引
+        now[0] = reset_at
+        assert await manager.get_available_account(operation='SearchTimeline') is not None
+        assert len(manager._operation_indexes['SearchTimeline']) == 2
+        assert manager.rate_limit_reset_at('SearchTimeline') is None
+
+    asyncio.run(run())
+
+class LatentPipeline(MockPipeline):
+    """执行前让出事件循环（模拟网络往返），管道内命令仍整体原子执行"""
+
+    async def execute(self, raise_on_error: bool = True):
+        await asyncio.sleep(0)
+        return await super().execute(raise_on_error)
+
+class LatentRedis(MockRedis):
+    def pipeline(self, transaction: bool = True) -> MockPipeline:
+        return LatentPipeline(self, transaction)
+
+def test_concurrent_status_transitions():
+    """测试同一账号的并发状态切换（含与实际不符的previous）后恰好在一个状态集合中，且与状态字段一致"""
+
+    async def run():
+        manager = SimpleAccountManager(LatentRedis())
+        account_id = await manager.add_account("racer", "racer@example.com")
+        rng = random.Random(7)
+        statuses = list(AccountStatus)
+
+        for round_ in range(50):
+            transitions = [(rng.choice(statuses), rng.choice(statuses + [None])) for _ in range(4)]
+            await asyncio.gather(*(
+                manager._update_account_status(account_id, status, previous) for status, previous in transitions
+            ))
+
+            members = [s for s in statuses if account_id in manager.redis.sets.get(f'accounts:{s.value}', ())]
+            field = manager.redis.data[f'account:{account_id}:config']['status']
+            assert len(members) == 1 and members[0].value == field, (
+                f"第{round_}轮 {transitions} 后状态集合 {members}，状态字段 {field}")
+
+    asyncio.run(run())
+
+def test_expiry_and_usage_rollover():
+    """测试注入时钟下键过期（惰性读取和堆清理）、ttl返回值，以及用量计数跨窗口/跨天自动归零"""
+
+    async def run():
+        now = [USAGE_DAY_SECONDS * 100 - 1.0]
+        redis = MockRedis(clock=lambda: now[0])
+        await redis.set('lazy', '1', ex=10)
+        await redis.set('swept', '1', ex=10)
+        await redis.set('persistent', '1')
+        assert [await redis.ttl(key) for key in ('lazy', 'persistent', 'missing')] == [10, -1, -2]
+
+        manager = SimpleAccountManager(redis)
+        manager.clock = lambda: now[0]
+        manager._usage_day = int(now[0] // USAGE_DAY_SECONDS)
+        account_id = await manager.add_account("clocked", "clocked@example.com")
+        for _ in range(2):
+            await manager.get_available_account()
+        before = await manager.get_usage(account_id)
+        old_day_key = manager._usage_keys(account_id)[0]
+
+        # 跨过15分钟窗口和日边界，无需清零任务
+        now[0] += 2
+        after = await manager.get_usage(account_id)
+        cached_usage = (await manager._get_account_metrics(account_id)).daily_usage
+        await manager.get_available_account()
+        assert before == {'daily': 2, 'window': 2} and after == {'daily': 0, 'window': 0}, f"{before} -> {after}"
+        assert cached_usage == 0 and await manager.get_usage(account_id) == {'daily': 1, 'window': 1}
+
+        now[0] += 10
+        # 读取lazy时惰性删除，同时触发按截止时间堆的主动清理
+        assert await redis.get('lazy') is None and await redis.ttl('lazy') == -2
+        assert 'swept' not in redis.data and 'swept' not in redis.expires, "过期键未被主动清理"
+        assert await redis.get('persistent') == '1'
+
+        # 旧的日桶在两天后过期
+        now[0] += 2 * USAGE_DAY_SECONDS
+        evicted = redis.evict_expired()
+        assert evicted >= 1 and old_day_key not in redis.data, f"旧用量桶未过期: 清理 {evicted} 个"
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+延迟直方图与Prometheus导出测试
+"""
+
+import asyncio
+import random
+
+from account_manager_example import SimpleAccountManager
+from fake_socks5 import add_offline_proxies
+from instrumentation import Instrumentation, LatencyHistogram
+from socks5_proxy_manager import SOCKS5ProxyManager
+
+def parse_exposition(text: str) -> dict:
+    """Prometheus文本格式解析为 {序列名{标签}: 值}，忽略注释行"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+def test_instrumentation():
+    """测试延迟直方图精度、方法/存储命令计数和Prometheus导出"""
+
+    async def run():
+        # 直方图分位数与精确值的相对误差不超过一个子桶（约3%）
+        rng = random.Random(7)
+        values = [int(rng.lognormvariate(11, 2)) + 1 for _ in range(20_000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        ordered = sorted(values)
+        max_error = max(
+            abs(histogram.percentile(pct) * 1e9 - ordered[round(pct / 100 * len(ordered)) - 1])
+            / ordered[round(pct / 100 * len(ordered)) - 1]
+            for pct in (50, 90, 99, 99.9)
+        )
+
+        instrumentation = Instrumentation()
+        proxy_manager = SOCKS5ProxyManager(instrumentation=instrumentation)
+        account_manager = SimpleAccountManager(instrumentation=instrumentation)
+        await add_offline_proxies(proxy_manager, 3, max_concurrent=1)
+        await account_manager.add_account("metrics", "metrics@example.com")
+
+        for _ in range(10):
+            proxy = await proxy_manager.get_available_proxy()
+            await proxy_manager.update_proxy_success(proxy['proxy_id'], 0.2)
+        await account_manager.get_available_account()
+        await proxy_manager.get_statistics()
+        await account_manager.get_statistics()
+
+        # 3个代理都被租满后超时，记为一次错误
+        leases = [await proxy_manager.acquire_lease() for _ in range(3)]
+        try:
+            await proxy_manager.acquire_lease(timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+        for lease in leases:
+            await proxy_manager.release_lease(lease)
+
+        samples = parse_exposition(instrumentation.render())
+        operation = 'pool_operation_duration_seconds'
+        proxy_labels = 'component="proxy",operation="get_available_proxy"'
+        selections = samples[f'{operation}_count{{{proxy_labels}}}']
+        lease_errors = samples['pool_operation_errors_total{component="proxy",operation="acquire_lease"}']
+        account_stats_calls = samples[f'{operation}_count{{component="account",operation="get_statistics"}}']
+        hset_calls = samples.get('pool_storage_command_duration_seconds_count{command="hset"}', 0)
+        pipelines = samples['pool_storage_command_duration_seconds_count{command="pipeline"}']
+
+        # 每个直方图的桶计数单调不减，+Inf桶等于调用数
+        consistent = True
+        for name, value in samples.items():
+            if name.endswith('_count}') or '_count{' not in name:
+                continue
+            family, labels = name.split('_count{')
+            buckets = [count for key, count in samples.items()
+                       if key.startswith(f'{family}_bucket{{{labels[:-1]},le=')]
+            consistent &= buckets == sorted(buckets) and buckets[-1] == value
+
+        server = await instrumentation.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        responses = []
+        for path in ('/metrics', '/other'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            await writer.drain()
+            responses.append(await reader.read())
+            writer.close()
+        server.close()
+        await server.wait_closed()
+        await proxy_manager.close()
+
+        print(f"   分位数最大相对误差 {max_error:.3%}，选择 {selections:.0f} 次，租用超时 {lease_errors:.0f} 次，"
+              f"管道 {pipelines:.0f} 次，单条hset {hset_calls:.0f} 次")
+        assert (max_error < 1 / 32 and selections == 10 and lease_errors == 1 and account_stats_calls == 1
+                and pipelines > 0 and consistent
+                and responses[0].startswith(b'HTTP/1.1 200') and proxy_labels.encode() in responses[0]
+                and responses[1].startswith(b'HTTP/1.1 404')), (
+            f"埋点异常: error={max_error} consistent={consistent} responses={[r[:40] for r in responses]}")
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+指标写后聚合测试
+"""
+
+import asyncio
+import random
+
+from account_manager_example import AccountMetrics, MockRedis
+from fake_socks5 import add_offline_proxies
+from metric_aggregator import WriteBehindMetrics
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyStatus
+
+def test_write_behind_metrics():
+    """测试写后聚合与立即写入结果一致、暂停立即生效、待写事件有上界且写入失败不丢增量"""
+
+    async def run():
+        immediate = SOCKS5ProxyManager()
+        write_behind = SOCKS5ProxyManager(flush_interval=60, flush_events=50)
+        for manager in (immediate, write_behind):
+            await add_offline_proxies(manager, 5, max_concurrent=10)
+
+        rng = random.Random(7)
+        events = [(f"socks5_10.0.0.{rng.randrange(5)}_1080", rng.random() < 0.6, rng.uniform(0.1, 2.0))
+                  for _ in range(600)]
+        max_pending = 0
+        suspended = 0
+        status_mismatches = 0
+        for proxy_id, ok, response_time in events:
+            if ok:
+                await immediate.update_proxy_success(proxy_id, response_time)
+                await write_behind.update_proxy_success(proxy_id, response_time)
+            else:
+                await immediate.mark_proxy_error(proxy_id, "timeout")
+                await write_behind.mark_proxy_error(proxy_id, "timeout")
+            # 暂停必须在同一事件上生效，不等待刷新
+            status = (await immediate._get_proxy_config(proxy_id)).status
+            if (await write_behind._get_proxy_config(proxy_id)).status != status:
+                status_mismatches += 1
+            if status == ProxyStatus.ERROR:
+                suspended += 1
+                await immediate.reinstate_proxy(proxy_id)
+                await write_behind.reinstate_proxy(proxy_id)
+            max_pending = max(max_pending, write_behind.metric_writer.pending_events)
+        flush_stats = write_behind.metric_writer.stats()
+
+        # 写入失败时增量保留到下次刷新
+        await write_behind.mark_proxy_error(events[0][0], "timeout")
+        pipeline = write_behind.redis.pipeline
+
+        def failing_pipeline(transaction=True):
+            raise ConnectionError("redis down")
+
+        write_behind.redis.pipeline = failing_pipeline
+        try:
+            await write_behind.metric_writer.flush()
+            retried = False
+        except ConnectionError:
+            retried = write_behind.metric_writer.pending_events == 1
+        write_behind.redis.pipeline = pipeline
+        await immediate.mark_proxy_error(events[0][0], "timeout")
+
+        await immediate.close()
+        await write_behind.close()
+
+        mismatched = []
+        for i in range(5):
+            key = f'proxy:socks5_10.0.0.{i}_1080:metrics'
+            expected = await immediate.redis.hgetall(key)
+            actual = await write_behind.redis.hgetall(key)
+            for field in ('total_requests', 'successful_requests', 'failed_requests', 'consecutive_errors'):
+                if expected[field] != actual[field]:
+                    mismatched.append((i, field))
+            if abs(float(expected['average_response_time']) - float(actual['average_response_time'])) > 1e-9:
+                mismatched.append((i, 'average_response_time'))
+
+        print(f"   600个事件，最多待写 {max_pending} 个，暂停 {suspended} 次，刷新统计 {flush_stats}")
+        assert not mismatched and max_pending < 50 and suspended > 0 and not status_mismatches and retried, (
+            f"写后聚合异常: mismatched={mismatched} max_pending={max_pending} "
+            f"suspended={suspended} status_mismatches={status_mismatches} retried={retried}")
+
+    asyncio.run(run())
+
+def test_consecutive_errors_pruned():
+    """测试刷新后不再保留空闲资源的连续错误基数，只跟踪最近一个周期有事件的资源"""
+
+    async def run():
+        writer = WriteBehindMetrics(MockRedis(), 'account:{}:metrics', flush_interval=60)
+        for i in range(100):
+            writer.overlay(f"acc_{i}", AccountMetrics(consecutive_errors=1))
+            writer.record_error(f"acc_{i}")
+        await writer.flush()
+        before = len(writer._consecutive)
+
+        hot = writer.record_error("acc_0")
+        await writer.flush()
+        after = len(writer._consecutive)
+        await writer.close()
+
+        # 空闲资源再次出错时需重新读取基数
+        assert before == 100 and after == 1 and hot == 3 and writer.record_error("acc_1") is None, (
+            f"连续错误基数未清理: before={before} after={after} hot={hot}")
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+自适应请求节奏控制测试
+"""
+
+import asyncio
+import time
+
+from fake_twscrape import FakePage, FakeRateLimitServer, FakeTwitterAPI, parse_tweets
+from pacing_controller import PacingController
+
+def test_pacing_controller():
+    """测试AIMD节奏控制的加减速规则，以及在限流替身接口上对比固定sleep"""
+
+    async def run():
+        clock = [1000.0]
+        pacing = PacingController(clock=lambda: clock[0])
+        pacer = pacing.pacer('acc', 'SearchTimeline')
+        checks = {}
+
+        # 慢启动：每次成功 +1
+        for _ in range(3):
+            pacing.record('acc', 'SearchTimeline', sent_at=clock[0], status=200, latency=0.1)
+        checks['慢启动'] = pacer.rate == 4.0
+
+        # 同一批在途请求的两个429只减速一次，之后转为加性增加
+        sent_at = clock[0]
+        clock[0] += 1
+        pacing.record('acc', 'SearchTimeline', sent_at, status=429)
+        pacing.record('acc', 'SearchTimeline', sent_at, status=429)
+        checks['429减半一次'] = pacer.rate == 2.0 and pacer.throttled == 2
+        pacing.record('acc', 'SearchTimeline', clock[0], status=200, latency=0.1)
+        checks['加性增加'] = pacer.rate == 2.5
+
+        clock[0] += 1
+        pacing.record('acc', 'SearchTimeline', clock[0], status=200, latency=5.0)
+        checks['慢响应减速'] = pacer.rate == 2.0
+
+        # 剩余10次、10秒后重置：速率不超过1次/秒；剩余0次：暂停到重置
+        clock[0] += 1
+        pacing.record('acc', 'SearchTimeline', clock[0], status=200, latency=0.1,
+                      headers={'X-Rate-Limit-Remaining': '10', 'X-Rate-Limit-Reset': str(clock[0] + 10)})
+        checks['响应头均摊配额'] = pacer.rate == 1.0
+        pacing.record('acc', 'SearchTimeline', clock[0], status=429,
+                      headers={'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(clock[0] + 30)})
+        checks['配额耗尽暂停'] = pacer.reserve(clock[0]) == clock[0] + 30
+
+        # 请求抛出异常记为出错；按条目节奏控制的迭代器完整产出
+        pacing = PacingController(rate=50.0, max_rate=1000.0)
+        try:
+            async with pacing.request('acc', 'TweetDetail'):
+                raise ConnectionError("reset")
+        except ConnectionError:
+            pass
+        checks['异常记为出错'] = pacing.stats()['acc/TweetDetail']['errors'] == 1
+        api = FakeTwitterAPI(page_latency=0.01, results_per_query=40)
+        tweets = [tweet async for tweet in pacing.paged(api.search_raw("python"), parse_tweets,
+                                                        'twscrape', 'SearchTimeline')]
+        paged = pacing.stats()['twscrape/SearchTimeline']
+        checks['按页节奏控制'] = len(tweets) == 40 and paged['requests'] == api.pages == 2 and paged['rate'] > 50
+
+        # 仿真：4个账号各跑3秒，可持续6次/秒/账号
+        async def simulate(send, accounts=4, duration=3.0):
+            server = FakeRateLimitServer(window_limit=12, window=2.0, burst_rate=8.0)
+            deadline = time.time() + duration
+
+            async def worker(account_id):
+                while time.time() < deadline:
+                    await send(server, account_id)
+
+            await asyncio.gather(*(worker(f"acc_{i}") for i in range(accounts)))
+            return server
+
+        async def fixed_sleep(delay):
+            async def send(server, account_id):
+                await server.request(account_id, 'SearchTimeline')
+                await asyncio.sleep(delay)
+            return send
+
+        aimd = PacingController()
+
+        async def paced_send(server, account_id):
+            async with aimd.request(account_id, 'SearchTimeline') as call:
+                response = await server.request(account_id, 'SearchTimeline')
+                call.record(response.status, response.headers)
+
+        polite, aggressive, adaptive = await asyncio.gather(
+            simulate(await fixed_sleep(0.5)), simulate(await fixed_sleep(0.1)), simulate(paced_send))
+        ratio = lambda server: server.throttled / (server.ok + server.throttled)
+        checks['仿真吞吐高于固定sleep'] = adaptive.ok > polite.ok * 1.3
+        checks['仿真429少于激进sleep'] = ratio(adaptive) < ratio(aggressive) / 3
+
+        print(f"   仿真成功请求 sleep(0.5)={polite.ok} sleep(0.1)={aggressive.ok} AIMD={adaptive.ok}，"
+              f"429比例 {ratio(polite):.1%} / {ratio(aggressive):.1%} / {ratio(adaptive):.1%}")
+        failed = [name for name, ok in checks.items() if not ok]
+        assert not failed, f"节奏控制异常: {failed}"
+
+    asyncio.run(run())
+
+def test_page_signals_and_account_pool():
+    """测试按页节奏控制交回每页的状态码和响应头，账号池键的配额按账号数放大"""
+
+    async def run():
+        clock = [1000.0]
+        pacing = PacingController(clock=lambda: clock[0], rate=4.0)
+
+        async def pages():
+            for status, remaining in ((200, '90'), (429, '0'), (200, '50')):
+                yield FakePage(status, {'x-rate-limit-remaining': remaining,
+                                        'x-rate-limit-reset': str(clock[0] + 100)}, [])
+
+        # 3个账号的池：单个账号耗尽不暂停整个池，429仍然减速
+        [page async for page in pacing.paced(pages(), 'twscrape', 'SearchTimeline', accounts=3)]
+        pool = pacing.pacer('twscrape', 'SearchTimeline')
+        assert pool.throttled == 1 and pool.requests == 3 and pool.blocked_until < clock[0] + 100, pool.summary(clock[0])
+        assert pool.ceiling == 50 * 3 / 100 and pool.rate <= pool.ceiling, f"池配额上限异常: {pool.ceiling}"
+
+        # 单个账号：配额耗尽时暂停到窗口重置
+        pacing.record('acc', 'SearchTimeline', clock[0], 429,
+                      headers={'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(clock[0] + 100)})
+        assert pacing.pacer('acc', 'SearchTimeline').reserve(clock[0]) == clock[0] + 100
+
+    asyncio.run(run())
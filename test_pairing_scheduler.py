@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+账号-代理配对调度器测试
+"""
+
+import asyncio
+
+from account_manager_example import SimpleAccountManager
+from pairing_scheduler import PairingScheduler
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyConfig, ProxyStatus
+
+async def create_pool(providers, region: str = 'global', proxies_per_account: int = 2):
+    """一个账号加若干不经连接测试登记的代理（每个代理并发上限1）"""
+    account_manager = SimpleAccountManager()
+    proxy_manager = SOCKS5ProxyManager()
+    for i, provider in enumerate(providers):
+        config = ProxyConfig(
+            proxy_id=f"socks5_10.0.0.{i}_1080", host=f"10.0.0.{i}", port=1080,
+            username='user', password='secret', max_concurrent=1, provider=provider
+        )
+        await proxy_manager._save_proxy_config(config)
+        await proxy_manager._initialize_proxy_metrics(config.proxy_id)
+    account_id = await account_manager.add_account("paired", "paired@example.com", region=region)
+    scheduler = PairingScheduler(account_manager, proxy_manager, proxies_per_account=proxies_per_account)
+    return scheduler, account_id
+
+def test_sticky_reacquire():
+    """测试再次租用时命中已绑定的代理"""
+
+    async def run():
+        scheduler, account_id = await create_pool(['P1', 'P1', 'P1'])
+        async with scheduler.lease(timeout=1) as pair:
+            first = pair.proxy_id
+        async with scheduler.lease(timeout=1) as pair:
+            second, sticky = pair.proxy_id, pair.sticky
+        stats = scheduler.stats()
+        await scheduler.proxies.close()
+
+        assert second == first and sticky, f"未命中绑定代理: {first} -> {second}"
+        assert stats['binds'] == 1 and stats['sticky'] == 1 and stats['sticky_rate'] == 0.5, f"统计异常: {stats}"
+
+    asyncio.run(run())
+
+def test_rebind_unselectable_proxy():
+    """测试绑定的代理不可选后解除绑定并重新绑定"""
+
+    async def run():
+        scheduler, account_id = await create_pool(['P1', 'P1'], proxies_per_account=1)
+        async with scheduler.lease(timeout=1) as pair:
+            degraded = pair.proxy_id
+        await scheduler.proxies._update_proxy_status(degraded, ProxyStatus.ERROR)
+
+        async with scheduler.lease(timeout=1) as pair:
+            replacement, sticky = pair.proxy_id, pair.sticky
+        stored = await scheduler.redis.hgetall(f'account:{account_id}:proxies')
+        stats = scheduler.stats()
+        await scheduler.proxies.close()
+
+        assert replacement != degraded and sticky, f"未重新绑定: {degraded} -> {replacement}"
+        assert scheduler._bindings[account_id] == [replacement] and list(stored) == [replacement], (
+            f"绑定关系异常: {scheduler._bindings[account_id]} {stored}")
+        assert stats['rebinds'] == 1 and stats['binds'] == 2, f"统计异常: {stats}"
+
+    asyncio.run(run())
+
+def test_borrow_when_bindings_full():
+    """测试绑定已满且绑定的代理都在忙时临时借用，不改变绑定"""
+
+    async def run():
+        scheduler, account_id = await create_pool(['P1', 'P1'], proxies_per_account=1)
+        async with scheduler.lease(timeout=1) as pair:
+            bound = pair.proxy_id
+
+        # 其他调用方占满绑定代理的并发
+        busy = await scheduler.proxies.try_acquire_lease(bound)
+        async with scheduler.lease(timeout=1) as pair:
+            borrowed, sticky = pair.proxy_id, pair.sticky
+        await scheduler.proxies.release_lease(busy)
+        stats = scheduler.stats()
+        await scheduler.proxies.close()
+
+        assert busy is not None and borrowed != bound and not sticky, f"未临时借用: {bound} -> {borrowed}"
+        assert scheduler._bindings[account_id] == [bound], f"借用改变了绑定: {scheduler._bindings[account_id]}"
+        assert stats['borrowed'] == 1 and stats['rebinds'] == 0, f"统计异常: {stats}"
+
+    asyncio.run(run())
+
+def test_region_fallback():
+    """测试账号地区内没有可选代理时不限地区租用，而不是一直等待"""
+
+    async def run():
+        scheduler, account_id = await create_pool(['P1'], region='eu')
+        pair = await asyncio.wait_for(scheduler.acquire(), timeout=5)
+        await scheduler.release(pair)
+        stats = scheduler.stats()
+        await scheduler.proxies.close()
+
+        assert pair.proxy_id == "socks5_10.0.0.0_1080", f"租用了意外的代理: {pair.proxy_id}"
+        assert stats['region_fallbacks'] == 1 and stats['binds'] == 1, f"统计异常: {stats}"
+
+    asyncio.run(run())
+
+def test_bindings_restore_providers():
+    """测试从Redis重新加载绑定时恢复代理服务商"""
+
+    async def run():
+        scheduler, account_id = await create_pool(['P1', 'P2'])
+        async with scheduler.lease(timeout=1) as pair:
+            bound, provider = pair.proxy_id, pair.proxy.proxy['provider']
+
+        # 新的调度器实例（如进程重启）只能从Redis读取绑定
+        restarted = PairingScheduler(scheduler.accounts, scheduler.proxies)
+        bindings = await restarted._get_bindings(account_id)
+        providers = dict(restarted._providers)
+        await scheduler.proxies.close()
+
+        assert bindings == [bound], f"绑定未恢复: {bindings}"
+        assert providers == {bound: provider}, f"服务商未恢复: {providers}"
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+快照热启动测试
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+
+from account_manager_example import SimpleAccountManager
+from fake_socks5 import FakeSOCKS5Server, add_offline_proxies, build_proxy_list, create_manager
+from pool_snapshot import dump_snapshot, warm_start
+from socks5_proxy_manager import ProxyConnector, ProxyStatus
+
+# aiohttp本身不支持SOCKS5代理，经替身服务器连接的测试需要aiohttp-socks
+requires_aiohttp_socks = pytest.mark.skipif(ProxyConnector is None,
+                                            reason="需要安装 aiohttp-socks: pip install aiohttp-socks")
+
+@requires_aiohttp_socks
+def test_warm_start():
+    """测试快照热启动恢复池状态、立即可选，健康复查在后台暂停失效代理"""
+
+    async def run():
+        server = FakeSOCKS5Server()
+        proxy_list = await build_proxy_list(server, {'127.0.0.1': ['good', 'good']})
+        proxy_manager = create_manager()
+        await proxy_manager.add_proxy_batch(proxy_list)
+        good_ids = [f"socks5_{p['host']}_{p['port']}" for p in proxy_list]
+        # 快照中为活跃、实际已不可达的代理
+        await add_offline_proxies(proxy_manager, 2, max_concurrent=5)
+        offline_ids = ["socks5_10.0.0.0_1080", "socks5_10.0.0.1_1080"]
+        await proxy_manager.update_proxy_success(good_ids[0], 0.4)
+        await proxy_manager.mark_proxy_error(good_ids[1], "timeout")
+
+        account_manager = SimpleAccountManager()
+        account_ids = [await account_manager.add_account(f"warm{i}", f"warm{i}@example.com") for i in range(3)]
+        await account_manager.update_account_success(account_ids[0])
+        for _ in range(5):
+            await account_manager.mark_account_error(account_ids[2], "rate limited")
+
+        proxy_stats = await proxy_manager.get_statistics()
+        account_stats = await account_manager.get_statistics()
+        metrics = await proxy_manager._get_proxy_metrics(good_ids[0])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pool.snap')
+            dumped = await dump_snapshot(path, proxy_manager, account_manager)
+
+            # 模拟重启：空的Redis和新的管理器
+            restarted = create_manager()
+            restarted_accounts = SimpleAccountManager()
+            result = await warm_start(path, restarted, restarted_accounts)
+            # 后台复查会更新响应时间，先取恢复后的指标
+            restored_metrics = await restarted._get_proxy_metrics(good_ids[0])
+            restored_metrics = (restored_metrics.successful_requests, restored_metrics.average_response_time,
+                                restored_metrics.last_success)
+            restored_proxy_stats = proxy_stats == await restarted.get_statistics()
+            restored_account_stats = account_stats == await restarted_accounts.get_statistics()
+
+            start = time.perf_counter()
+            selected = await restarted.get_available_proxy()
+            account = await restarted_accounts.get_available_account()
+            first_selection = result['seconds'] + time.perf_counter() - start
+            recheck_pending = not result['recheck'].done()
+
+            recheck = await result['recheck']
+            statuses = {proxy_id: (await restarted._get_proxy_config(proxy_id)).status
+                        for proxy_id in good_ids + offline_ids}
+
+            with open(path, 'r+b') as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b'\xff')
+            try:
+                await warm_start(path, create_manager(), recheck=False)
+                corrupt_rejected = False
+            except ValueError:
+                corrupt_rejected = True
+
+        await proxy_manager.close()
+        await restarted.close()
+        await server.close()
+
+        print(f"   快照 {dumped['bytes']} 字节，{first_selection * 1000:.1f}ms 后可选，后台复查 {recheck}")
+        assert (restored_proxy_stats and restored_account_stats and result['restored']
+                and restored_metrics == (metrics.successful_requests, metrics.average_response_time,
+                                         metrics.last_success)
+                and selected and account and account['account_id'] != account_ids[2] and recheck_pending
+                and recheck == {'checked': 4, 'failed': 2}
+                and all(statuses[proxy_id] == ProxyStatus.ACTIVE for proxy_id in good_ids)
+                and all(statuses[proxy_id] == ProxyStatus.ERROR for proxy_id in offline_ids)
+                and corrupt_rejected), (
+            f"热启动异常: proxy_stats={restored_proxy_stats} account_stats={restored_account_stats} "
+            f"metrics={restored_metrics} statuses={statuses} corrupt_rejected={corrupt_rejected}")
+
+    asyncio.run(run())
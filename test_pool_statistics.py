@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+资源池统计聚合测试
+"""
+
+import asyncio
+
+from account_manager_example import AccountPriority, SimpleAccountManager
+from pool_statistics import PoolStatistics
+
+def test_incremental_totals():
+    """测试状态切换和字段更新时先减旧值再加新值，只在活跃资源上累加"""
+    stats = PoolStatistics('active', ('health', 'usage', 'response_time'))
+    stats.update('a', status='active', group='us', health=0.8, usage=3, response_time=1.0)
+    stats.update('b', status='active', group='eu', health=0.4, usage=1, response_time=3.0)
+    stats.update('c', health=0.1)  # 未带status的未跟踪资源不加入
+    assert len(stats) == 2 and abs(stats.average('health') - 0.6) < 1e-9 and stats.average('response_time') == 2.0
+
+    stats.update('b', status='error')
+    stats.update('a', usage=5)
+    assert stats.count('active') == 1 and stats.count('error') == 1
+    assert stats.totals['usage'] == 5 and stats.group_distribution() == {'us': 1}
+
+    stats.remove('a')
+    assert stats.average('health') == 0.0 and stats.group_distribution() == {}
+
+def test_account_statistics_fields():
+    """测试账号统计只聚合健康度和使用量，账号更新后增量值与全量扫描一致"""
+
+    async def run():
+        manager = SimpleAccountManager()
+        for i in range(3):
+            await manager.add_account(f"user{i}", f"user{i}@example.com", priority=AccountPriority.HIGH)
+        await manager.get_statistics()
+        await manager.update_account_success("acc_user0")
+        stats = await manager.get_statistics()
+        drift = await manager.reconcile_statistics()
+
+        assert set(manager._pool_stats.totals) == {'health', 'usage'} and 'average_response_time' not in stats
+        assert stats['active_accounts'] == 3 and stats['priority_distribution'] == {AccountPriority.HIGH.value: 3}
+        assert await manager.get_statistics() == stats, f"增量统计与全量扫描不一致: {drift}"
+
+    asyncio.run(run())
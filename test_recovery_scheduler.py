@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+暂停资源自动恢复测试
+"""
+
+import asyncio
+
+import pytest
+
+from account_manager_example import AccountStatus, SimpleAccountManager
+from fake_socks5 import FakeSOCKS5Server, add_offline_proxies, build_proxy_list, create_manager
+from recovery_scheduler import RecoveryScheduler
+from socks5_proxy_manager import ProxyConnector, ProxyStatus
+
+# aiohttp本身不支持SOCKS5代理，经替身服务器连接的测试需要aiohttp-socks
+requires_aiohttp_socks = pytest.mark.skipif(ProxyConnector is None,
+                                            reason="需要安装 aiohttp-socks: pip install aiohttp-socks")
+
+@requires_aiohttp_socks
+def test_auto_recovery():
+    """测试暂停后按指数退避冷却、探测通过才恢复"""
+
+    async def run():
+        server = FakeSOCKS5Server()
+        proxy_list = await build_proxy_list(server, {'127.0.0.1': ['good', 'fail']})
+        proxy_manager = create_manager()
+        await proxy_manager.add_proxy_batch(proxy_list)
+        good_id, fail_id = (f"socks5_{p['host']}_{p['port']}" for p in proxy_list)
+
+        account_manager = SimpleAccountManager()
+        account_id = await account_manager.add_account("recover", "recover@example.com")
+        locked_id = await account_manager.add_account("locked", "locked@example.com")
+
+        probed = []
+
+        async def check_account(resource_id):
+            probed.append(resource_id)
+            return resource_id != locked_id
+
+        now = [0.0]
+        scheduler = RecoveryScheduler(account_manager, proxy_manager, base_cooldown=10,
+                                      account_probe=check_account, clock=lambda: now[0])
+        existing = await scheduler.recover_existing()
+
+        for _ in range(5):
+            await proxy_manager.mark_proxy_error(good_id, "timeout")
+            await account_manager.mark_account_error(account_id, "rate limited")
+            await account_manager.mark_account_error(locked_id, "rate limited")
+
+        # 冷却未到期前不恢复
+        now[0] = 9
+        early = await scheduler.run_due()
+        now[0] = 10
+        recovered = await scheduler.run_due()
+
+        good_status = (await proxy_manager._get_proxy_config(good_id)).status
+        fail_status = (await proxy_manager._get_proxy_config(fail_id)).status
+        account = await account_manager.get_available_account()
+        retry_at = scheduler.wheel.deadline(('proxy', fail_id))
+        locked_status = (await account_manager.get_account_config(locked_id)).status
+        locked_retry_at = scheduler.wheel.deadline(('account', locked_id))
+
+        # 再次暂停时冷却时间翻倍
+        for _ in range(5):
+            await proxy_manager.mark_proxy_error(good_id, "timeout")
+        second_at = scheduler.wheel.deadline(('proxy', good_id))
+
+        await proxy_manager.close()
+        await server.close()
+
+        print(f"   启动时排期 {existing} 个，9s时恢复 {early} 个，10s时恢复 {recovered} 个")
+        print(f"   探测失败的代理 {retry_at:.0f}s 重试，再次暂停的代理 {second_at:.0f}s 恢复，统计 {scheduler.stats()}")
+        assert (existing == 1 and early == 0 and recovered == 2
+                and good_status == ProxyStatus.ACTIVE and fail_status == ProxyStatus.ERROR
+                and account and account['account_id'] == account_id
+                and sorted(probed) == sorted([account_id, locked_id])
+                and locked_status == AccountStatus.SUSPENDED and locked_retry_at == 30
+                and retry_at == 20 and second_at == 30), (
+            f"自动恢复行为异常: good={good_status} fail={fail_status} account={account} "
+            f"locked={locked_status}@{locked_retry_at}")
+
+    asyncio.run(run())
+
+def test_account_probe_required():
+    """测试管理账号时必须提供探测函数"""
+    with pytest.raises(ValueError):
+        RecoveryScheduler(SimpleAccountManager())
+
+def test_skip_reinstated_and_removed_proxies():
+    """测试冷却期间被手动恢复或删除的代理到期后不再探测、不再排期"""
+
+    async def run():
+        proxy_manager = create_manager()
+        await add_offline_proxies(proxy_manager, 2, max_concurrent=1)
+        reinstated_id, removed_id = "socks5_10.0.0.0_1080", "socks5_10.0.0.1_1080"
+
+        probed = []
+
+        async def probe(proxy_id):
+            probed.append(proxy_id)
+            return True
+
+        proxy_manager.probe_proxy = probe
+
+        now = [0.0]
+        scheduler = RecoveryScheduler(proxy_manager=proxy_manager, base_cooldown=10, clock=lambda: now[0])
+        for _ in range(5):
+            await proxy_manager.mark_proxy_error(reinstated_id, "timeout")
+            await proxy_manager.mark_proxy_error(removed_id, "timeout")
+        scheduled = len(scheduler.wheel)
+
+        await proxy_manager.reinstate_proxy(reinstated_id)
+        await proxy_manager.remove_proxy(removed_id)
+
+        now[0] = 10
+        recovered = await scheduler.run_due()
+        status = (await proxy_manager.get_proxy_config(reinstated_id)).status
+        removed = await proxy_manager.get_proxy_config(removed_id)
+        await proxy_manager.close()
+
+        print(f"   排期 {scheduled} 个，到期恢复 {recovered} 个，探测 {probed}，统计 {scheduler.stats()}")
+        assert scheduled == 2 and recovered == 0 and probed == [], f"不应探测: {probed}"
+        assert status == ProxyStatus.ACTIVE and removed is None, f"代理状态异常: {status} {removed}"
+        assert len(scheduler.wheel) == 0 and scheduler.probe_failures == 0, (
+            f"不应重新排期: {scheduler.stats()}")
+
+    asyncio.run(run())
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+分桶评分索引测试
+"""
+
+import random
+
+from account_manager_example import AccountPriority, AccountPriorityIndex
+from score_index import BucketedScoreIndex
+
+def test_bucketed_score_index():
+    """测试更新后惰性删除旧条目、跨桶取最高分、换桶和均匀抽样"""
+    index = BucketedScoreIndex(('a', 'b'))
+    index.update('x', 'a', 0.5)
+    index.update('y', 'b', 0.9)
+    index.update('x', 'a', 0.95)
+    assert index.peek() == ('x', 0.95) and index.peek('b') == ('y', 0.9)
+
+    # 换桶后只在新桶中出现
+    index.update('x', 'b', 0.1)
+    assert index.peek('a') is None and index.bucket_size('b') == 2
+    assert index.pop() == ('y', 0.9) and 'y' not in index and len(index) == 1
+
+    for i in range(100):
+        index.update(f'k{i}', 'a', i / 100)
+    sampled = index.sample(10, rng=random.Random(1))
+    assert len({key for key, _ in sampled}) == 10 and all(key in index for key, _ in sampled)
+    assert {key for key, _ in index.sample(5, 'b')} == {'x'}
+
+def test_account_priority_cascade():
+    """测试账号索引不指定优先级时按HIGH → NORMAL → LOW逐级查找"""
+    index = AccountPriorityIndex()
+    index.update('low', AccountPriority.LOW, 0.99)
+    index.update('normal', AccountPriority.NORMAL, 0.5)
+    assert index.peek() == ('normal', 0.5)
+    assert [key for key, _ in index.sample(5)] == ['normal']
+
+    index.update('high', AccountPriority.HIGH, 0.1)
+    assert index.pop() == ('high', 0.1)
+    assert index.pop() == ('normal', 0.5) and index.pop() == ('low', 0.99) and index.pop() is None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+多关键词并发搜索测试
+"""
+
+import asyncio
+import time
+
+from fake_twscrape import FakeTwitterAPI, parse_tweets
+from pacing_controller import PacingController
+from search_engine import SearchEngine
+
+class FailingSearchAPI(FakeTwitterAPI):
+    """查询文本包含"boom"时第一页之后抛出异常"""
+
+    async def search(self, q, limit=-1, kv=None):
+        async for tweet in super().search(q, limit, kv):
+            yield tweet
+            if 'boom' in q:
+                raise RuntimeError("simulated 500")
+
+class PlainIteratorAPI(FakeTwitterAPI):
+    """search返回没有aclose的普通异步迭代器"""
+
+    def search(self, q, limit=-1, kv=None):
+        return PlainIterator(super().search(q, limit, kv))
+
+class PlainIterator:
+    def __init__(self, source):
+        self.source = source
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.source.__anext__()
+
+def test_search_engine():
+    """测试多关键词并发搜索的吞吐、去重、错误隔离和提前退出"""
+
+    async def run():
+        queries = [f"keyword{i}" for i in range(16)] + ["boom"]
+        api = FailingSearchAPI(accounts=8, page_latency=0.02, results_per_query=60, corpus_size=2_000)
+        expected = set()
+        for query in queries[:-1]:
+            async for tweet in FakeTwitterAPI(results_per_query=60, corpus_size=2_000, page_latency=0).search(query):
+                expected.add(tweet.id)
+
+        engine = SearchEngine(api)
+        start = time.perf_counter()
+        hits = [hit async for hit in engine.search_many(queries)]
+        elapsed = time.perf_counter() - start
+        ids = [hit.tweet.id for hit in hits]
+        duplicates = sum(stats['duplicates'] for stats in engine.stats.values())
+        # 逐个查询需要 16×3页×20ms ≈ 0.96s
+        sequential = 16 * 3 * api.page_latency
+
+        # 提前退出：工作协程被取消，账号全部归还
+        api_early = FakeTwitterAPI(accounts=4, page_latency=0.02, results_per_query=200)
+        early = SearchEngine(api_early, buffer_size=10)
+        taken = 0
+        stream = early.search_many(queries[:8])
+        try:
+            async for _ in stream:
+                taken += 1
+                if taken == 25:
+                    break
+        finally:
+            await stream.aclose()
+        idle_accounts = api_early.pool._queue('SearchTimeline').qsize()
+
+        no_accounts = FakeTwitterAPI(accounts=1)
+        no_accounts.pool.accounts[0].active = False
+        try:
+            [hit async for hit in SearchEngine(no_accounts).search_many(["python"])]
+            empty_pool_error = False
+        except LookupError:
+            empty_pool_error = True
+
+        print(f"   {len(queries)}个查询耗时 {elapsed:.2f}s（逐个约 {sequential:.2f}s），峰值并发 {api.peak_in_flight}，"
+              f"产出 {len(ids)} 条，跨查询重复 {duplicates} 条，失败查询: {engine.stats['boom']['error']}")
+        assert (ids and set(ids) - expected == {hit.tweet.id for hit in hits if hit.query == 'boom'} - expected
+                and expected <= set(ids) and len(ids) == len(set(ids)) and api.peak_in_flight == 8
+                and elapsed < sequential / 3 and engine.stats['boom']['error']
+                and engine.stats['boom']['tweets'] + engine.stats['boom']['duplicates'] == 1
+                and taken == 25 and api_early.in_flight == 0 and idle_accounts == 4 and empty_pool_error), (
+            f"并发搜索异常: peak={api.peak_in_flight} early_in_flight={api_early.in_flight} idle={idle_accounts}")
+
+    asyncio.run(run())
+
+def test_plain_async_iterator():
+    """测试search返回普通异步迭代器（没有aclose）时正常结束"""
+
+    async def run():
+        engine = SearchEngine(PlainIteratorAPI(accounts=2, page_latency=0, results_per_query=30))
+
+        async def collect():
+            return [hit async for hit in engine.search_many(["python", "rust"])]
+
+        # 工作协程在finally中出错时不会放结束标记，用超时避免测试挂起
+        hits = await asyncio.wait_for(collect(), timeout=10)
+        assert hits and all(stats['error'] is None for stats in engine.stats.values()), engine.stats
+
+    asyncio.run(run())
+
+def test_paced_pages():
+    """测试给出pacing时按页请求search_raw，每页交回状态码和响应头，结果与不控制节奏时相同"""
+
+    async def run():
+        queries = [f"keyword{i}" for i in range(6)]
+        plain = [hit.tweet.id async for hit in SearchEngine(
+            FakeTwitterAPI(accounts=3, page_latency=0, results_per_query=50)).search_many(queries)]
+
+        api = FakeTwitterAPI(accounts=3, page_latency=0.01, results_per_query=50, window_limit=1_000, window=60)
+        pacing = PacingController(rate=20.0, max_rate=200.0)
+        engine = SearchEngine(api, pacing=pacing, parse_page=parse_tweets)
+        paced = [hit.tweet.id async for hit in engine.search_many(queries)]
+        stats = pacing.stats()['twscrape/SearchTimeline']
+        pacer = pacing.pacer('twscrape', 'SearchTimeline')
+
+        assert sorted(paced) == sorted(plain), "按页节奏控制改变了搜索结果"
+        assert stats['requests'] == api.pages == 6 * 3, f"未按页控制: {stats} pages={api.pages}"
+        # 响应头配额按3个账号放大：每账号约1000/60次/秒
+        assert pacer.ceiling > 1_000 / 60 * 2, f"池配额上限未按账号数放大: {pacer.ceiling:.1f}"
+
+    asyncio.run(run())
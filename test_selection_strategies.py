@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+资源选择策略测试
+"""
+
+import random
+from collections import Counter
+
+import pytest
+
+from selection_strategies import (
+    BestScore, Candidate, PowerOfTwoChoices, ScoreBandRoundRobin, WeightedRandom, create_strategy
+)
+
+def test_p2c_picks_better_sample():
+    """测试p2c总是选两个样本中在途请求少的，持平时选评分高的"""
+    rng = random.Random(3)
+    strategy = PowerOfTwoChoices(rng=rng)
+    for _ in range(1_000):
+        # 管理器按评分降序传入抽样候选
+        samples = sorted((Candidate(f"r{i}", rng.random(), rng.randint(0, 3)) for i in range(2)),
+                         key=lambda candidate: -candidate.score)
+        index = strategy.choose(samples)
+        chosen, other = samples[index], samples[1 - index]
+        assert (chosen.load, -chosen.score) <= (other.load, -other.score), f"选了较差的样本: {samples}"
+
+def test_weighted_frequencies():
+    """测试加权随机的选择频率与评分成比例"""
+    strategy = WeightedRandom(rng=random.Random(5))
+    candidates = [Candidate('a', 0.9, 0), Candidate('b', 0.6, 0), Candidate('c', 0.3, 0)]
+    draws = 30_000
+    counts = Counter(strategy.choose(candidates) for _ in range(draws))
+
+    total = sum(candidate.score for candidate in candidates)
+    for i, candidate in enumerate(candidates):
+        expected = candidate.score / total
+        assert abs(counts[i] / draws - expected) < 0.015, (
+            f"{candidate.resource_id} 频率 {counts[i] / draws:.3f}，期望 {expected:.3f}")
+
+def test_round_robin_cycles_band():
+    """测试轮询在评分带内依次循环，不选带外候选"""
+    strategy = ScoreBandRoundRobin(band=0.05)
+    candidates = [Candidate('a', 1.0, 0), Candidate('b', 0.98, 0), Candidate('c', 0.96, 0), Candidate('d', 0.5, 0)]
+    picks = [strategy.choose(candidates) for _ in range(9)]
+    assert picks == [1, 2, 0] * 3, f"轮询顺序异常: {picks}"
+
+def test_create_strategy():
+    """测试按名称创建策略并传递参数，未知名称报错"""
+    assert isinstance(create_strategy('best'), BestScore)
+    weighted = create_strategy('weighted', window=4)
+    assert isinstance(weighted, WeightedRandom) and weighted.window == 4
+    with pytest.raises(ValueError, match="Unknown selection strategy"):
+        create_strategy('fastest')
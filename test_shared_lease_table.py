@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+多进程共享租用表测试
+"""
+
+import asyncio
+import multiprocessing
+
+from fake_socks5 import add_offline_proxies
+from shared_lease_table import SharedLeaseTable
+from socks5_proxy_manager import SOCKS5ProxyManager
+
+def shared_lease_worker(table, leases: int, results):
+    """工作进程：各自的代理管理器登记同一个代理，并发租用并记录观察到的全局在途峰值"""
+    async def run():
+        manager = SOCKS5ProxyManager(lease_table=table)
+        await add_offline_proxies(manager, 1, max_concurrent=2)
+        peak = 0
+
+        async def worker():
+            nonlocal peak
+            async with manager.lease(timeout=10) as lease:
+                peak = max(peak, table.in_flight(f'proxy:{lease.proxy_id}'))
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(*(worker() for _ in range(leases)))
+        await manager.close()
+        results.put(peak)
+
+    asyncio.run(run())
+
+def test_shared_lease_table():
+    """测试多个进程共用租用表时代理并发上限按所有进程合计生效"""
+    table = SharedLeaseTable(capacity=64)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=shared_lease_worker, args=(table, 6, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    peaks = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+    exit_codes = [worker.exitcode for worker in workers]
+
+    # 状态共享：暂停后任何进程都无法占用
+    table.set_status('proxy:shared', 'error')
+    blocked = not table.try_acquire('proxy:shared', 10)
+    remaining = table.in_flight('proxy:socks5_10.0.0.0_1080')
+    table.unlink()
+
+    print(f"   3个进程各租用6次，各进程观察到的全局在途峰值 {peaks}，结束后在途 {remaining}")
+    assert max(peaks) <= 2 and remaining == 0 and blocked and exit_codes == [0, 0, 0], (
+        f"共享租用表异常: peaks={peaks} remaining={remaining} blocked={blocked} exit={exit_codes}")
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+SOCKS5代理管理器测试
+使用本地SOCKS5替身服务器模拟正常、缓慢和失败的代理，无需外部网络
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+
+import pytest
+
+from benchmarks import RoundTripCounter
+from fake_socks5 import (
+    FakeSOCKS5Server, add_offline_proxies, build_proxy_list, create_manager
+)
+from mock_pipeline import MockPipeline
+from socks5_proxy_manager import (
+    USAGE_DAY_SECONDS, MockRedis, SOCKS5ProxyManager, ProxyConfig, ProxyConnector, ProxyMetrics, ProxyRegion,
+    ProxyScoreIndex, ProxyStatus, RecordCache, np
+)
+from sqlite_store import SQLiteStore
+
+# aiohttp本身不支持SOCKS5代理，经替身服务器连接的测试需要aiohttp-socks
+requires_aiohttp_socks = pytest.mark.skipif(ProxyConnector is None,
+                                            reason="需要安装 aiohttp-socks: pip install aiohttp-socks")
+requires_numpy = pytest.mark.skipif(np is None, reason="需要安装 numpy: pip install numpy")
+
+@requires_aiohttp_socks
+def test_concurrent_verification():
+    """测试并发验证、并发上限和进度回调"""
+
+    async def run():
+        server = FakeSOCKS5Server()
+        try:
+            layout = {
+                '127.0.0.1': ['good'] * 20 + ['slow'] * 5 + ['fail'] * 5,
+                '127.0.0.2': ['good'] * 10 + ['slow'] * 5,
+            }
+            proxy_list = await build_proxy_list(server, layout)
+            manager = create_manager()
+
+            progress_calls = []
+            start = time.perf_counter()
+            results = await manager.add_proxy_batch(
+                proxy_list, concurrency=12, per_host_limit=8,
+                progress=lambda done, total: progress_calls.append((done, total))
+            )
+            elapsed = time.perf_counter() - start
+
+            active = await manager.redis.smembers('proxies:active')
+            error = await manager.redis.smembers('proxies:error')
+            print(f"   耗时 {elapsed:.2f}s，活跃 {len(active)}，错误 {len(error)}")
+            print(f"   峰值并发: 总计 {server.peak_total}，按主机 {dict(server.peak_in_flight)}")
+
+            checks = [
+                len(results) == len(proxy_list) and all(results.values()),
+                len(active) == 30 and len(error) == 15,
+                server.peak_total <= 12,
+                all(peak <= 8 for peak in server.peak_in_flight.values()),
+                progress_calls[-1] == (len(proxy_list), len(proxy_list)),
+                len(progress_calls) == len(proxy_list),
+                # 串行需要至少10个超时(10s)，并发应在数秒内完成
+                elapsed < 5,
+            ]
+            await manager.close()
+            assert all(checks), f"并发验证检查失败: {checks}"
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+@requires_aiohttp_socks
+def test_per_host_fairness():
+    """测试单一主机的大量端口不会挤占其他主机"""
+
+    async def run():
+        server = FakeSOCKS5Server()
+        try:
+            layout = {
+                '127.0.0.1': ['slow'] * 20,
+                '127.0.0.2': ['good'] * 5,
+            }
+            proxy_list = await build_proxy_list(server, layout)
+            manager = create_manager()
+
+            finish_times = {}
+            start = time.perf_counter()
+
+            def progress(done, total):
+                finish_times[done] = time.perf_counter() - start
+
+            results = await manager.add_proxy_batch(proxy_list, concurrency=10, per_host_limit=4, progress=progress)
+            active = [p.decode() for p in await manager.redis.smembers('proxies:active')]
+            await manager.close()
+
+            # 正常主机的5个代理应在第一轮慢代理超时之前全部完成
+            good_done_early = len(active) == 5 and finish_times.get(5, 99) < 1.0
+            print(f"   127.0.0.1峰值并发: {server.peak_in_flight['127.0.0.1']}，前5个完成于 {finish_times.get(5, 0):.2f}s")
+
+            assert good_done_early and server.peak_in_flight['127.0.0.1'] <= 4 and len(results) == 25, "主机公平调度异常"
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+@requires_aiohttp_socks
+def test_cancellation():
+    """测试取消批量验证后结果表和状态集合保持一致"""
+
+    async def run():
+        server = FakeSOCKS5Server()
+        try:
+            layout = {'127.0.0.1': ['good'] * 5 + ['slow'] * 10}
+            proxy_list = await build_proxy_list(server, layout)
+            manager = create_manager()
+            manager.test_timeout = 30
+
+            results = {}
+            task = asyncio.ensure_future(manager.add_proxy_batch(proxy_list, concurrency=15, results=results))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+            active = {p.decode() for p in await manager.redis.smembers('proxies:active')}
+            testing = {p.decode() for p in await manager.redis.smembers('proxies:testing')}
+            await manager.close()
+            print(f"   已完成 {len(results)}，活跃 {len(active)}，仍在测试 {len(testing)}")
+
+            # 被取消时正在测试的代理留在testing集合，尚未开始的代理不会写入
+            assert len(results) == 5 and active == set(results) and testing and not testing & active, "取消后状态不一致"
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+@requires_aiohttp_socks
+def test_session_pool():
+    """测试连接复用、max_concurrent连接上限和空闲回收"""
+
+    async def run():
+        server = FakeSOCKS5Server(response_delay=0.02)
+        try:
+            proxy_list = await build_proxy_list(server, {'127.0.0.1': ['good']})
+            manager = create_manager()
+            await manager.add_proxy_batch(proxy_list)
+            proxy_id = f"socks5_127.0.0.1_{proxy_list[0]['port']}"
+            config = await manager._get_proxy_config(proxy_id)
+
+            # 连续健康检查复用同一条隧道
+            for _ in range(5):
+                await manager._test_proxy_connection(config)
+            reused = server.connections == 1 and server.requests == 6
+            print(f"   6次健康检查建立连接 {server.connections} 次")
+
+            # 业务并发借用受max_concurrent限制
+            config.max_concurrent = 3
+            await manager._save_proxy_config(config)
+            await manager.session_pool.discard(proxy_id)
+            server.peak_in_flight.clear()
+
+            async def fetch():
+                async with manager.session(proxy_id) as session:
+                    async with session.get(manager.test_url) as response:
+                        return response.status
+
+            statuses = await asyncio.gather(*(fetch() for _ in range(20)))
+            capped = all(status == 200 for status in statuses) and server.peak_in_flight['127.0.0.1'] <= 3
+            print(f"   20个并发请求峰值 {server.peak_in_flight['127.0.0.1']} (上限3)，共 {server.connections} 次连接")
+
+            # 空闲回收
+            manager.session_pool.idle_timeout = 0.1
+            await asyncio.sleep(0.2)
+            evicted = await manager.session_pool.evict_idle()
+            print(f"   空闲回收 {evicted} 个会话，剩余 {len(manager.session_pool)}")
+
+            await manager.close()
+            assert reused and capped and evicted == 1 and len(manager.session_pool) == 0, "会话池行为异常"
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+def test_lease_queue():
+    """测试租用并发上限、先来先到排队、超时和成功/错误记账"""
+
+    async def run():
+        manager = SOCKS5ProxyManager()
+        await add_offline_proxies(manager, 2, max_concurrent=2)
+
+        in_flight = defaultdict(int)
+        peak = defaultdict(int)
+        acquired_order = []
+
+        async def worker(n):
+            async with manager.lease() as lease:
+                acquired_order.append(n)
+                in_flight[lease.proxy_id] += 1
+                peak[lease.proxy_id] = max(peak[lease.proxy_id], in_flight[lease.proxy_id])
+                await asyncio.sleep(0.05)
+                in_flight[lease.proxy_id] -= 1
+
+        workers = []
+        for n in range(12):
+            workers.append(asyncio.ensure_future(worker(n)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*workers)
+
+        capped = all(value <= 2 for value in peak.values())
+        fifo = acquired_order == sorted(acquired_order)
+        stats = manager.lease_stats()
+        print(f"   12个租用完成，单代理峰值 {dict(peak)}，获取顺序先来先到: {fifo}")
+        print(f"   排队等待 p99 {stats['wait_time']['p99'] * 1000:.1f}ms，租用时长 p50 {stats['hold_time']['p50'] * 1000:.1f}ms")
+
+        # 容量占满时超时
+        holders = [manager.lease() for _ in range(4)]
+        for holder in holders:
+            await holder.__aenter__()
+        try:
+            async with manager.lease(timeout=0.1):
+                timed_out = False
+        except asyncio.TimeoutError:
+            timed_out = True
+        for holder in holders:
+            await holder.__aexit__(None, None, None)
+
+        # 异常退出记为错误
+        try:
+            async with manager.lease() as lease:
+                raise ConnectionError("reset by peer")
+        except ConnectionError:
+            pass
+        metrics = await manager._get_proxy_metrics(lease.proxy_id)
+
+        await manager.close()
+        assert capped and fifo and timed_out and metrics.failed_requests == 1 and stats['active_leases'] == 0, (
+            f"租用行为异常: capped={capped} fifo={fifo} timed_out={timed_out} failed={metrics.failed_requests}")
+
+    asyncio.run(run())
+
+def test_success_single_round_trip(tmp_path):
+    """测试带响应时间的成功记录在缓存命中时只提交一次，平均响应时间与计数一起写入"""
+
+    async def run():
+        store = SQLiteStore(os.path.join(tmp_path, 'proxies.db'))
+        manager = SOCKS5ProxyManager(store)
+        await add_offline_proxies(manager, 1, max_concurrent=1)
+        proxy_id = "socks5_10.0.0.0_1080"
+        await manager.update_proxy_success(proxy_id, response_time=1.0)
+
+        commits = store.stats()['commits']
+        for _ in range(10):
+            await manager.update_proxy_success(proxy_id, response_time=2.0)
+        per_update = (store.stats()['commits'] - commits) / 10
+
+        expected = 0.2
+        for _ in range(10):
+            expected = expected * 0.8 + 2.0 * 0.2
+        stored = float(await store.hget(f'proxy:{proxy_id}:metrics', 'average_response_time'))
+        await manager.close()
+        await store.close()
+        assert per_update == 1 and abs(stored - expected) < 1e-9, (
+            f"每次成功记录提交 {per_update} 次，平均响应时间 {stored:.4f}（期望 {expected:.4f}）")
+
+    asyncio.run(run())
+
+def test_score_index_compaction():
+    """测试小地区反复更新时按本桶存活成员数压缩，旧条目不会无限堆积"""
+    index = ProxyScoreIndex()
+    for i in range(10_000):
+        index.update(f"us_{i}", ProxyRegion.US, i / 10_000)
+    for step in range(5_000):
+        index.update(f"eu_{step % 3}", ProxyRegion.EU, step % 97 / 97)
+
+    eu_heap = len(index._heaps[ProxyRegion.EU])
+    assert eu_heap <= 64 + 2 * 3 + 1, f"小地区堆未压缩: {eu_heap}个条目，存活3个"
+    assert index.peek(ProxyRegion.EU)[1] == max((step % 97) / 97 for step in range(4_997, 5_000))
+    assert index.peek()[0] == "us_9999" and len(index) == 10_003
+
+class LatentPipeline(MockPipeline):
+    """执行前让出事件循环（模拟网络往返），管道内命令仍整体原子执行"""
+
+    async def execute(self, raise_on_error: bool = True):
+        await asyncio.sleep(0)
+        return await super().execute(raise_on_error)
+
+class LatentRedis(MockRedis):
+    def pipeline(self, transaction: bool = True) -> MockPipeline:
+        return LatentPipeline(self, transaction)
+
+def test_concurrent_status_transitions():
+    """测试同一代理的并发状态切换后恰好在一个状态集合中，且与状态字段一致"""
+
+    async def run():
+        manager = SOCKS5ProxyManager(LatentRedis())
+        await add_offline_proxies(manager, 1, max_concurrent=1)
+        proxy_id = "socks5_10.0.0.0_1080"
+        await manager.get_statistics()
+        rng = random.Random(7)
+
+        for round_ in range(20):
+            targets = [rng.choice(list(ProxyStatus)) for _ in range(4)]
+            # 模拟其他进程的写入：本地缓存的旧状态与Redis不符
+            if round_ % 5 == 0:
+                manager.config_cache.peek(proxy_id).status = rng.choice(list(ProxyStatus))
+            await asyncio.gather(*(manager._update_proxy_status(proxy_id, status) for status in targets))
+
+            members = [s for s in ProxyStatus if proxy_id in manager.redis.sets.get(f'proxies:{s.value}', ())]
+            field = manager.redis.data[f'proxy:{proxy_id}:config']['status']
+            assert len(members) == 1 and members[0].value == field, (
+                f"第{round_}轮 {targets} 后状态集合 {members}，状态字段 {field}")
+            assert manager.config_cache.peek(proxy_id).status.value == field
+        await manager.close()
+
+    asyncio.run(run())
+
+def test_smove_missing_member():
+    """测试SMOVE在成员不在源集合中时返回False且不修改目标集合"""
+
+    async def run():
+        redis = MockRedis()
+        await redis.sadd('proxies:active', 'a')
+        moved = await redis.smove('proxies:active', 'proxies:error', 'a')
+        missing = await redis.smove('proxies:active', 'proxies:error', 'b')
+        assert moved is True and missing is False
+        assert redis.sets['proxies:error'] == {'a'} and redis.sets['proxies:active'] == set()
+
+    asyncio.run(run())
+
+def test_expiry_and_usage_rollover():
+    """测试注入时钟下键过期（惰性读取和堆清理）、ttl返回值，以及用量计数跨窗口/跨天自动归零"""
+
+    async def run():
+        now = [USAGE_DAY_SECONDS * 100 - 1.0]
+        redis = MockRedis(clock=lambda: now[0])
+        await redis.set('lazy', '1', ex=10)
+        await redis.set('swept', '1', ex=10)
+        await redis.set('persistent', '1')
+        assert [await redis.ttl(key) for key in ('lazy', 'persistent', 'missing')] == [10, -1, -2]
+
+        manager = SOCKS5ProxyManager(redis)
+        manager.clock = lambda: now[0]
+        manager._usage_day = int(now[0] // USAGE_DAY_SECONDS)
+        await add_offline_proxies(manager, 1, max_concurrent=1)
+        proxy_id = "socks5_10.0.0.0_1080"
+        for _ in range(2):
+            await manager.get_available_proxy()
+        before = await manager.get_usage(proxy_id)
+        old_day_key = manager._usage_keys(proxy_id)[0]
+
+        # 跨过15分钟窗口和日边界，无需清零任务
+        now[0] += 2
+        after = await manager.get_usage(proxy_id)
+        cached_usage = (await manager._get_proxy_metrics(proxy_id)).daily_usage
+        await manager.get_available_proxy()
+        assert before == {'daily': 2, 'window': 2} and after == {'daily': 0, 'window': 0}, f"{before} -> {after}"
+        assert cached_usage == 0 and await manager.get_usage(proxy_id) == {'daily': 1, 'window': 1}
+
+        now[0] += 10
+        # 读取lazy时惰性删除，同时触发按截止时间堆的主动清理
+        assert await redis.get('lazy') is None and await redis.ttl('lazy') == -2
+        assert 'swept' not in redis.data and 'swept' not in redis.expires, "过期键未被主动清理"
+        assert await redis.get('persistent') == '1'
+
+        # 旧的日桶在两天后过期
+        now[0] += 2 * USAGE_DAY_SECONDS
+        evicted = redis.evict_expired()
+        await manager.close()
+        assert evicted >= 1 and old_day_key not in redis.data, f"旧用量桶未过期: 清理 {evicted} 个"
+
+    asyncio.run(run())
+
+def test_record_cache():
+    """测试记录缓存的LRU淘汰和TTL过期，以及管理器读缓存命中时不访问Redis、自身写入就地更新缓存"""
+
+    async def run():
+        now = [0.0]
+        cache = RecordCache(max_size=2, ttl=10, clock=lambda: now[0])
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.peek('b') is None and len(cache) == 2, "未淘汰最久未使用的条目"
+        now[0] = 11
+        assert cache.get('a') is None and cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+        redis = RoundTripCounter()
+        manager = SOCKS5ProxyManager(redis, cache_ttl=60)
+        manager.config_cache.clock = manager.metrics_cache.clock = lambda: now[0]
+        await add_offline_proxies(manager, 1, max_concurrent=1)
+        proxy_id = "socks5_10.0.0.0_1080"
+
+        # 写穿后的读取全部命中缓存
+        start = redis.round_trips
+        for _ in range(3):
+            await manager._get_proxy_config(proxy_id)
+            await manager._load_proxy(proxy_id)
+        assert redis.round_trips == start, f"缓存命中仍访问Redis {redis.round_trips - start} 次"
+
+        # 自身的状态和指标写入同步到缓存对象，读取不陈旧也不需要往返
+        await manager._update_proxy_status(proxy_id, ProxyStatus.TESTING)
+        await manager.mark_proxy_error(proxy_id, "timeout")
+        start = redis.round_trips
+        config, metrics = await manager._load_proxy(proxy_id)
+        assert redis.round_trips == start and config.status == ProxyStatus.TESTING
+        assert metrics.consecutive_errors == 1 and metrics.failed_requests == 1, f"缓存指标陈旧: {metrics}"
+
+        # 其他进程的写入在TTL到期后重新读取
+        await redis.hset(f'proxy:{proxy_id}:config', 'status', ProxyStatus.ACTIVE.value)
+        assert (await manager._get_proxy_config(proxy_id)).status == ProxyStatus.TESTING
+        now[0] += 61
+        start = redis.round_trips
+        config = await manager._get_proxy_config(proxy_id)
+        await manager.close()
+        assert config.status == ProxyStatus.ACTIVE and redis.round_trips == start + 1, (
+            f"TTL过期后未重新读取: {config.status}，往返 {redis.round_trips - start} 次")
+
+    asyncio.run(run())
+
+@requires_numpy
+def test_columnar_score_parity():
+    """测试列式向量化评分与ProxyMetrics逐个计算一致，删除后迟到的指标写入被忽略"""
+    manager = SOCKS5ProxyManager(columnar=True)
+    columns = manager.metrics_columns
+    rng = random.Random(11)
+    records = []
+    for i in range(500):
+        config = ProxyConfig(
+            proxy_id=f"socks5_10.0.{i // 256}.{i % 256}_1080", host=f"10.0.{i // 256}.{i % 256}", port=1080,
+            username='user', password='secret', region=rng.choice(list(ProxyRegion)),
+            status=rng.choice(list(ProxyStatus)), daily_limit=rng.choice([500, 1000])
+        )
+        total = rng.randint(0, 200)
+        metrics = ProxyMetrics(
+            total_requests=total, successful_requests=rng.randint(0, total),
+            consecutive_errors=rng.randint(0, 5), daily_usage=rng.choice([0, 799, 800, 999, rng.randint(0, 1000)]),
+            average_response_time=rng.choice([3.0, 5.0, rng.uniform(0.2, 6.0)])
+        )
+        columns.set_config(config)
+        columns.set_metrics(config.proxy_id, metrics)
+        records.append((config, metrics))
+
+    health = columns.health_scores()
+    scores = columns.selection_scores(health)
+    mask = columns.selectable_mask(manager.health_threshold, health=health)
+    for config, metrics in records:
+        slot = columns.slots[config.proxy_id]
+        assert abs(health[slot] - metrics.health_score) < 1e-9, f"{config.proxy_id} 健康分不一致: {metrics}"
+        assert abs(scores[slot] - manager._calculate_score(config, metrics)) < 1e-9
+        assert mask[slot] == manager._is_selectable(config, metrics), f"{config.proxy_id} 可选判定不一致"
+
+    # 删除后迟到的写入不会重新占用槽位
+    removed = records[0][0].proxy_id
+    columns.remove(removed)
+    columns.update(removed, consecutive_errors=3, status=ProxyStatus.ACTIVE)
+    assert removed not in columns and len(columns) == len(records) - 1
+    assert not columns.selectable_mask(0.0)[columns.proxy_ids.index(None)]
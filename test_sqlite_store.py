@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+SQLite持久化存储测试
+"""
+
+import asyncio
+import os
+import tempfile
+
+from fake_socks5 import add_offline_proxies
+from socks5_proxy_manager import SOCKS5ProxyManager, ProxyStatus
+from sqlite_store import SQLiteStore
+
+def test_sqlite_store():
+    """测试SQLite存储下指标、状态集合和选择在重启后保持"""
+
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pool.db')
+            store = SQLiteStore(path)
+            manager = SOCKS5ProxyManager(redis_client=store)
+            await add_offline_proxies(manager, 3, max_concurrent=5)
+            good_id, bad_id = "socks5_10.0.0.0_1080", "socks5_10.0.0.1_1080"
+
+            await asyncio.gather(*(manager.update_proxy_success(good_id, 0.3) for _ in range(20)))
+            for _ in range(5):
+                await manager.mark_proxy_error(bad_id, "timeout")
+            await manager.close()
+            await store.close()
+
+            # 模拟重启：新的存储连接和管理器
+            store = SQLiteStore(path)
+            restarted = SOCKS5ProxyManager(redis_client=store)
+            metrics = await restarted._get_proxy_metrics(good_id)
+            bad_status = (await restarted._get_proxy_config(bad_id)).status
+            error_set = {member.decode() for member in await store.smembers(f'proxies:{ProxyStatus.ERROR.value}')}
+            selected = {(await restarted.get_available_proxy())['proxy_id'] for _ in range(4)}
+            stats = store.stats()
+            await restarted.close()
+            await store.close()
+
+        print(f"   重启后成功 {metrics.successful_requests} 次，暂停代理状态 {bad_status.value}，"
+              f"可选代理 {sorted(selected)}，存储统计 {stats}")
+        assert (metrics.successful_requests == 20 and metrics.consecutive_errors == 0
+                and bad_status == ProxyStatus.ERROR and error_set == {bad_id} and bad_id not in selected), (
+            f"持久化存储异常: metrics={metrics} status={bad_status} error_set={error_set}")
+
+    asyncio.run(run())
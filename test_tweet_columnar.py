@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+推文列式导出测试（需要pyarrow）
+"""
+
+import os
+import tempfile
+
+import pytest
+
+from fake_twscrape import synthetic_tweet_data
+from tweet_columnar import ParquetTweetWriter, flatten_tweet_data, ndjson_to_parquet, read_tweets, scan_tweets
+from tweet_sink import NDJSONSink
+
+pa = pytest.importorskip("pyarrow")
+pc = pytest.importorskip("pyarrow.compute")
+pq = pytest.importorskip("pyarrow.parquet")
+
+def test_columnar_export():
+    """测试Parquet导出：展平读回一致、行组增量写入、字典编码和列裁剪读取"""
+    checks = {}
+    records = list(synthetic_tweet_data(5_000, seed=5))
+    # 缺失分组和字段写为空值
+    del records[10]['engagement']
+    records[11]['basic_info']['created_at'] = None
+    # twscrape的日期带时区偏移，统一存为UTC；没有偏移的按UTC处理
+    records[12]['basic_info']['created_at'] = '2024-01-01T08:00:00+08:00'
+    records[13]['basic_info']['created_at'] = '2024-01-01T00:00:00'
+    expected = [flatten_tweet_data(record) for record in records]
+    expected[12]['created_at'] = expected[13]['created_at'] = '2024-01-01T00:00:00+00:00'
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tweets.parquet')
+        with ParquetTweetWriter(path, row_group_size=1_000) as writer:
+            for record in records:
+                writer.write(record)
+                if writer.rows == 2_000 and not checks.get('增量写入'):
+                    # 行组写出后缓冲区清空
+                    checks['增量写入'] = writer.row_groups == 2 and not writer._columns[0]
+        table = read_tweets(path)
+        rows = table.to_pylist()
+        for row in rows:
+            if row['created_at'] is not None:
+                row['created_at'] = row['created_at'].isoformat()
+        checks['读回一致'] = rows == expected
+        checks['行组数'] = pq.ParquetFile(path).metadata.num_row_groups == 5
+
+        row_group = pq.ParquetFile(path).metadata.row_group(0)
+        encodings = {row_group.column(i).path_in_schema: row_group.column(i).encodings
+                     for i in range(row_group.num_columns)}
+        checks['字典编码'] = ('RLE_DICTIONARY' in encodings['username'] and 'RLE_DICTIONARY' in encodings['lang']
+                          and pa.types.is_dictionary(table.schema.field('username').type))
+
+        projected = read_tweets(path, columns=['lang', 'likes'])
+        checks['列裁剪'] = projected.column_names == ['lang', 'likes'] and projected.num_rows == len(records)
+
+        english = sum(batch.num_rows for batch in
+                      scan_tweets(path, ['id'], filter=pc.field('lang') == 'en', batch_size=700))
+        checks['流式扫描过滤'] = english == sum(1 for row in expected if row['lang'] == 'en')
+
+        # NDJSON落盘文件转换为Parquet
+        with NDJSONSink(os.path.join(directory, 'ndjson'), max_bytes=500_000) as sink:
+            sink.write_many(records)
+        converted = os.path.join(directory, 'converted.parquet')
+        checks['NDJSON转换'] = (ndjson_to_parquet(sink.files, converted, row_group_size=2_000) == len(records)
+                              and read_tweets(converted, columns=['id']).column('id').to_pylist()
+                              == [row['id'] for row in expected])
+        parquet_size, ndjson_size = os.path.getsize(path), sum(os.path.getsize(p) for p in sink.files)
+
+    failed = [name for name, ok in checks.items() if not ok]
+    print(f"   {len(records)}条记录，Parquet {parquet_size / 1024:.0f}KB，NDJSON {ndjson_size / 1024:.0f}KB")
+    assert not failed, f"列式导出异常: {failed}"
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+跨查询推文去重测试
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+
+import tweet_dedup
+from fake_twscrape import FakeTwitterAPI
+from search_engine import SearchEngine
+from tweet_dedup import BloomFilter, SortedIdStore, TweetDeduplicator
+
+def test_tweet_dedup():
+    """测试跨查询去重：重复判定、持久化重开、Bloom重建、实测误判率和两种归并路径"""
+
+    async def run():
+        checks = {}
+        rng = random.Random(25)
+        ids = rng.sample(range(1, 1 << 62), 60_000)
+        stream = ids[:40_000] + ids[20_000:60_000] + ids[:1_000]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'seen')
+            with TweetDeduplicator(path, capacity=100_000, merge_threshold=8_192) as dedup:
+                repeated = [tweet_id for tweet_id in stream if dedup.seen(tweet_id)]
+                stats = dedup.stats()
+            checks['重复判定'] = repeated == ids[20_000:40_000] + ids[:1_000] and stats['unique'] == len(ids)
+            checks['增量归并'] = stats['merges'] >= 7 and stats['stored_ids'] == len(ids)
+
+            # 重开后沿用持久化的Bloom和ID文件
+            with TweetDeduplicator(path, capacity=100_000) as dedup:
+                checks['持久化重开'] = (not dedup.bloom.created and all(tweet_id in dedup for tweet_id in ids[::97])
+                                      and dedup.seen(ids[123]) and not dedup.seen(ids[-1] + 1))
+
+            # Bloom文件丢失时按ID文件重建
+            os.remove(os.path.join(path, 'bloom.bin'))
+            with TweetDeduplicator(path, capacity=100_000) as dedup:
+                checks['Bloom重建'] = dedup.bloom.created and dedup.bloom.count > len(ids) * 0.99 and dedup.seen(ids[5])
+
+            # 两种归并路径结果一致（有/无numpy）
+            merged = {}
+            saved_np = tweet_dedup.np
+            try:
+                for name, module in (('numpy', saved_np), ('heapq', None)):
+                    tweet_dedup.np = module
+                    store = SortedIdStore(os.path.join(directory, f'{name}.u64'), merge_threshold=5_000)
+                    for tweet_id in ids[:12_000]:
+                        store.add(tweet_id)
+                    store.merge()
+                    merged[name] = (list(store), all(tweet_id in store for tweet_id in ids[:12_000:7]),
+                                    ids[-1] in store)
+                    store.close()
+            finally:
+                tweet_dedup.np = saved_np
+            expected = (sorted(ids[:12_000]), True, False)
+            checks['归并路径'] = merged['heapq'] == expected and (saved_np is None or merged['numpy'] == expected)
+
+        # 装满容量后实测误判率接近设定值
+        bloom = BloomFilter(50_000, error_rate=0.01)
+        for tweet_id in ids[:50_000]:
+            bloom.add(tweet_id)
+        probes = [rng.randrange(1 << 62, 1 << 63) for _ in range(50_000)]
+        measured = sum(probe in bloom for probe in probes) / len(probes)
+        checks['误判率'] = measured < 0.02 and all(tweet_id in bloom for tweet_id in ids[:50_000])
+        bloom.close()
+
+        # SearchEngine共用去重器时，第二批查询跳过第一批已见过的推文
+        api = FakeTwitterAPI(accounts=4, page_latency=0.001, results_per_query=200, corpus_size=2_000)
+        dedup = TweetDeduplicator(capacity=10_000)
+        engine = SearchEngine(api, deduplicator=dedup)
+        first = {hit.tweet.id async for hit in engine.search_many(['python', 'rust'])}
+        second = {hit.tweet.id async for hit in engine.search_many(['python', 'golang'])}
+        checks['跨调用去重'] = (not first & second and engine.stats['python']['tweets'] == 0
+                              and engine.stats['python']['duplicates'] == 200 and dedup.stats()['unique'] == len(first | second))
+        dedup.close()
+
+        failed = [name for name, ok in checks.items() if not ok]
+        print(f"   {len(stream)}个ID，{stats['duplicates']}个重复，1%设定下实测误判率 {measured:.2%}")
+        assert not failed, f"推文去重异常: {failed}"
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+流式NDJSON落盘测试
+"""
+
+import os
+import tempfile
+
+from fake_twscrape import synthetic_tweet_data
+from tweet_sink import NDJSONSink, read_ndjson
+
+def test_tweet_sink():
+    """测试NDJSON落盘的完整读回、按大小/时间轮转、批量刷新和截断文件恢复"""
+    checks = {}
+    records = list(synthetic_tweet_data(5_000, seed=3))
+    with tempfile.TemporaryDirectory() as directory:
+        # 按大小轮转，gzip与不压缩读回一致
+        for compress in (False, True):
+            with NDJSONSink(os.path.join(directory, f'size_{compress}'), compress=compress,
+                            max_bytes=200_000 if compress else 1_000_000, batch_size=500) as sink:
+                sink.write_many(records)
+            restored = [record for path in sink.files for record in read_ndjson(path)]
+            sizes = [os.path.getsize(path) for path in sink.files]
+            checks[f'读回一致(gzip={compress})'] = restored == records and sink.records == len(records)
+            checks[f'按大小轮转(gzip={compress})'] = len(sink.files) > 1 and max(sizes[:-1]) < sink.max_bytes * 1.5
+
+        # 按时间轮转：时钟每批前进60秒，max_seconds=100秒时每两批一个文件
+        clock = [1_700_000_000.0]
+        sink = NDJSONSink(os.path.join(directory, 'time'), max_seconds=100, batch_size=100,
+                          clock=lambda: clock[0])
+        for i, record in enumerate(records[:1_000]):
+            if i % 100 == 0:
+                clock[0] += 60
+            sink.write(record)
+        sink.close()
+        checks['按时间轮转'] = len(sink.files) == 5
+
+        # 未满一批时不写盘；刷新后未关闭的gzip文件（模拟崩溃）也能读出已刷新的记录
+        sink = NDJSONSink(os.path.join(directory, 'crash'), compress=True, batch_size=1_000)
+        sink.write_many(records[:999])
+        checks['未满一批不写盘'] = not sink.files
+        sink.write_many(records[999:2_500])
+        checks['内存只保留一批'] = len(sink._batch) == 500
+        with open(sink.files[0], 'rb') as f:
+            crashed = os.path.join(directory, 'crashed.ndjson.gz')
+            with open(crashed, 'wb') as copy:
+                copy.write(f.read())
+        # 再截掉几个字节，模拟写到一半
+        with open(crashed, 'r+b') as f:
+            f.truncate(os.path.getsize(crashed) - 3)
+        recovered = list(read_ndjson(crashed))
+        sink.close()
+        checks['截断文件恢复'] = 1_000 <= len(recovered) <= 2_000 and recovered == records[:len(recovered)]
+
+    failed = [name for name, ok in checks.items() if not ok]
+    print(f"   {len(records)}条记录，截断的gzip文件读回 {len(recovered)} 条")
+    assert not failed, f"NDJSON落盘异常: {failed}"
@@ -6,6 +6,7 @@ twscrape 可行性验证脚本
 """
 
 import asyncio
+import shutil
 import sys
 import json
 import os
@@ -14,6 +15,43 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any
 from pathlib import Path
 
+from pacing_controller import PacingController
+from search_engine import SearchEngine
+from tweet_columnar import ndjson_to_parquet, pa
+from tweet_dedup import TweetDeduplicator
+from tweet_sink import NDJSONSink
+
+# 重叠查询（python / python lang:en / #python ...）之间按tweet.id去重，重复的推文不再处理；
+# 只在一次运行内有效（不持久化），由main()创建和关闭，单独调用测试函数时各次搜索自行去重
+seen_tweets: Optional[TweetDeduplicator] = None
+
+# 全部采集循环共用的节奏控制器。twscrape的*_raw方法每次请求产出一个httpx.Response，按页交回状态码、
+# x-rate-limit-*响应头和耗时；twscrape在QueueClient内部挑选账号、响应上没有账号标识，
+# 因此按整个账号池控制节奏，配额按活跃账号数放大
+pacing = PacingController()
+TWSCRAPE_POOL = 'twscrape'
+
+async def active_account_count(api) -> int:
+    return max(1, sum(1 for account in await api.pool.get_all() if account.active))
+
+async def paced_pages(api, pages, operation: str, parse, limit: int):
+    """按页节奏控制twscrape的*_raw分页迭代器，逐条产出parse(rep.json(), limit)解析出的条目"""
+    async for item in pacing.paged(pages, lambda rep: parse(rep.json(), limit), TWSCRAPE_POOL, operation,
+                                   await active_account_count(api)):
+        yield item
+
+def paced_search(api, query: str, limit: int):
+    from twscrape.models import parse_tweets
+    return paced_pages(api, api.search_raw(query, limit=limit), 'SearchTimeline', parse_tweets, limit)
+
+async def paced_request(api, request, operation: str, parse):
+    """按节奏发出一次twscrape的*_raw请求（如user_by_login_raw），返回parse(rep)，没有响应时返回None"""
+    async with pacing.request(TWSCRAPE_POOL, operation, await active_account_count(api)) as call:
+        rep = await request()
+        if rep is not None:
+            call.record(rep.status_code, rep.headers)
+    return parse(rep) if rep else None
+
 def check_dependencies():
     """检查依赖库是否可用"""
     print("🔍 检查依赖库...")
@@ -112,7 +150,9 @@ async def test_search_functionality():
         
         tweets = []
         count = 0
-        async for tweet in api.search(test_keyword, limit=5):
+        engine = SearchEngine(api, pacing=pacing, pacing_key=TWSCRAPE_POOL)
+        async for hit in engine.search_many([test_keyword], limit=5):
+            tweet = hit.tweet
             count += 1
             tweet_data = {
                 'id': tweet.id,
@@ -127,9 +167,9 @@ async def test_search_functionality():
             }
             tweets.append(tweet_data)
             print(f"   📝 推文 {count}: @{tweet.user.username} - {tweet_data['text']}")
-            
-            # 避免请求过快
-            await asyncio.sleep(1)
+        
+        if engine.stats[test_keyword]['error']:
+            raise RuntimeError(engine.stats[test_keyword]['error'])
         
         print(f"✅ 搜索测试完成，获取到 {len(tweets)} 条推文")
         return True
@@ -145,6 +185,7 @@ async def test_user_functionality():
 
     try:
         from twscrape import API
+        from twscrape.models import parse_user
         api = API()
 
         # 检查账号池
@@ -176,7 +217,7 @@ async def test_user_functionality():
         for username in test_usernames:
             print(f"\n🔍 查找用户: @{username}")
             try:
-                user = await api.user_by_login(username)
+                user = await paced_request(api, lambda: api.user_by_login_raw(username), 'UserByScreenName', parse_user)
                 if user:
                     print(f"✅ 找到用户: @{user.username}")
                     print(f"   显示名: {user.displayname}")
@@ -195,9 +236,6 @@ async def test_user_functionality():
                     print(f"   创建时间: {user.created}")
                     print(f"   位置: {user.location if user.location else '未设置'}")
                     successful_lookups += 1
-
-                    # 添加延迟避免请求过快
-                    await asyncio.sleep(1)
                 else:
                     print(f"❌ 未找到用户: @{username}")
             except Exception as e:
@@ -239,14 +277,14 @@ async def test_rate_limits():
         print("🔄 执行连续请求测试...")
         for i in range(3):
             try:
-                # 执行简单搜索
-                async for tweet in api.search("test", limit=1):
+                # 执行简单搜索，请求间隔由节奏控制器按每页的状态码、限流响应头和耗时调整
+                async for tweet in paced_search(api, "test", limit=1):
                     print(f"   请求 {i+1}: 成功获取推文 ID {tweet.id}")
                     break
-                await asyncio.sleep(2)  # 等待2秒
             except Exception as e:
                 print(f"   请求 {i+1}: 失败 - {e}")
 
+        print(f"   节奏控制: {pacing.stats().get(f'{TWSCRAPE_POOL}/SearchTimeline')}")
         print("✅ 速率限制测试完成")
         return True
 
@@ -319,71 +357,67 @@ async def test_data_extraction():
 
         print("🔍 测试推文数据提取...")
 
-        # 搜索并提取详细数据
+        # 搜索并提取详细数据，逐条写入NDJSON文件，内存占用与推文数无关
         test_query = "python programming"
         tweet_count = 0
-        extracted_data = []
+        complete_data = 0
+        test_data_dir = "test_extracted_data"
+        sink = NDJSONSink(test_data_dir, prefix="extracted", batch_size=100)
 
-        async for tweet in api.search(test_query, limit=3):
-            tweet_count += 1
+        with sink:
+            async for tweet in paced_search(api, test_query, limit=3):
+                tweet_count += 1
 
-            # 提取详细数据
-            tweet_data = {
-                'basic_info': {
-                    'id': tweet.id,
-                    'url': tweet.url,
-                    'created_at': tweet.date.isoformat() if tweet.date else None,
-                    'lang': tweet.lang
-                },
-                'content': {
-                    'text': tweet.rawContent,
-                    'text_length': len(tweet.rawContent),
-                    'has_media': bool(tweet.media),
-                    'media_count': len(tweet.media) if tweet.media and hasattr(tweet.media, '__len__') else 0
-                },
-                'user_info': {
-                    'username': tweet.user.username,
-                    'display_name': tweet.user.displayname,
-                    'verified': tweet.user.verified,
-                    'followers_count': tweet.user.followersCount
-                },
-                'engagement': {
-                    'retweets': tweet.retweetCount,
-                    'likes': tweet.likeCount,
-                    'replies': tweet.replyCount,
-                    'quotes': tweet.quoteCount
-                },
-                'metadata': {
-                    'is_retweet': bool(tweet.retweetedTweet),
-                    'is_reply': bool(tweet.inReplyToTweetId),
-                    'has_hashtags': '#' in tweet.rawContent,
-                    'has_mentions': '@' in tweet.rawContent
+                # 提取详细数据
+                tweet_data = {
+                    'basic_info': {
+                        'id': tweet.id,
+                        'url': tweet.url,
+                        'created_at': tweet.date.isoformat() if tweet.date else None,
+                        'lang': tweet.lang
+                    },
+                    'content': {
+                        'text': tweet.rawContent,
+                        'text_length': len(tweet.rawContent),
+                        'has_media': bool(tweet.media),
+                        'media_count': len(tweet.media) if tweet.media and hasattr(tweet.media, '__len__') else 0
+                    },
+                    'user_info': {
+                        'username': tweet.user.username,
+                        'display_name': tweet.user.displayname,
+                        'verified': tweet.user.verified,
+                        'followers_count': tweet.user.followersCount
+                    },
+                    'engagement': {
+                        'retweets': tweet.retweetCount,
+                        'likes': tweet.likeCount,
+                        'replies': tweet.replyCount,
+                        'quotes': tweet.quoteCount
+                    },
+                    'metadata': {
+                        'is_retweet': bool(tweet.retweetedTweet),
+                        'is_reply': bool(tweet.inReplyToTweetId),
+                        'has_hashtags': '#' in tweet.rawContent,
+                        'has_mentions': '@' in tweet.rawContent
+                    }
                 }
-            }
-
-            extracted_data.append(tweet_data)
-            print(f"   📝 推文 {tweet_count}: @{tweet.user.username} - {len(tweet.rawContent)} 字符")
 
-            # 避免请求过快
-            await asyncio.sleep(1)
+                sink.write(tweet_data)
+                # 数据质量检查
+                if all([tweet_data['basic_info']['id'], tweet_data['content']['text'], tweet_data['user_info']['username']]):
+                    complete_data += 1
+                print(f"   📝 推文 {tweet_count}: @{tweet.user.username} - {len(tweet.rawContent)} 字符")
 
-        if extracted_data:
-            print(f"✅ 成功提取 {len(extracted_data)} 条推文的详细数据")
+        if sink.records:
+            print(f"✅ 成功提取 {sink.records} 条推文的详细数据")
+            print(f"📊 数据质量: {complete_data}/{sink.records} 条完整数据")
+            print(f"💾 测试数据已保存到: {', '.join(sink.files)}")
 
-            # 数据质量检查
-            complete_data = sum(1 for data in extracted_data if all([
-                data['basic_info']['id'],
-                data['content']['text'],
-                data['user_info']['username']
-            ]))
-
-            print(f"📊 数据质量: {complete_data}/{len(extracted_data)} 条完整数据")
-
-            # 保存测试数据
-            test_data_file = "test_extracted_data.json"
-            with open(test_data_file, 'w', encoding='utf-8') as f:
-                json.dump(extracted_data, f, ensure_ascii=False, indent=2)
-            print(f"💾 测试数据已保存到: {test_data_file}")
+            # 安装了pyarrow时另存一份供分析用的列式文件
+            if pa is not None:
+                parquet_file = os.path.join(test_data_dir, "extracted.parquet")
+                ndjson_to_parquet(sink.files, parquet_file)
+                print(f"💾 列式数据已保存到: {parquet_file}")
 
             return True
         else:
@@ -473,7 +507,7 @@ async def test_performance_metrics():
         tweet_count = 0
 
         try:
-            async for tweet in api.search("test", limit=5):
+            async for tweet in paced_search(api, "test", limit=5):
                 tweet_count += 1
                 if tweet_count >= 5:
                     break
@@ -528,7 +562,7 @@ async def test_data_validation():
             'data_types_correct': True
         }
 
-        async for tweet in api.search("python", limit=3):
+        async for tweet in paced_search(api, "python", limit=3):
             # 验证必需字段
             required_fields = ['id', 'rawContent', 'user', 'date']
             missing = []
@@ -554,8 +588,6 @@ async def test_data_validation():
                     validation_results['data_types_correct'] = False
                     print(f"   ⚠️  推文 {tweet.id} 数据类型异常")
 
-            await asyncio.sleep(0.5)
-
         # 汇总验证结果
         total_tweets = validation_results['valid_tweets'] + validation_results['invalid_tweets']
         if total_tweets > 0:
@@ -591,76 +623,50 @@ async def test_advanced_search():
 
         search_tests = []
 
-        # 测试1: 带时间范围的搜索
-        print("🔍 测试时间范围搜索...")
-        try:
-            # 搜索最近7天的推文
-            since_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-            query = f"python since:{since_date}"
-
-            count = 0
-            async for tweet in api.search(query, limit=3):
-                count += 1
-                print(f"   📝 时间范围推文 {count}: @{tweet.user.username}")
-                await asyncio.sleep(0.5)
-
-            search_tests.append(("时间范围搜索", count > 0))
-            print(f"   ✅ 时间范围搜索: 找到 {count} 条推文")
-        except Exception as e:
-            print(f"   ❌ 时间范围搜索失败: {e}")
-            search_tests.append(("时间范围搜索", False))
-
-        # 测试2: 语言过滤搜索
-        print("🔍 测试语言过滤搜索...")
-        try:
-            query = "python lang:en"
-            count = 0
-            async for tweet in api.search(query, limit=3):
-                count += 1
-                print(f"   📝 英文推文 {count}: @{tweet.user.username} (lang: {tweet.lang})")
-                await asyncio.sleep(0.5)
-
-            search_tests.append(("语言过滤搜索", count > 0))
-            print(f"   ✅ 语言过滤搜索: 找到 {count} 条推文")
-        except Exception as e:
-            print(f"   ❌ 语言过滤搜索失败: {e}")
-            search_tests.append(("语言过滤搜索", False))
+        # 四类高级查询并发执行，按查询分组后逐类检查
+        since_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+        queries = {
+            "时间范围搜索": f"python since:{since_date}",
+            "语言过滤搜索": "python lang:en",
+            "排除转推搜索": "python -filter:retweets",
+            "热门推文搜索": "python filter:popular",
+        }
+        print(f"🔍 并发执行 {len(queries)} 类高级搜索...")
+        results = {query: [] for query in queries.values()}
+        # 已在其他查询中出现的推文由引擎跳过，计入stats[query]['duplicates']
+        engine = SearchEngine(api, deduplicator=seen_tweets, pacing=pacing, pacing_key=TWSCRAPE_POOL)
+        async for hit in engine.search_many(queries.values(), limit=3):
+            results[hit.query].append(hit.tweet)
+
+        for name, query in queries.items():
+            error = engine.stats[query]['error']
+            if error:
+                print(f"   ❌ {name}失败: {error}")
+                search_tests.append((name, False))
+                continue
+
+            tweets = results[query]
+            duplicates = engine.stats[query]['duplicates']
+            for count, tweet in enumerate(tweets, 1):
+                if name == "语言过滤搜索":
+                    print(f"   📝 英文推文 {count}: @{tweet.user.username} (lang: {tweet.lang})")
+                elif name == "排除转推搜索":
+                    print(f"   📝 原创推文 {count}: @{tweet.user.username} (原创: {not bool(tweet.retweetedTweet)})")
+                elif name == "热门推文搜索":
+                    print(f"   📝 热门推文 {count}: @{tweet.user.username} (❤️ {tweet.likeCount}, 🔄 {tweet.retweetCount})")
+                else:
+                    print(f"   📝 时间范围推文 {count}: @{tweet.user.username}")
 
-        # 测试3: 排除转推搜索
-        print("🔍 测试排除转推搜索...")
-        try:
-            query = "python -filter:retweets"
-            count = 0
-            original_count = 0
-            async for tweet in api.search(query, limit=3):
-                count += 1
-                is_original = not bool(tweet.retweetedTweet)
-                if is_original:
-                    original_count += 1
-                print(f"   📝 原创推文 {count}: @{tweet.user.username} (原创: {is_original})")
-                await asyncio.sleep(0.5)
-
-            search_tests.append(("排除转推搜索", count > 0))
-            print(f"   ✅ 排除转推搜索: 找到 {count} 条推文，{original_count} 条原创")
-        except Exception as e:
-            print(f"   ❌ 排除转推搜索失败: {e}")
-            search_tests.append(("排除转推搜索", False))
+            search_tests.append((name, len(tweets) + duplicates > 0))
+            if name == "排除转推搜索":
+                original_count = sum(1 for tweet in tweets if not tweet.retweetedTweet)
+                print(f"   ✅ {name}: 找到 {len(tweets) + duplicates} 条推文（{duplicates} 条已在其他查询中处理），"
+                      f"{original_count} 条新原创")
+            else:
+                print(f"   ✅ {name}: 找到 {len(tweets) + duplicates} 条推文（{duplicates} 条已在其他查询中处理）")
 
-        # 测试4: 热门推文搜索
-        print("🔍 测试热门推文搜索...")
-        try:
-            query = "python filter:popular"
-            count = 0
-            async for tweet in api.search(query, limit=2):
-                count += 1
-                print(f"   📝 热门推文 {count}: @{tweet.user.username} (❤️ {tweet.likeCount}, 🔄 {tweet.retweetCount})")
-                await asyncio.sleep(0.5)
-
-            search_tests.append(("热门推文搜索", count > 0))
-            print(f"   ✅ 热门推文搜索: 找到 {count} 条推文")
-        except Exception as e:
-            print(f"   ❌ 热门推文搜索失败: {e}")
-            search_tests.append(("热门推文搜索", False))
+        duplicates = sum(stats['duplicates'] for stats in engine.stats.values())
+        print(f"♻️  跨查询去重: 跳过 {duplicates} 条重复推文")
 
         # 汇总高级搜索测试结果
         passed_search_tests = sum(1 for _, result in search_tests if result)
@@ -678,6 +684,7 @@ async def test_user_timeline():
 
     try:
         from twscrape import API
+        from twscrape.models import parse_tweets, parse_user
         api = API()
 
         # 检查是否有可用账号
@@ -696,7 +703,7 @@ async def test_user_timeline():
             print(f"🔍 获取 @{username} 的时间线...")
             try:
                 # 首先获取用户信息
-                user = await api.user_by_login(username)
+                user = await paced_request(api, lambda: api.user_by_login_raw(username), 'UserByScreenName', parse_user)
                 if not user:
                     print(f"   ❌ 用户 @{username} 不存在")
                     timeline_tests.append((f"{username}_timeline", False))
@@ -704,10 +711,10 @@ async def test_user_timeline():
 
                 # 获取用户推文
                 tweet_count = 0
-                async for tweet in api.user_tweets(user.id, limit=3):
+                pages = api.user_tweets_raw(user.id, limit=3)
+                async for tweet in paced_pages(api, pages, 'UserTweets', parse_tweets, 3):
                     tweet_count += 1
                     print(f"   📝 推文 {tweet_count}: {tweet.rawContent[:50]}...")
-                    await asyncio.sleep(0.5)
 
                 timeline_tests.append((f"{username}_timeline", tweet_count > 0))
                 print(f"   ✅ @{username} 时间线: 获取到 {tweet_count} 条推文")
@@ -732,6 +739,7 @@ async def test_tweet_details():
 
     try:
         from twscrape import API
+        from twscrape.models import parse_tweet
         api = API()
 
         # 检查是否有可用账号
@@ -746,9 +754,8 @@ async def test_tweet_details():
 
         # 先搜索一些推文获取ID
         tweet_ids = []
-        async for tweet in api.search("python", limit=2):
+        async for tweet in paced_search(api, "python", limit=2):
             tweet_ids.append(tweet.id)
-            await asyncio.sleep(0.5)
 
         if not tweet_ids:
             print("⚠️  未找到推文ID，跳过详情测试")
@@ -760,9 +767,10 @@ async def test_tweet_details():
             print(f"🔍 获取推文 {tweet_id} 的详情...")
             try:
                 # 检查是否有推文详情方法
-                if hasattr(api, 'tweet_details'):
+                if hasattr(api, 'tweet_details_raw'):
                     # 获取推文详情
-                    tweet = await api.tweet_details(tweet_id)
+                    tweet = await paced_request(api, lambda: api.tweet_details_raw(tweet_id), 'TweetDetail',
+                                                lambda rep: parse_tweet(rep, tweet_id))
                     if tweet:
                         print(f"   ✅ 推文详情: @{tweet.user.username}")
                         print(f"   📊 互动数据: ❤️ {tweet.likeCount}, 🔄 {tweet.retweetCount}, 💬 {tweet.replyCount}")
@@ -779,8 +787,6 @@ async def test_tweet_details():
                     print(f"   ⚠️  tweet_details 方法不存在，跳过推文详情测试")
                     detail_tests.append((f"tweet_{tweet_id}_details", True))  # 不算失败
 
-                await asyncio.sleep(1)
-
             except Exception as e:
                 print(f"   ❌ 推文 {tweet_id} 详情获取失败: {e}")
                 detail_tests.append((f"tweet_{tweet_id}_details", False))
@@ -801,6 +807,7 @@ async def test_followers_following():
 
     try:
         from twscrape import API
+        from twscrape.models import parse_user, parse_users
         api = API()
 
         # 检查是否有可用账号
@@ -818,7 +825,8 @@ async def test_followers_following():
 
         try:
             # 获取用户信息
-            user = await api.user_by_login(test_username)
+            user = await paced_request(api, lambda: api.user_by_login_raw(test_username), 'UserByScreenName',
+                                       parse_user)
             if not user:
                 print(f"   ❌ 用户 @{test_username} 不存在")
                 return False
@@ -832,13 +840,13 @@ async def test_followers_following():
 
             # 测试获取关注者 (使用正确的方法名: followers)
             try:
-                if hasattr(api, 'followers'):
+                if hasattr(api, 'followers_raw'):
                     print("🔍 获取关注者列表...")
                     follower_count = 0
-                    async for follower in api.followers(user.id, limit=3):
+                    pages = api.followers_raw(user.id, limit=3)
+                    async for follower in paced_pages(api, pages, 'Followers', parse_users, 3):
                         follower_count += 1
                         print(f"   👤 关注者 {follower_count}: @{follower.username} ({follower.followersCount:,} 粉丝)")
-                        await asyncio.sleep(1)
 
                     follow_tests.append(("followers", follower_count > 0))
                     print(f"   ✅ 关注者测试: 获取到 {follower_count} 个关注者")
@@ -851,13 +859,13 @@ async def test_followers_following():
 
             # 测试获取关注列表 (使用正确的方法名: following)
             try:
-                if hasattr(api, 'following'):
+                if hasattr(api, 'following_raw'):
                     print("🔍 获取关注列表...")
                     following_count = 0
-                    async for following_user in api.following(user.id, limit=3):
+                    pages = api.following_raw(user.id, limit=3)
+                    async for following_user in paced_pages(api, pages, 'Following', parse_users, 3):
                         following_count += 1
                         print(f"   👤 关注 {following_count}: @{following_user.username} ({following_user.followersCount:,} 粉丝)")
-                        await asyncio.sleep(1)
 
                     follow_tests.append(("following", following_count > 0))
                     print(f"   ✅ 关注列表测试: 获取到 {following_count} 个关注")
@@ -904,19 +912,24 @@ async def test_hashtag_trends():
         print("🔍 测试话题标签搜索...")
         try:
             popular_hashtags = ["#python", "#AI", "#tech"]
+            print(f"🔍 并发搜索话题: {', '.join(popular_hashtags)}")
 
-            for hashtag in popular_hashtags:
-                print(f"🔍 搜索话题: {hashtag}")
-                count = 0
-                async for tweet in api.search(hashtag, limit=2):
-                    count += 1
-                    # 检查推文是否包含该话题标签
-                    has_hashtag = hashtag.lower() in tweet.rawContent.lower()
-                    print(f"   📝 推文 {count}: @{tweet.user.username} (包含标签: {has_hashtag})")
-                    await asyncio.sleep(0.5)
+            counts = {hashtag: 0 for hashtag in popular_hashtags}
+            engine = SearchEngine(api, deduplicator=seen_tweets, pacing=pacing, pacing_key=TWSCRAPE_POOL)
+            async for hit in engine.search_many(popular_hashtags, limit=2):
+                counts[hit.query] += 1
+                # 检查推文是否包含该话题标签
+                has_hashtag = hit.query.lower() in hit.tweet.rawContent.lower()
+                print(f"   📝 {hit.query} 推文 {counts[hit.query]}: @{hit.tweet.user.username} (包含标签: {has_hashtag})")
 
-                hashtag_tests.append((f"hashtag_{hashtag[1:]}", count > 0))
-                print(f"   ✅ {hashtag} 搜索: 找到 {count} 条推文")
+            for hashtag in popular_hashtags:
+                error = engine.stats[hashtag]['error']
+                duplicates = engine.stats[hashtag]['duplicates']
+                hashtag_tests.append((f"hashtag_{hashtag[1:]}", counts[hashtag] + duplicates > 0 and not error))
+                if error:
+                    print(f"   ❌ {hashtag} 搜索失败: {error}")
+                else:
+                    print(f"   ✅ {hashtag} 搜索: 找到 {counts[hashtag] + duplicates} 条推文（{duplicates} 条已处理过）")
 
         except Exception as e:
             print(f"   ❌ 话题标签搜索失败: {e}")
@@ -931,7 +944,7 @@ async def test_hashtag_trends():
                 'unique_hashtags': set()
             }
 
-            async for tweet in api.search("python", limit=5):
+            async for tweet in paced_search(api, "python", limit=5):
                 # 简单的话题标签提取
                 import re
                 hashtags = re.findall(r'#\w+', tweet.rawContent)
@@ -942,8 +955,6 @@ async def test_hashtag_trends():
                     hashtag_analysis['unique_hashtags'].update(hashtags)
                     print(f"   📝 推文话题标签: {hashtags}")
 
-                await asyncio.sleep(0.5)
-
             print(f"   📊 话题标签分析:")
             print(f"      包含标签的推文: {hashtag_analysis['tweets_with_hashtags']}")
             print(f"      总标签数: {hashtag_analysis['total_hashtags']}")
@@ -998,7 +1009,7 @@ async def test_media_content():
             print(f"🔍 搜索查询: {query}")
             try:
                 count = 0
-                async for tweet in api.search(query, limit=3):
+                async for tweet in paced_search(api, query, limit=3):
                     count += 1
                     media_stats['tweets_checked'] += 1
 
@@ -1036,8 +1047,6 @@ async def test_media_content():
                     else:
                         print(f"   📝 推文 {count}: @{tweet.user.username} - 无媒体")
 
-                    await asyncio.sleep(0.5)
-
                 media_tests.append((f"media_search_{query.split()[0]}", count > 0))
 
             except Exception as e:
@@ -1087,7 +1096,7 @@ async def test_conversation_threads():
         }
 
         # 搜索可能有回复的推文
-        async for tweet in api.search("python", limit=5):
+        async for tweet in paced_search(api, "python", limit=5):
             conversation_stats['tweets_checked'] = conversation_stats.get('tweets_checked', 0) + 1
 
             # 检查是否有回复
@@ -1106,8 +1115,6 @@ async def test_conversation_threads():
                 except Exception as e:
                     print(f"      ⚠️  无法获取对话详情: {e}")
 
-            await asyncio.sleep(0.5)
-
         print(f"📊 对话线程统计:")
         print(f"   检查推文数: {conversation_stats.get('tweets_checked', 0)}")
         print(f"   有回复推文: {conversation_stats['tweets_with_replies']}")
@@ -1430,11 +1437,17 @@ def cleanup_test_files():
             except Exception as e:
                 print(f"⚠️  无法删除文件 {filename}: {e}")
 
+    for dirname in ["test_extracted_data"]:
+        if os.path.isdir(dirname):
+            shutil.rmtree(dirname, ignore_errors=True)
+            cleaned_files.append(dirname)
+
     if cleaned_files:
         print(f"🧹 已清理测试文件: {', '.join(cleaned_files)}")
 
 async def main():
     """增强版主测试函数"""
+    global seen_tweets
     start_time = datetime.now()
 
     print("🚀 开始 twscrape 增强版可行性验证")
@@ -1470,14 +1483,17 @@ async def main():
     print("\n🔍 第五阶段: 数据质量测试")
     test_results["数据验证功能"] = await test_data_validation()
 
-    print("\n🚀 第六阶段: 高级功能测试")
-    test_results["高级搜索功能"] = await test_advanced_search()
-    test_results["用户时间线"] = await test_user_timeline()
-    test_results["推文详情"] = await test_tweet_details()
-
-    print("\n👥 第七阶段: 社交功能测试")
-    test_results["关注者和关注列表"] = await test_followers_following()
-    test_results["话题标签和趋势"] = await test_hashtag_trends()
+    # 第六、七阶段的重叠查询共用一个内存去重器
+    with TweetDeduplicator(capacity=1_000_000) as seen_tweets:
+        print("\n🚀 第六阶段: 高级功能测试")
+        test_results["高级搜索功能"] = await test_advanced_search()
+        test_results["用户时间线"] = await test_user_timeline()
+        test_results["推文详情"] = await test_tweet_details()
+
+        print("\n👥 第七阶段: 社交功能测试")
+        test_results["关注者和关注列表"] = await test_followers_following()
+        test_results["话题标签和趋势"] = await test_hashtag_trends()
+    seen_tweets = None
 
     print("\n🎬 第八阶段: 媒体和内容测试")
     test_results["媒体内容"] = await test_media_content()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+推文列式导出（Parquet）
+test_data_extraction产出的嵌套tweet_data（basic_info/content/user_info/engagement/metadata）
+展平成带类型的列，按行组增量写入Parquet：内存中最多保留一个行组，username和lang使用字典编码。
+分析时只读取需要的列，扫描数千万条推文时I/O和解码量与列数成正比，而不是与整条JSON成正比。
+
+用法:
+    with ParquetTweetWriter("tweets.parquet") as writer:
+        for tweet_data in records:
+            writer.write(tweet_data)
+    table = read_tweets("tweets.parquet", columns=["lang", "likes"])
+    for batch in scan_tweets("tweets/", columns=["username", "likes"], filter=pc.field("lang") == "en"):
+        ...
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Parquet读写使用pyarrow（可选依赖）
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = ds = pq = None
+
+from tweet_sink import read_ndjson
+
+# (列名, tweet_data中的分组, 字段, 类型)；类型名见_arrow_type
+TWEET_COLUMNS: Tuple[Tuple[str, str, str, str], ...] = (
+    ('id', 'basic_info', 'id', 'int64'),
+    ('url', 'basic_info', 'url', 'string'),
+    ('created_at', 'basic_info', 'created_at', 'timestamp'),
+    ('lang', 'basic_info', 'lang', 'dictionary'),
+    ('text', 'content', 'text', 'string'),
+    ('text_length', 'content', 'text_length', 'int32'),
+    ('has_media', 'content', 'has_media', 'bool'),
+    ('media_count', 'content', 'media_count', 'int16'),
+    ('username', 'user_info', 'username', 'dictionary'),
+    ('display_name', 'user_info', 'display_name', 'string'),
+    ('verified', 'user_info', 'verified', 'bool'),
+    ('followers_count', 'user_info', 'followers_count', 'int64'),
+    ('retweets', 'engagement', 'retweets', 'int64'),
+    ('likes', 'engagement', 'likes', 'int64'),
+    ('replies', 'engagement', 'replies', 'int64'),
+    ('quotes', 'engagement', 'quotes', 'int64'),
+    ('is_retweet', 'metadata', 'is_retweet', 'bool'),
+    ('is_reply', 'metadata', 'is_reply', 'bool'),
+    ('has_hashtags', 'metadata', 'has_hashtags', 'bool'),
+    ('has_mentions', 'metadata', 'has_mentions', 'bool'),
+)
+DICTIONARY_COLUMNS = [name for name, _, _, kind in TWEET_COLUMNS if kind == 'dictionary']
+
+def _arrow_type(kind: str):
+    if kind == 'dictionary':
+        return pa.dictionary(pa.int32(), pa.string())
+    if kind == 'timestamp':
+        return pa.timestamp('us', tz='UTC')
+    return pa.type_for_alias(kind)
+
+def tweet_schema():
+    """展平后的Arrow schema（需要pyarrow）"""
+    return pa.schema([(name, _arrow_type(kind)) for name, _, _, kind in TWEET_COLUMNS])
+
+def flatten_tweet_data(record: Dict) -> Dict:
+    """嵌套tweet_data展平为列名到值的映射，缺失的分组或字段为None"""
+    return {name: (record.get(section) or {}).get(field) for name, section, field, _ in TWEET_COLUMNS}
+
+def _timestamp_array(values: List, type_) -> 'pa.Array':
+    """ISO字符串（或datetime）交给Arrow批量转换，比逐条datetime.fromisoformat快
+
+    带时区的目标类型要求字符串带偏移，没有偏移的先补上+00:00。
+    """
+    array = pa.array(values)
+    if pa.types.is_string(array.type):
+        naive = pc.invert(pc.match_substring_regex(array, r'(Z|[+-]\d{2}:?\d{2})$'))
+        array = pc.if_else(naive, pc.binary_join_element_wise(array, '+00:00', ''), array)
+    return array.cast(type_)
+
+class ParquetTweetWriter:
+    """按行组增量写入展平后的推文（需要pyarrow）
+
+    write()把字段追加到各列的缓冲区，攒满row_group_size行写出一个行组；
+    created_at接受ISO 8601字符串或datetime，存为UTC时间戳；twscrape的日期带时区偏移，
+    没有偏移的按UTC处理。close()写出剩余行并写入文件尾。
+    """
+
+    def __init__(self, path: str, row_group_size: int = 100_000, compression: str = 'zstd'):
+        if pa is None:
+            raise ImportError("ParquetTweetWriter requires pyarrow: pip install pyarrow")
+
+        self.path = path
+        self.row_group_size = row_group_size
+        self.schema = tweet_schema()
+        self.logger = logging.getLogger(__name__)
+        self.rows = 0
+        self.row_groups = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression,
+                                        use_dictionary=DICTIONARY_COLUMNS)
+        self._columns: List[List] = [[] for _ in TWEET_COLUMNS]
+        self._fields = [(section, field) for _, section, field, _ in TWEET_COLUMNS]
+
+    def __enter__(self) -> 'ParquetTweetWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record: Dict):
+        for values, (section, field) in zip(self._columns, self._fields):
+            values.append((record.get(section) or {}).get(field))
+        if len(self._columns[0]) >= self.row_group_size:
+            self._write_row_group()
+
+    def write_many(self, records: Iterable[Dict]):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self._writer is None:
+            return
+        if self._columns[0]:
+            self._write_row_group()
+        self._writer.close()
+        self._writer = None
+
+    def _write_row_group(self):
+        arrays = []
+        for values, (_, _, _, kind), field in zip(self._columns, TWEET_COLUMNS, self.schema):
+            if kind == 'timestamp':
+                arrays.append(_timestamp_array(values, field.type))
+            elif kind == 'dictionary':
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, field.type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+        self._writer.write_table(table, row_group_size=len(table))
+        self.rows += len(table)
+        self.row_groups += 1
+        self._columns = [[] for _ in TWEET_COLUMNS]
+
+def ndjson_to_parquet(paths: Iterable[str], path: str, row_group_size: int = 100_000) -> int:
+    """把NDJSONSink写出的文件转换为一个Parquet文件，返回行数"""
+    with ParquetTweetWriter(path, row_group_size) as writer:
+        for source in paths:
+            writer.write_many(read_ndjson(source))
+    return writer.rows
+
+def read_tweets(path: str, columns: Optional[List[str]] = None, filters=None):
+    """读取为Arrow Table，只解码columns中的列；path可以是文件或目录，filters用于跳过行组"""
+    if pa is None:
+        raise ImportError("read_tweets requires pyarrow: pip install pyarrow")
+    return pq.read_table(path, columns=columns, filters=filters)
+
+def scan_tweets(path: str, columns: Optional[List[str]] = None, filter=None,
+                batch_size: int = 131_072) -> Iterator:
+    """按RecordBatch流式扫描文件或目录，内存占用与批大小成正比；filter为pyarrow.compute表达式"""
+    if pa is None:
+        raise ImportError("scan_tweets requires pyarrow: pip install pyarrow")
+    dataset = ds.dataset(path, format='parquet')
+    yield from dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size)
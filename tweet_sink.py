@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+流式NDJSON落盘
+每条记录序列化为一行紧凑JSON追加写入，可选gzip压缩；按大小或时间轮转文件，
+攒够一批才写入并刷新，fsync按时间间隔批量执行。内存中最多保留一批记录，
+与经过的推文总数无关；进程崩溃最多丢失最后一批，已刷新的数据都可读回。
+
+用法:
+    with NDJSONSink("data/tweets", compress=True) as sink:
+        async for tweet in api.search("python"):
+            sink.write(tweet_data)
+    for record in read_ndjson(sink.files[0]):
+        ...
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+class NDJSONSink:
+    """按行追加的JSON记录文件，支持gzip、轮转和批量刷新
+
+    文件名为 {prefix}-{创建时间}-{序号}.ndjson[.gz]，写满max_bytes（压缩后大小，按批检查）
+    或打开超过max_seconds秒后，在下一批写入时轮转。gzip文件每次刷新做一次同步刷新（Z_SYNC_FLUSH），
+    崩溃后截断的文件仍能读出已刷新的记录。
+    """
+
+    def __init__(self, directory: str, prefix: str = 'tweets', compress: bool = False,
+                 max_bytes: int = 256 * 1024 * 1024, max_seconds: Optional[float] = 3600.0,
+                 batch_size: int = 1000, fsync_interval: Optional[float] = 1.0, compresslevel: int = 6,
+                 clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.prefix = prefix
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.compresslevel = compresslevel
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+        os.makedirs(directory, exist_ok=True)
+        self.files: List[str] = []
+        self.records = 0
+        self.bytes_written = 0
+        self._batch: List[str] = []
+        self._raw = None
+        self._stream = None
+        self._opened_at = 0.0
+        self._synced_at = 0.0
+        self._sequence = 0
+
+    def __enter__(self) -> 'NDJSONSink':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def current_path(self) -> Optional[str]:
+        return self.files[-1] if self._raw is not None else None
+
+    def write(self, record: Dict):
+        self._batch.append(self._encoder.encode(record))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """写出当前批次并刷新到操作系统；距上次fsync超过fsync_interval时同时fsync"""
+        if self._batch:
+            now = self.clock()
+            if self._raw is None or self._should_rotate(now):
+                self._rotate(now)
+            data = ('\n'.join(self._batch) + '\n').encode()
+            self._stream.write(data)
+            self.records += len(self._batch)
+            self.bytes_written += len(data)
+            self._batch.clear()
+        if self._raw is None:
+            return
+
+        self._stream.flush()
+        if self._stream is not self._raw:
+            self._raw.flush()
+        if self.fsync_interval is not None and self.clock() - self._synced_at >= self.fsync_interval:
+            self._fsync()
+
+    def close(self):
+        """写出剩余记录并关闭当前文件（gzip写入结尾），关闭时总是fsync"""
+        self.flush()
+        self._close_file()
+
+    def _should_rotate(self, now: float) -> bool:
+        if self.max_seconds is not None and now - self._opened_at >= self.max_seconds:
+            return True
+        return self._raw.tell() >= self.max_bytes
+
+    def _rotate(self, now: float):
+        self._close_file()
+        self._sequence += 1
+        stamp = datetime.fromtimestamp(now).strftime('%Y%m%d-%H%M%S')
+        suffix = '.ndjson.gz' if self.compress else '.ndjson'
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self._sequence:04d}{suffix}")
+        self._raw = open(path, 'ab')
+        self._stream = (gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=self.compresslevel)
+                        if self.compress else self._raw)
+        self._opened_at = now
+        self._synced_at = now
+        self.files.append(path)
+        self.logger.debug(f"Opened {path}")
+
+    def _fsync(self):
+        os.fsync(self._raw.fileno())
+        self._synced_at = self.clock()
+
+    def _close_file(self):
+        if self._raw is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        self._fsync()
+        self._raw.close()
+        self._raw = self._stream = None
+
+def read_ndjson(path: str) -> Iterator[Dict]:
+    """逐行读回记录；容忍崩溃留下的截断结尾（不完整的最后一行或gzip尾部缺失）"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        pending = b''
+        while True:
+            try:
+                chunk = f.read(1 << 20)
+            except EOFError:
+                break
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+        if pending:
+            try:
+                yield json.loads(pending)
+            except ValueError:
+                pass